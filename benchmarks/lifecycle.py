@@ -0,0 +1,287 @@
+"""
+Measures how long it takes to start and stop services and Mountebank, to create imposters
+and to get the requests made on them. Reports percentiles of the times and the memory
+allocated by each benchmark, and can compare the results with a baseline saved in an earlier run,
+so regressions show up after upgrading mountepy or its dependencies.
+
+It runs offline. The services are `tests/example_service.py` processes, and Mountebank is
+either a local installation (the `mb` command or an already downloaded standalone distribution)
+or `mountepy.InProcessMountebank`.
+
+Usage: python benchmarks/lifecycle.py [--repeats N] [--engine {auto,local,inprocess}]
+                                      [--log-size N] [--save-baseline PATH]
+                                      [--baseline PATH] [--tolerance RATIO]
+"""
+
+import argparse
+import collections
+import gc
+import glob
+import json
+import os
+import resource
+import shlex
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+
+import requests
+
+from mountepy import HttpService, Mountebank, ServiceGroup
+from mountepy.inprocess import InProcessMountebank
+from mountepy.mb_mgmt import CACHE_DIR
+
+EXAMPLE_SERVICE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests', 'example_service.py')
+# the output of the services is discarded, so that it doesn't get mixed with the results
+SERVICE_COMMAND = ['sh', '-c', 'exec {} {} {{port}} > /dev/null 2>&1'.format(
+    shlex.quote(sys.executable), shlex.quote(EXAMPLE_SERVICE_PATH))]
+GROUP_SIZES = (1, 4, 8)
+PERCENTILES = (50, 90, 99)
+# how long the request sender waits, so that `wait_for_requests` is already waiting
+SEND_DELAY = 0.01
+
+Result = collections.namedtuple('Result', 'name, durations, peak_memory')
+
+
+def percentile(values, percent):
+    """
+    Returns:
+        float: The value below which the given percent of the values is (the nearest rank).
+    """
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(result):
+    """
+    Returns:
+        dict: Percentiles and the maximum of the result's durations (in seconds)
+            and its peak memory (in bytes).
+    """
+    summary = {'p{}'.format(percent): percentile(result.durations, percent)
+               for percent in PERCENTILES}
+    summary['max'] = max(result.durations)
+    summary['peak_memory'] = result.peak_memory
+    return summary
+
+
+def run_benchmark(measure_once, repeats):
+    """Runs a benchmark the given number of times, and one more time while tracing the memory
+    allocations, because tracing slows everything down.
+
+    Args:
+        measure_once (callable): Makes one measurement, returns a dict of durations
+            (in seconds) by their names.
+        repeats (int): Number of measurements.
+
+    Returns:
+        list[`Result`]: One for each name of the durations.
+    """
+    durations = collections.defaultdict(list)
+    for _ in range(repeats):
+        gc.collect()
+        for name, duration in measure_once().items():
+            durations[name].append(duration)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        measure_once()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return [Result(name, name_durations, peak_memory)
+            for name, name_durations in durations.items()]
+
+
+def _timed(function, *args):
+    start_time = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start_time
+
+
+def measure_http_service():
+    """Starts and stops a single service."""
+    service = HttpService(SERVICE_COMMAND)
+    return {'http_service.start': _timed(service.start),
+            'http_service.stop': _timed(service.stop)}
+
+
+def make_group_measurement(size):
+    """
+    Returns:
+        callable: Measurement of starting and stopping a group of the given number of services.
+    """
+    def measure_service_group():
+        group = ServiceGroup(*[HttpService(SERVICE_COMMAND) for _ in range(size)])
+        return {'service_group_{}.start'.format(size): _timed(group.start),
+                'service_group_{}.stop'.format(size): _timed(group.stop)}
+    return measure_service_group
+
+
+def make_mountebank_measurement(mountebank_class):
+    """
+    Returns:
+        callable: Measurement of creating, starting and stopping Mountebank.
+    """
+    def measure_mountebank():
+        start_time = time.perf_counter()
+        mountebank = mountebank_class()
+        mountebank.start()
+        boot_duration = time.perf_counter() - start_time
+        return {'mountebank.boot': boot_duration,
+                'mountebank.stop': _timed(mountebank.stop)}
+    return measure_mountebank
+
+
+def make_imposter_measurements(mountebank, log_size):
+    """
+    Args:
+        mountebank (`mountepy.mountebank.MountebankWrapper`): A running Mountebank.
+        log_size (int): Number of requests in the imposter's log for getting the requests.
+
+    Returns:
+        list[callable]: Measurements of creating an imposter, getting a large request log
+            and the time from sending a request to `wait_for_requests` returning it.
+    """
+    def measure_add_imposter():
+        duration = _timed(mountebank.add_imposter_simple)
+        mountebank.reset()
+        return {'mountebank.add_imposter': duration}
+
+    logged_imposter = mountebank.add_imposter_simple(method='POST', path='/log')
+    with requests.Session() as session:
+        for _ in range(log_size):
+            session.post('http://localhost:{}/log'.format(logged_imposter.port), data='x' * 100)
+
+    def measure_requests():
+        # a new object, so nothing is cached
+        imposter = mountebank.get_imposter(logged_imposter.port)
+        return {'imposter.requests_{}'.format(log_size): _timed(imposter.requests)}
+
+    waited_imposter = mountebank.add_imposter_simple(method='POST', path='/wait')
+
+    def measure_wait_for_requests():
+        waited_imposter.clear_requests()
+        send_times = []
+
+        def send_request():
+            time.sleep(SEND_DELAY)
+            send_times.append(time.perf_counter())
+            requests.post('http://localhost:{}/wait'.format(waited_imposter.port), timeout=5)
+
+        sender = threading.Thread(target=send_request)
+        sender.start()
+        waited_imposter.wait_for_requests()
+        latency = time.perf_counter() - send_times[0]
+        sender.join()
+        return {'imposter.wait_for_requests': latency}
+
+    return [measure_requests, measure_wait_for_requests, measure_add_imposter]
+
+
+def local_mountebank_available():
+    """
+    Returns:
+        bool: If Mountebank is installed or its standalone distribution is already downloaded,
+            so it can be started without internet access.
+    """
+    return bool(shutil.which('mb') or glob.glob(os.path.join(CACHE_DIR, 'mountebank-v*')))
+
+
+def compare(summaries, baseline, tolerance):
+    """
+    Args:
+        summaries (dict[str, dict]): Summaries of the results by benchmark names.
+        baseline (dict[str, dict]): Summaries from an earlier run.
+        tolerance (float): How many times slower than the baseline a median can be.
+
+    Returns:
+        list[str]: Names of the benchmarks whose medians regressed.
+    """
+    regressions = []
+    for name, summary in sorted(summaries.items()):
+        if name not in baseline:
+            print('{:>34}: not in the baseline'.format(name))
+            continue
+        ratio = summary['p50'] / baseline[name]['p50'] if baseline[name]['p50'] else 1.0
+        memory_ratio = (summary['peak_memory'] / baseline[name]['peak_memory']
+                        if baseline[name]['peak_memory'] else 1.0)
+        regressed = ratio > tolerance
+        if regressed:
+            regressions.append(name)
+        print('{:>34}: p50 {:5.2f}x, memory {:5.2f}x{}'.format(
+            name, ratio, memory_ratio, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().partition('\n\n')[0])
+    parser.add_argument('--repeats', type=int, default=20,
+                        help='Number of measurements of each benchmark.')
+    parser.add_argument('--engine', choices=('auto', 'local', 'inprocess'), default='auto',
+                        help='Mountebank to measure. "auto" takes the local one, if it exists.')
+    parser.add_argument('--log-size', type=int, default=2000,
+                        help='Number of requests in the log for getting the requests.')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='Save the results as a baseline for later runs.')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='Compare the results with a saved baseline.')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='How many times slower than the baseline a median can be.')
+    return parser.parse_args()
+
+
+def main():
+    """Runs the benchmarks, prints the results and compares them with the baseline.
+    Exits with status 1 if there are regressions.
+    """
+    args = _parse_args()
+    engine = args.engine
+    if engine == 'auto':
+        engine = 'local' if local_mountebank_available() else 'inprocess'
+    mountebank_class = Mountebank if engine == 'local' else InProcessMountebank
+    print('{} repeats, {} Mountebank'.format(args.repeats, engine))
+
+    measurements = [measure_http_service]
+    measurements.extend(make_group_measurement(size) for size in GROUP_SIZES)
+    measurements.append(make_mountebank_measurement(mountebank_class))
+    results = []
+    for measure_once in measurements:
+        results.extend(run_benchmark(measure_once, args.repeats))
+    with mountebank_class() as mountebank:
+        for measure_once in make_imposter_measurements(mountebank, args.log_size):
+            results.extend(run_benchmark(measure_once, args.repeats))
+
+    summaries = {}
+    print('{:>34}  {:>8} {:>8} {:>8} {:>8} {:>9}'.format(
+        'ms', 'p50', 'p90', 'p99', 'max', 'peak MB'))
+    for result in results:
+        summary = summarize(result)
+        summaries[result.name] = summary
+        print('{:>34}: {:8.2f} {:8.2f} {:8.2f} {:8.2f} {:9.2f}'.format(
+            result.name, *([summary[key] * 1000 for key in ('p50', 'p90', 'p99', 'max')]
+                           + [summary['peak_memory'] / 2**20])))
+    print('max RSS: {:.1f} MB of the benchmark, {:.1f} MB of the services and Mountebank'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2**10))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump({'engine': engine, 'benchmarks': summaries}, baseline_file,
+                      indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['engine'] != engine:
+            print('The baseline was made with {} Mountebank.'.format(baseline['engine']))
+        if compare(summaries, baseline['benchmarks'], args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
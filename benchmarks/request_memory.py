@@ -0,0 +1,105 @@
+"""
+Compares the memory taken by recorded imposter requests held as eagerly decoded named tuples
+and as lazily decoded `mountepy.mountebank.ImposterRequest` objects,
+and the memory needed to go through them as a stream.
+
+Usage: python benchmarks/request_memory.py [number of requests]
+"""
+
+import collections
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from mountepy.request_json import (ImposterRequest, iter_requests_json, make_imposter_request,
+                                   split_requests_json)
+
+EagerImposterRequest = collections.namedtuple(
+    'EagerImposterRequest', 'body, headers, method, path, query, request_from, timestamp')
+
+
+def make_imposter_json(request_count):
+    """
+    Returns:
+        str: JSON of an imposter with the given number of recorded requests.
+    """
+    request = {
+        'requestFrom': '127.0.0.1:53124',
+        'method': 'POST',
+        'path': '/some/resource/path',
+        'query': {'page': '1', 'size': '50'},
+        'headers': {
+            'Host': 'localhost:8080',
+            'User-Agent': 'python-requests/2.9.1',
+            'Accept-Encoding': 'gzip, deflate',
+            'Accept': '*/*',
+            'Connection': 'keep-alive',
+            'Content-Type': 'application/json',
+            'Content-Length': '180',
+        },
+        'body': json.dumps({'id': 12345, 'name': 'some name', 'tags': ['a', 'b', 'c'],
+                            'description': 'x' * 100}),
+        'timestamp': '2016-01-02T10:20:30.456Z',
+    }
+    return json.dumps({'protocol': 'http', 'port': 8080, 'numberOfRequests': request_count,
+                       'requests': [request] * request_count}, indent=2)
+
+
+def parse_eagerly(imposter_json):
+    """The way requests were held before: all fields decoded."""
+    return [EagerImposterRequest(*make_imposter_request(request_json))
+            for request_json in json.loads(imposter_json)['requests']]
+
+
+def parse_lazily(imposter_json):
+    """Requests held as their JSON, decoded on first access."""
+    return [ImposterRequest.from_json(raw_json)
+            for raw_json in split_requests_json(imposter_json)]
+
+
+def iterate_streaming(imposter_content):
+    """Requests read one by one from a stream of the response, none of them are kept."""
+    chunks = (imposter_content[index:index + 65536]
+              for index in range(0, len(imposter_content), 65536))
+    return sum(1 for _ in iter_requests_json(chunks, method='POST'))
+
+
+def measure(parse, data):
+    """
+    Returns:
+        tuple[float, int, int]: Parsing time (in seconds), memory held by the parsed
+            requests and peak memory during parsing (both in bytes).
+    """
+    gc.collect()
+    start_time = time.perf_counter()
+    parse(data)
+    duration = time.perf_counter() - start_time
+
+    # measured separately, because tracing slows the parsing down
+    gc.collect()
+    tracemalloc.start()
+    parsed_requests = parse(data)
+    held_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed_requests
+    return duration, held_memory, peak_memory
+
+
+def main():
+    """Prints the measurements."""
+    request_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    imposter_json = make_imposter_json(request_count)
+    print('{} requests, {:.1f} MB of JSON'.format(request_count, len(imposter_json) / 2**20))
+    imposter_content = imposter_json.encode()
+    for name, parse, data in (('eager named tuples', parse_eagerly, imposter_json),
+                              ('lazy', parse_lazily, imposter_json),
+                              ('streaming', iterate_streaming, imposter_content)):
+        duration, held_memory, peak_memory = measure(parse, data)
+        print('{:>20}: {:6.2f} s, {:7.1f} MB held, {:7.1f} MB peak'.format(
+            name, duration, held_memory / 2**20, peak_memory / 2**20))
+
+
+if __name__ == '__main__':
+    main()
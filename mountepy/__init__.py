@@ -2,5 +2,7 @@
 Spawning and cleaning after given HTTP service processes and Mountebank.
 """
 
-from mountepy.http_service import HttpService, ServiceGroup, wait_for_port
+from mountepy.http_service import (HttpService, ServiceExitedError, ServiceGroup, wait_for_port,
+                                   wait_for_ports)
 from mountepy.mountebank import Mountebank, ExistingMountebank, HttpStub
+from mountepy.service_pool import ServicePool
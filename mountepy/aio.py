@@ -0,0 +1,728 @@
+"""
+Asyncio counterparts of the service and Mountebank abstractions.
+Many services and imposters can be started and awaited together on one event loop,
+without a thread per service.
+
+This module requires Python 3.5 or newer, unlike the rest of mountepy, so it isn't imported
+by the `mountepy` package.
+"""
+
+import asyncio
+import atexit
+import collections
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+import urllib.parse
+
+import port_for
+import requests
+
+from .http_client import DEFAULT_POOL_SIZE, ConnectionStats
+from . import instrumentation
+from .http_service import HttpService, ServiceGroup, ServiceTiming
+from .mb_mgmt import get_mb_command
+from .mountebank import HttpStub, http_imposter_config
+from .readiness import (DEFAULT_BACKOFF, HttpProbe, ImmediateProbe, LogLineProbe, PortProbe,
+                        ServiceExitedError)
+from .request_json import make_imposter_request
+
+# methods whose calls can be repeated, e.g. after a kept-alive connection turned out to be closed
+_IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'))
+
+
+async def wait_for_port(port, host='localhost', timeout=5.0, backoff=DEFAULT_BACKOFF):
+    """Wait until a port starts accepting TCP connections.
+
+    Args:
+        port (int): Port number.
+        host (str): Host address on which the port should exist.
+        timeout (float): In seconds. How long to wait before raising errors.
+        backoff (`mountepy.readiness.Backoff`): Schedule of delays between connection attempts.
+
+    Raises:
+        TimeoutError: The port isn't accepting connection after time specified in `timeout`.
+    """
+    try:
+        await asyncio.wait_for(_connect_with_backoff(host, port, backoff), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError('Waited too long for the port {} on host {} to start accepting '
+                           'connections.'.format(port, host))
+
+
+async def _connect_with_backoff(host, port, backoff):
+    start_time = time.perf_counter()
+    for attempts, delay in enumerate(backoff.delays(), 1):
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(delay)
+        else:
+            writer.close()
+            instrumentation.emit(instrumentation.PORT_WAIT, '{}:{}'.format(host, port),
+                                 time.perf_counter() - start_time, attempts=attempts)
+            return
+
+
+class AsyncHttpService(HttpService):
+    """Like `mountepy.HttpService`, but it's started and stopped with coroutines.
+    Use it with `async with` instead of `with`.
+    Takes the same arguments as `mountepy.HttpService`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._process = None
+        self._output_forwarder = None
+
+    async def start(self, timeout=5.0):  # pylint: disable=invalid-overridden-method
+        """Starts service process and waits for it to be ready.
+
+        Args:
+            timeout (float): How long to wait (in seconds) before raising an error.
+
+        Raises:
+            TimeoutError: If the service process didn't start in time.
+            ServiceExitedError: If the service process exited before it started serving.
+        """
+        await self._spawn_process()
+        try:
+            await self._wait_until_ready(timeout)
+        except BaseException:
+            logging.exception("Service '%s' didn't start", self._process_command)
+            await self.stop()
+            raise
+        self._mark_ready(time.perf_counter())
+
+    async def stop(self, timeout=5.0):  # pylint: disable=invalid-overridden-method
+        """Signals the service process to close and waits for it.
+
+        Args:
+            timeout (float): How long to wait (in seconds) before raising an error.
+
+        Raises:
+            `subprocess.TimeoutExpired`: If the service process didn't stop in time.
+        """
+        atexit.unregister(self._interrupt_process)
+        stop_start_time = time.perf_counter()
+        if self._process.returncode is None:
+            self._process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(self._process.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(self._process_command, timeout)
+        finally:
+            if self._output_forwarder:
+                self._output_forwarder.cancel()
+                self._output_forwarder = None
+        self._close_listening_socket()
+        self._emit_stopped(stop_start_time)
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with {}".format(type(self).__name__))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def _spawn_process(self):
+        self.time_to_ready = None
+        self._spawn_time = time.perf_counter()
+        command, popen_kwargs = self._get_spawn_arguments()
+        if isinstance(command, str):
+            command = [command]
+        self._process = await asyncio.create_subprocess_exec(
+            *command, env=self._service_env, **popen_kwargs)
+        atexit.register(self._interrupt_process)
+        self._emit_spawned()
+
+    def _interrupt_process(self):
+        if self._process.returncode is None:
+            os.kill(self._process.pid, signal.SIGINT)
+
+    async def _wait_until_ready(self, timeout):
+        ready_task = asyncio.ensure_future(self._check_readiness())
+        exit_task = asyncio.ensure_future(self._process.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {ready_task, exit_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (ready_task, exit_task):
+                if not task.done():
+                    task.cancel()
+        if ready_task in done:
+            ready_task.result()
+        elif exit_task in done:
+            raise ServiceExitedError('Process {} exited with code {} before it started serving.'
+                                     .format(self._process_command, exit_task.result()))
+        else:
+            raise TimeoutError('Service {} was not ready in time according to {}.'.format(
+                self.url, self.readiness))
+
+    async def _check_readiness(self):
+        probe = self.readiness
+        if isinstance(probe, ImmediateProbe):
+            return
+        elif isinstance(probe, PortProbe):
+            await _connect_with_backoff('localhost', self.port, probe.backoff)
+        elif isinstance(probe, LogLineProbe):
+            await self._wait_for_log_line(probe)
+        elif isinstance(probe, HttpProbe):
+            await self._wait_for_http_status(probe)
+        else:
+            loop = asyncio.get_event_loop()
+            for delay in probe.backoff.delays():
+                try:
+                    if await loop.run_in_executor(None, probe.check, self):
+                        return
+                except Exception:  # pylint: disable=broad-except
+                    pass
+                await asyncio.sleep(delay)
+
+    async def _wait_for_http_status(self, probe):
+        client = AsyncHttpClient(pool_size=1, timeout=probe.request_timeout)
+        try:
+            for delay in probe.backoff.delays():
+                try:
+                    response = await client.get(self.url + probe.path)
+                    if response.status_code == probe.status_code:
+                        return
+                except (OSError, EOFError, ValueError):
+                    pass
+                await asyncio.sleep(delay)
+        finally:
+            client.close()
+
+    async def _wait_for_log_line(self, probe):
+        stream = getattr(self._process, probe.stream)
+        output_fd = 1 if probe.stream == 'stdout' else 2
+        while True:
+            line = await stream.readline()
+            if not line:
+                returncode = await self._process.wait()
+                raise ServiceExitedError(
+                    'Process {} exited with code {} before it started serving.'.format(
+                        self._process_command, returncode))
+            os.write(output_fd, line)
+            if probe.pattern.search(line.rstrip(b'\n')):
+                break
+        self._output_forwarder = asyncio.ensure_future(_forward_output(stream, output_fd))
+
+
+async def _forward_output(stream, output_fd):
+    """Passes the rest of the service's output on, so the service doesn't block on a full pipe."""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return
+        os.write(output_fd, chunk)
+
+
+class AsyncServiceGroup(ServiceGroup):
+    """Like `mountepy.ServiceGroup`, but it works on `AsyncHttpService` objects
+    and is started and stopped with coroutines.
+    Use it with `async with` instead of `with`.
+
+    Args:
+        *service_processes (list[`AsyncHttpService`]): A list of not yet started HTTP services.
+    """
+
+    async def start(self, timeout=5.0):  # pylint: disable=invalid-overridden-method
+        """Starts all the service processes and waits for them to be ready.
+        Each service is started as soon as all the services it depends on are ready.
+
+        Args:
+            timeout (float): How long (in seconds) to wait before raising an error.
+
+        Raises:
+            TimeoutError: If all of the services didn't start in time.
+            ServiceExitedError: If one of the service processes exited before it started serving.
+        """
+        start_time = time.perf_counter()
+        self.timings = {}
+        ready_futures = {
+            service: asyncio.get_event_loop().create_future() for service in self._services}
+
+        async def start_service(service):
+            await asyncio.gather(*[ready_futures[dependency]
+                                   for dependency in self._dependencies[service]])
+            launch_time = time.perf_counter()
+            await service.start()
+            self.timings[service] = ServiceTiming(
+                service=service,
+                start_time=launch_time - start_time,
+                ready_time=time.perf_counter() - start_time)
+            ready_futures[service].set_result(None)
+
+        tasks = [asyncio.ensure_future(start_service(service)) for service in self._services]
+        done, pending = await asyncio.wait(
+            tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+        self._emit_timings()
+        errors = [task.exception() for task in done if task.exception()]
+        if pending or errors:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            for future in ready_futures.values():
+                future.cancel()
+            logging.error("Services of the group didn't start")
+            await asyncio.gather(*[service.stop() for service in self.timings],
+                                 return_exceptions=True)
+            if errors:
+                raise errors[0]
+            raise TimeoutError('Not all processes started in time: {}'.format(
+                [service for service in self._services if service not in self.timings]))
+
+    async def stop(self, timeout=5.0):  # pylint: disable=invalid-overridden-method
+        """Stops all the service processes. Waits for full stop.
+        Each service is stopped as soon as all the services depending on it are stopped.
+
+        Args:
+            timeout (float): How long (in seconds) to wait before raising an error.
+
+        Raises:
+            TimeoutError: If all of the services didn't stop in time.
+        """
+        stopped_futures = {
+            service: asyncio.get_event_loop().create_future() for service in self._services}
+
+        async def stop_service(service):
+            await asyncio.gather(*[stopped_futures[dependent]
+                                   for dependent in self._dependents[service]])
+            try:
+                await service.stop()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Service %s didn't stop cleanly", service)
+            finally:
+                stopped_futures[service].set_result(None)
+
+        tasks = [asyncio.ensure_future(stop_service(service)) for service in self._services]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            for task in pending:
+                task.cancel()
+            raise TimeoutError('Not all processes stopped in time.')
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with {}".format(type(self).__name__))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+
+class AsyncHttpClient:
+    """Asyncio HTTP/1.1 client keeping a pool of keep-alive connections.
+    Only meant for exchanging small JSON documents, e.g. with Mountebank.
+
+    Args:
+        pool_size (int): Maximum number of connections open to a single host.
+            When all of them are busy the calls wait for one to be free.
+        timeout (float): Default timeout (in seconds) of a single call.
+            None means that the calls can wait forever.
+
+    Attributes:
+        timeout (float): Default timeout (in seconds) of a single call.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.timeout = timeout
+        self._pool_size = pool_size
+        self._idle_connections = collections.defaultdict(list)
+        self._semaphores = {}
+        self._opened = 0
+        self._reused = 0
+
+    async def request(self, method, url, json_body=None, timeout=None):
+        """Makes a HTTP call using one of the pooled connections.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Full URL of the called resource.
+            json_body: Object that will be sent as the JSON body of the request.
+            timeout (float): Timeout (in seconds) for this call.
+                If not provided, the client's default is used.
+
+        Returns:
+            `AsyncResponse`: Response to the call.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        body = b'' if json_body is None else json.dumps(json_body).encode()
+        call = self._request(method, urllib.parse.urlsplit(url), body)
+        start_time = time.perf_counter()
+        response = None
+        try:
+            if timeout is None:
+                response = await call
+            else:
+                response = await asyncio.wait_for(call, timeout)
+            return response
+        except asyncio.TimeoutError:
+            raise TimeoutError('{} {} took more than {} seconds.'.format(method, url, timeout))
+        finally:
+            if instrumentation.is_enabled():
+                instrumentation.emit(
+                    instrumentation.HTTP_CALL, '{} {}'.format(method, url),
+                    time.perf_counter() - start_time, method=method, url=url,
+                    status_code=response.status_code if response is not None else None,
+                    request_size=len(body),
+                    response_size=len(response.content) if response is not None else None)
+
+    async def get(self, url, **kwargs):
+        """Makes a GET call. Takes the same arguments as `request`."""
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        """Makes a POST call. Takes the same arguments as `request`."""
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        """Makes a PUT call. Takes the same arguments as `request`."""
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        """Makes a DELETE call. Takes the same arguments as `request`."""
+        return await self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """
+        Returns:
+            `mountepy.http_client.ConnectionStats`: Counters of connections opened and reused
+                by this client.
+        """
+        return ConnectionStats(opened=self._opened, reused=self._reused)
+
+    def close(self):
+        """Closes all the idle connections."""
+        for connections in self._idle_connections.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle_connections.clear()
+
+    async def _request(self, method, url_parts, body):
+        address = (url_parts.hostname, url_parts.port or 80)
+        path = url_parts.path or '/'
+        if url_parts.query:
+            path += '?' + url_parts.query
+        request = ('{} {} HTTP/1.1\r\n'
+                   'Host: {}\r\n'
+                   'Content-Type: application/json\r\n'
+                   'Content-Length: {}\r\n'
+                   '\r\n').format(method, path, url_parts.netloc, len(body)).encode() + body
+
+        if address not in self._semaphores:
+            self._semaphores[address] = asyncio.Semaphore(self._pool_size)
+        async with self._semaphores[address]:
+            idle_connections = self._idle_connections[address]
+            while idle_connections:
+                reader, writer = idle_connections.pop()
+                if reader.at_eof():
+                    # the server closed the idle connection, another one will be tried
+                    writer.close()
+                    continue
+                try:
+                    response = await self._exchange(reader, writer, method, request)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if method.upper() not in _IDEMPOTENT_METHODS:
+                        # the server could have handled the request before the connection broke
+                        raise
+                    continue
+                except BaseException:
+                    # e.g. the call was cancelled
+                    writer.close()
+                    raise
+                self._reused += 1
+                return self._finish(address, reader, writer, response)
+
+            reader, writer = await asyncio.open_connection(*address)
+            self._opened += 1
+            try:
+                response = await self._exchange(reader, writer, method, request)
+            except BaseException:
+                writer.close()
+                raise
+            return self._finish(address, reader, writer, response)
+
+    def _finish(self, address, reader, writer, response):
+        if response.headers.get('connection', '').lower() == 'close':
+            writer.close()
+        else:
+            self._idle_connections[address].append((reader, writer))
+        return response
+
+    @staticmethod
+    async def _exchange(reader, writer, method, request):
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server.')
+        status_code = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status_code in (204, 304) or 100 <= status_code < 200:
+            content = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = await _read_chunked(reader)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            headers['connection'] = 'close'
+        return AsyncResponse(status_code, headers, content)
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            # skipping trailers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+
+
+class AsyncResponse(collections.namedtuple('AsyncResponse', 'status_code, headers, content')):
+    """Response received by `AsyncHttpClient`.
+
+    Attributes:
+        status_code (int): HTTP status code.
+        headers (dict): HTTP headers, with lowercase names.
+        content (bytes): Response body.
+    """
+
+    def json(self):
+        """
+        Returns:
+            Body of the response decoded from JSON.
+        """
+        return json.loads(self.content.decode())
+
+    def raise_for_status(self):
+        """
+        Raises:
+            `requests.HTTPError`: If the status code means an error.
+        """
+        if self.status_code >= 400:
+            raise requests.HTTPError('HTTP error {}: {}'.format(
+                self.status_code, self.content[:1000]))
+
+
+class AsyncMountebankWrapper:
+    """Like `mountepy.mountebank.MountebankWrapper`, but its calls are coroutines.
+    Meant to be used as a superclass.
+
+    Args:
+        host (str): Host on which Mountebank is listening for imposter configuration commands.
+        port (int): Port on which Mountebank is listening.
+        pool_size (int): How many keep-alive connections to Mountebank can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to Mountebank.
+            None means no timeout.
+
+    Attributes:
+        client (`AsyncHttpClient`): Connection pool used for calls to Mountebank.
+            It's shared by all the imposters created through this object.
+    """
+
+    def __init__(self, host, port, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.host = host
+        self.port = port
+        self.client = AsyncHttpClient(pool_size=pool_size, timeout=timeout)
+        self._imposters_url = 'http://{}:{}/imposters'.format(host, port)
+
+    async def add_imposter(self, imposter_cfg):
+        """Adds a HTTP service stub (imposter) to Mountebank instance.
+
+        Args:
+            imposter_cfg (dict): JSON with Mountebank configuration for an impostor.
+                Consult Mountebank documentation.
+
+        Returns:
+            `AsyncImposter`: The created service stub.
+        """
+        resp = await self.client.post(self._imposters_url, json_body=imposter_cfg)
+        resp.raise_for_status()
+        return self._make_imposter(imposter_cfg['port'])
+
+    async def add_imposters(self, imposter_cfgs):
+        """Adds many imposters to Mountebank instance.
+        If there are no imposters in Mountebank, all of them are created with a single request.
+        Otherwise they are added concurrently, so that the existing imposters are left untouched.
+
+        Args:
+            imposter_cfgs (list[dict]): Mountebank configurations of the imposters.
+                Each of them needs to have a port set.
+
+        Returns:
+            list[`AsyncImposter`]: The created imposters, in the order of the configurations.
+        """
+        resp = await self.client.get(self._imposters_url)
+        resp.raise_for_status()
+        if resp.json()['imposters']:
+            return await asyncio.gather(
+                *[self.add_imposter(imposter_cfg) for imposter_cfg in imposter_cfgs])
+        return await self.replace_all_imposters(imposter_cfgs)
+
+    async def replace_all_imposters(self, imposter_cfgs):
+        """Replaces all the imposters in Mountebank instance with the given ones,
+        using a single request.
+
+        Args:
+            imposter_cfgs (list[dict]): Mountebank configurations of the imposters.
+                Each of them needs to have a port set.
+
+        Returns:
+            list[`AsyncImposter`]: The imposters, in the order of the configurations.
+        """
+        resp = await self.client.put(self._imposters_url, json_body={'imposters': imposter_cfgs})
+        resp.raise_for_status()
+        return [self._make_imposter(imposter_cfg['port']) for imposter_cfg in imposter_cfgs]
+
+    async def add_imposter_simple(self, port=None, method='GET',  # pylint: disable=too-many-arguments
+                                  path='/', status_code=200, response=''):
+        """Adds an imposter with a single HTTP service stub to Mountebank instance.
+        Takes the same arguments as `mountepy.mountebank.MountebankWrapper.add_imposter_simple`.
+
+        Returns:
+            `AsyncImposter`: The newly created imposter.
+        """
+        if port is None:
+            port = port_for.select_random()
+        return await self.add_multi_stub_imposter_simple(
+            port,
+            [HttpStub(method, path, status_code, response)])
+
+    async def add_multi_stub_imposter_simple(self, port, stubs):
+        """Adds a Mountebank imposter with multiple HTTP stubs on one port.
+
+        Args:
+            port (int): Port the imposter will listen on.
+            stubs (list[`mountepy.HttpStub`]): HTTP stubs to be created on the port.
+
+        Returns:
+            `AsyncImposter`: The newly created imposter.
+        """
+        return await self.add_imposter(http_imposter_config(port, stubs))
+
+    async def reset(self):
+        """Removes configured imposters (HTTP stubs)."""
+        resp = await self.client.delete(self._imposters_url)
+        resp.raise_for_status()
+
+    async def start(self):
+        """Make sure the process is running and has a clean configuration"""
+        raise NotImplementedError()
+
+    async def stop(self):
+        """Tear down the process if necessary"""
+        raise NotImplementedError()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def _make_imposter(self, port):
+        return AsyncImposter(self.port, port, host=self.host, client=self.client)
+
+
+class AsyncMountebank(AsyncMountebankWrapper):
+    """Manages a Mountebank instance. Can start and stop the Mountebank process.
+
+    Args:
+        port (int): Port on which Mountebank is listening for imposter configuration commands.
+        pool_size (int): How many keep-alive connections to Mountebank can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to Mountebank.
+    """
+
+    def __init__(self, port=None, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        process = AsyncHttpService(get_mb_command() + ['--mock', '--port', '{port}'], port)
+        super().__init__('localhost', process.port, pool_size=pool_size, timeout=timeout)
+        self.process = process
+
+    async def start(self):
+        """Starts the Mountebank process"""
+        await self.process.start()
+
+    async def stop(self):
+        """Stops the Mountebank process"""
+        self.client.close()
+        await self.process.stop()
+
+
+class AsyncImposter:
+    """Like `mountepy.mountebank.Imposter`, but its calls are coroutines.
+
+    Args:
+        mountebank_port (int): Mountebank's port.
+        port (int): Port for the imposter.
+        host (str): Host on which Mountebank is listening.
+        client (`AsyncHttpClient`): Connection pool used for calls to Mountebank.
+            A new one is created if it's not provided.
+
+    Attributes:
+        url (str): Management URL for the Imposter.
+        port (int): Port on localhost taken by this Imposter.
+    """
+
+    def __init__(self, mountebank_port, port, host='localhost', client=None):
+        self.url = 'http://{}:{}/imposters/{}'.format(host, mountebank_port, port)
+        self.port = port
+        self._client = client or AsyncHttpClient()
+
+    async def requests(self):
+        """
+        Returns:
+            list[`mountepy.mountebank.ImposterRequest`]: The requests made on the impostor.
+        """
+        imposter_json = (await self._client.get(self.url)).json()
+        return [make_imposter_request(request) for request in imposter_json.get('requests', [])]
+
+    async def wait_for_requests(self, count=1, timeout=5.0):
+        """Wait until a number of requests arrive to the imposter.
+
+        Args:
+            count (int): How many requests to wait for.
+            timeout (float): How long to wait for requests.
+
+        Returns:
+            list[`mountepy.mountebank.ImposterRequest`]: The requests made on the impostor.
+        """
+        start_time = time.perf_counter()
+        while True:
+            received_requests = await self.requests()
+            if len(received_requests) >= count:
+                return received_requests
+            await asyncio.sleep(0.01)
+            if time.perf_counter() - start_time >= timeout:
+                raise TimeoutError('Waited too long for requests on stub.')
+
+    async def destroy(self):
+        """Deletes this `AsyncImposter` from Mountebank.
+        This object cannot be used afterwards.
+        """
+        await self._client.delete(self.url)
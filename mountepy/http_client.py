@@ -0,0 +1,188 @@
+"""
+A pooled HTTP client with keep-alive connections, used to talk to Mountebank.
+"""
+
+import collections
+import threading
+import time
+
+import requests
+import requests.adapters
+
+from . import instrumentation
+
+DEFAULT_POOL_SIZE = 10
+
+
+class HttpClient:
+    """HTTP client keeping a pool of keep-alive connections.
+    It can be shared between threads.
+
+    Args:
+        pool_size (int): Maximum number of connections kept open to a single host.
+            When all of them are busy the calling thread waits for one to be free.
+        timeout (float): Default timeout (in seconds) of a single call.
+            None means that the calls can wait forever.
+
+    Attributes:
+        timeout (float): Default timeout (in seconds) of a single call.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.timeout = timeout
+        # running totals, so that they survive closing and evicting the connection pools
+        self._counter = _ConnectionCounter()
+        self._adapter = _CountingAdapter(self._counter, pool_maxsize=pool_size, pool_block=True)
+        self._session = requests.Session()
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Makes a HTTP call using one of the pooled connections.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Full URL of the called resource.
+            timeout (float): Timeout (in seconds) for this call.
+                If not provided, the client's default is used.
+            **kwargs: Other arguments accepted by `requests.request`.
+
+        Returns:
+            `requests.Response`: Response to the call.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if not instrumentation.is_enabled():
+            return self._session.request(method, url, timeout=timeout, **kwargs)
+
+        start_time = time.perf_counter()
+        response = None
+        try:
+            response = self._session.request(method, url, timeout=timeout, **kwargs)
+            return response
+        finally:
+            _emit_call(method, url, time.perf_counter() - start_time, response,
+                       kwargs.get('stream'))
+
+    def get(self, url, **kwargs):
+        """Makes a GET call. Takes the same arguments as `request`."""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Makes a POST call. Takes the same arguments as `request`."""
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        """Makes a PUT call. Takes the same arguments as `request`."""
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """Makes a DELETE call. Takes the same arguments as `request`."""
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """
+        Returns:
+            `ConnectionStats`: Counters of connections opened and reused by this client.
+        """
+        return self._counter.stats()
+
+    def close(self):
+        """Closes all the pooled connections.
+        The client can still be used afterwards, it will open new connections.
+        """
+        self._session.close()
+
+
+class _ConnectionCounter:
+    """Thread-safe totals of the connections opened and the requests made by a `HttpClient`.
+    It doesn't reference the client, so the client's connections are closed as soon as
+    the client is garbage collected.
+    """
+
+    def __init__(self):
+        self._opened = 0
+        self._requests_made = 0
+        self._lock = threading.Lock()
+
+    def count(self, opened=0, requests_made=0):
+        """Adds to the totals."""
+        with self._lock:
+            self._opened += opened
+            self._requests_made += requests_made
+
+    def stats(self):
+        """
+        Returns:
+            `ConnectionStats`: The totals.
+        """
+        with self._lock:
+            return ConnectionStats(opened=self._opened, reused=self._requests_made - self._opened)
+
+
+class _CountingAdapter(requests.adapters.HTTPAdapter):
+    """Counts the connections opened and the requests made by its connection pools.
+
+    Args:
+        counter (`_ConnectionCounter`): Where the counts go.
+        **kwargs: Arguments of `requests.adapters.HTTPAdapter`.
+    """
+
+    def __init__(self, counter, **kwargs):
+        # the pool manager is created by the base class' constructor
+        self._counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _make_counting_pool_class(pool_class, self._counter)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()}
+
+    def __setstate__(self, state):
+        # the counter isn't pickled, an unpickled adapter counts from zero
+        self._counter = _ConnectionCounter()
+        super().__setstate__(state)
+
+
+def _make_counting_pool_class(pool_class, counter):
+    class CountingPool(pool_class):  # pylint: disable=too-few-public-methods
+        """Connection pool counting its new connections and requests."""
+
+        def _new_conn(self):
+            connection = super()._new_conn()
+            counter.count(opened=1)
+            return connection
+
+        def _make_request(self, *args, **kwargs):  # pylint: disable=arguments-differ
+            counter.count(requests_made=1)
+            return super()._make_request(*args, **kwargs)
+
+    CountingPool.__name__ = 'Counting' + pool_class.__name__
+    return CountingPool
+
+
+def _emit_call(method, url, duration, response, stream):
+    request_size = response_size = None
+    if response is not None:
+        body = response.request.body
+        request_size = len(body) if body is not None else 0
+        if stream:
+            # reading the content would consume the stream
+            content_length = response.headers.get('Content-Length')
+            response_size = int(content_length) if content_length else None
+        else:
+            response_size = len(response.content)
+    instrumentation.emit(
+        instrumentation.HTTP_CALL, '{} {}'.format(method, url), duration, method=method, url=url,
+        status_code=response.status_code if response is not None else None,
+        request_size=request_size, response_size=response_size)
+
+
+ConnectionStats = collections.namedtuple('ConnectionStats', 'opened, reused')
+ConnectionStats.__doc__ = """Connection counters of a `HttpClient`.
+
+Attributes:
+    opened (int): How many new connections were opened.
+    reused (int): How many calls were made on connections that were already open.
+"""
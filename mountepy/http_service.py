@@ -3,9 +3,11 @@ Abstractions for management of HTTP service processes.
 """
 
 import atexit
+import collections
 import concurrent.futures
 import logging
 import os
+import queue
 import signal
 import socket
 import subprocess
@@ -13,31 +15,17 @@ import time
 
 import port_for
 
+from . import instrumentation
+# wait_for_port and wait_for_ports used to be defined here, they're still imported from here
+from .readiness import (ImmediateProbe, PortProbe,  # pylint: disable=unused-import
+                        ServiceExitedError, wait_for_port, wait_for_ports, _PortWaiter)
 
-def wait_for_port(port, host='localhost', timeout=5.0):
-    """Wait until a port starts accepting TCP connections.
+_HANDOFF_SCRIPT = ('exec 3<&0 0</dev/null; '
+                   'LISTEN_FDS=1; LISTEN_PID=$$; export LISTEN_FDS LISTEN_PID; '
+                   'exec "$@"')
 
-    Args:
-        port (int): Port number.
-        host (str): Host address on which the port should exist.
-        timeout (float): In seconds. How long to wait before raising errors.
-
-    Raises:
-        TimeoutError: The port isn't accepting connection after time specified in `timeout`.
-    """
-    start_time = time.perf_counter()
-    while True:
-        try:
-            with socket.create_connection((host, port)):
-                break
-        except OSError:
-            time.sleep(0.01)
-            if time.perf_counter() - start_time >= timeout:
-                raise TimeoutError('Waited too long for the port {} on host {} to start accepting '
-                                   'connections.'.format(port, host))
 
-
-class HttpService:
+class HttpService:  # pylint: disable=too-many-instance-attributes
     """Manages a HTTP service instance on localhost. Can start and stop the process.
 
     Args:
@@ -53,40 +41,63 @@ class HttpService:
         copy_parent_env (bool): If set to True then environment of the service process will
             contain environment of the parent process updated with `env`.
             If set to False, then only `env` will be set as the service's environment.
+        readiness (`mountepy.readiness.ReadinessProbe`): Strategy of checking whether the
+            started service is ready. By default the service is ready when its port starts
+            accepting TCP connections.
+        depends_on (list[`HttpService`]): Services that need to be ready before this one
+            is started. Respected when the services are started in a `ServiceGroup`.
+        socket_handoff (bool): If set to True, then the listening socket is created by this
+            object on start and passed to the service process as file descriptor 3, following
+            systemd's socket activation convention (LISTEN_FDS and LISTEN_PID environment
+            variables). The socket listens on 127.0.0.1 only.
+            The port can't be taken by anyone else while the process starts, and the service is
+            reachable right after its process is spawned, because connections wait
+            in the socket's backlog. The service needs to support this convention.
 
     Attributes:
         port (int): Localhost port taken by the service.
         url (int): Address on which the service is available on when it's started.
+        readiness (`mountepy.readiness.ReadinessProbe`): Strategy of checking whether the
+            started service is ready.
+        time_to_ready (float): How long (in seconds) it took for the service to be ready after
+            its process was spawned. None if the service wasn't started yet.
+        depends_on (list[`HttpService`]): Services that need to be ready before this one
+            is started.
+        socket_handoff (bool): True if the listening socket is passed to the service process.
     """
 
-    def __init__(self, process_command, port=None, env=None, copy_parent_env=True):
-        if port is None:
-            self.port = port_for.select_random()
-        else:
-            self.port = port
+    def __init__(self, process_command, port=None, env=None,  # pylint: disable=too-many-arguments
+                 copy_parent_env=True, readiness=None, depends_on=None, socket_handoff=False):
+        self._listening_socket = None
+        self.port = port_for.select_random() if port is None else port
+        self.readiness = readiness or (ImmediateProbe() if socket_handoff else PortProbe())
         self.url = 'http://localhost:{}'.format(self.port)
+        self.socket_handoff = socket_handoff
+        self.time_to_ready = None
+        self.depends_on = list(depends_on or [])
         self._process_command = self._format_process_command(process_command, self.port)
         self._service_env = self._format_process_env(copy_parent_env, env, self.port)
         self._service_proc = None
+        self._spawn_time = None
 
     def start(self, timeout=5.0):
-        """Starts service process and waits for it to start accepting connections.
+        """Starts service process and waits for it to be ready.
 
         Args:
             timeout (float): How long to wait (in seconds) before raising an error.
 
         Raises:
             TimeoutError: If the service process didn't start in time.
+            ServiceExitedError: If the service process exited before it started serving.
         """
-        self._service_proc = subprocess.Popen(self._process_command, env=self._service_env)
-        atexit.register(self.stop)
-
+        self._spawn()
         try:
-            wait_for_port(self.port, timeout=timeout)
+            self.readiness.wait(self, self._service_proc, timeout)
         except Exception:
             logging.exception("Service '%s' didn't start", self._process_command)
             self.stop()
             raise
+        self._mark_ready(time.perf_counter())
 
     def stop(self, timeout=5.0):
         """Signals the service process to close and waits for it.
@@ -98,12 +109,15 @@ class HttpService:
             `subprocess.TimeoutExpired`: If the service process didn't start in time.
         """
         atexit.unregister(self.stop)
+        stop_start_time = time.perf_counter()
         # Sending SIGINT (ctrl+C) because Python handles it by default.
         # Terminate could also be sent, but if the service process spawned
         # another process, then it would need to intercept SIGTERM if we'd
         # want to have a multiprocess coverage report.
         self._service_proc.send_signal(signal.SIGINT)
         self._service_proc.wait(timeout)
+        self._close_listening_socket()
+        self._emit_stopped(stop_start_time)
 
     def __enter__(self):
         self.start()
@@ -112,6 +126,78 @@ class HttpService:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
 
+    def _spawn(self):
+        self.time_to_ready = None
+        self._spawn_time = time.perf_counter()
+        command, popen_kwargs = self._get_spawn_arguments()
+        try:
+            self._service_proc = subprocess.Popen(command, env=self._service_env, **popen_kwargs)
+        except Exception:
+            self._close_listening_socket()
+            raise
+        atexit.register(self.stop)
+        self._emit_spawned()
+
+    def _get_spawn_arguments(self):
+        """
+        Returns:
+            tuple: The command starting the service and additional arguments for `Popen`.
+        """
+        popen_kwargs = self.readiness.popen_kwargs()
+        command = self._process_command
+        if self.socket_handoff:
+            if self._listening_socket is None:
+                self._listening_socket = self._create_listening_socket(self.port)
+            command = self._wrap_handoff_command(command)
+            popen_kwargs['stdin'] = self._listening_socket
+        return command, popen_kwargs
+
+    def _close_listening_socket(self):
+        if self._listening_socket:
+            # closing the socket, so that connections are refused, like without the handoff
+            self._listening_socket.close()
+            self._listening_socket = None
+
+    def _mark_ready(self, ready_time):
+        self.time_to_ready = ready_time - self._spawn_time
+        instrumentation.emit(instrumentation.SERVICE_READY, self._event_name(),
+                             self.time_to_ready, port=self.port)
+
+    def _emit_spawned(self):
+        instrumentation.emit(instrumentation.SERVICE_SPAWN, self._event_name(),
+                             time.perf_counter() - self._spawn_time, port=self.port)
+
+    def _emit_stopped(self, stop_start_time):
+        instrumentation.emit(instrumentation.SERVICE_STOP, self._event_name(),
+                             time.perf_counter() - stop_start_time, port=self.port)
+
+    def _event_name(self):
+        """
+        Returns:
+            str: Name of the service in the `mountepy.instrumentation` events.
+        """
+        command = self._process_command
+        if not isinstance(command, str):
+            command = ' '.join(command)
+        return '{} (port {})'.format(command, self.port)
+
+    @staticmethod
+    def _create_listening_socket(port):
+        listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listening_socket.bind(('127.0.0.1', port))
+        listening_socket.listen(socket.SOMAXCONN)
+        return listening_socket
+
+    @staticmethod
+    def _wrap_handoff_command(command):
+        """The socket is passed as the standard input of a shell, which moves it to descriptor 3
+        and sets LISTEN_PID to its own PID before replacing itself with the service.
+        """
+        if isinstance(command, str):
+            command = [command]
+        return ['/bin/sh', '-c', _HANDOFF_SCRIPT, 'mountepy-socket-handoff'] + command
+
     @staticmethod
     def _format_process_command(command, port):
         if not isinstance(command, str):
@@ -140,27 +226,56 @@ class ServiceGroup:
     """Manages a group of service processes.
     Can be used to concurrently start or stop more than one service.
 
+    Services are started respecting their dependencies (`depends_on` attribute of `HttpService`),
+    each one as soon as all the services it depends on are ready.
+    They are stopped in the reverse order, each one as soon as all the services
+    depending on it are stopped.
+
     Args:
         *service_processes (list[`HttpService`]): A list of not yet started HTTP services.
+
+    Attributes:
+        timings (dict[`HttpService`, `ServiceTiming`]): Timings of the services
+            from the last start of the group.
+
+    Raises:
+        ValueError: If a service depends on a service from outside of the group
+            or the dependencies form a cycle.
     """
 
     def __init__(self, *service_processes):
         self._services = service_processes
-        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=7)
+        self._dependencies = {
+            service: tuple(getattr(service, 'depends_on', ())) for service in service_processes}
+        self._dependents = {service: [] for service in service_processes}
+        for service, dependencies in self._dependencies.items():
+            for dependency in dependencies:
+                if dependency not in self._dependents:
+                    raise ValueError('Service {} depends on {}, which is not in the group.'.format(
+                        service, dependency))
+                self._dependents[dependency].append(service)
+        self._check_for_cycles()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(service_processes), 1))
+        self.timings = {}
 
     def start(self, timeout=5.0):
-        """Starts all the service processes and waits them to start accepting connections.
+        """Starts all the service processes and waits for them to be ready.
 
         Args:
             timeout (float): How long (in seconds) to wait before raising an error.
 
         Raises:
             TimeoutError: If all of the services didn't start in time.
+            ServiceExitedError: If one of the service processes exited before it started serving.
         """
-        start_futures = [self._executor.submit(service.start) for service in self._services]
-        results = concurrent.futures.wait(start_futures, timeout=timeout)
-        if results.not_done:
-            raise TimeoutError('Not all processes started in time.')
+        group_start = _GroupStart(self._services, self._dependencies, self._dependents,
+                                  self._executor)
+        try:
+            group_start.run(timeout)
+        finally:
+            self.timings = group_start.timings
+            self._emit_timings()
 
     def stop(self, timeout=5.0):
         """
@@ -171,10 +286,49 @@ class ServiceGroup:
         Raises:
             TimeoutError: If all of the services didn't stop in time.
         """
-        stop_futures = [self._executor.submit(service.stop) for service in self._services]
-        results = concurrent.futures.wait(stop_futures, timeout=timeout)
-        if results.not_done:
-            raise TimeoutError('Not all processes stopped in time.')
+        deadline = time.perf_counter() + timeout
+        stopped_services = queue.Queue()
+        remaining_dependents = {
+            service: set(dependents) for service, dependents in self._dependents.items()}
+
+        def stop_service(service):
+            future = self._executor.submit(service.stop)
+            future.add_done_callback(lambda future: stopped_services.put((service, future)))
+
+        for service in self._services:
+            if not remaining_dependents[service]:
+                stop_service(service)
+        for _ in self._services:
+            try:
+                service, future = stopped_services.get(
+                    timeout=max(deadline - time.perf_counter(), 0.0))
+            except queue.Empty:
+                raise TimeoutError('Not all processes stopped in time.')
+            if future.exception():
+                logging.error("Service %s didn't stop cleanly", service,
+                              exc_info=future.exception())
+            for dependency in self._dependencies[service]:
+                remaining_dependents[dependency].discard(service)
+                if not remaining_dependents[dependency]:
+                    stop_service(dependency)
+
+    def critical_path(self):
+        """Finds the chain of dependent services that determined the duration of the last start.
+
+        Returns:
+            list[`ServiceTiming`]: Timings of the services on the path, starting with the one
+                that was started first and ending with the one that was ready last.
+        """
+        if not self.timings:
+            return []
+        timing = max(self.timings.values(), key=lambda timing: timing.ready_time)
+        path = [timing]
+        while self._dependencies[timing.service]:
+            timing = max((self.timings[dependency]
+                          for dependency in self._dependencies[timing.service]),
+                         key=lambda timing: timing.ready_time)
+            path.append(timing)
+        return list(reversed(path))
 
     def __enter__(self):
         self.start()
@@ -182,3 +336,177 @@ class ServiceGroup:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
+
+    def _emit_timings(self):
+        for timing in self.timings.values():
+            # pylint: disable=protected-access
+            name = (timing.service._event_name() if isinstance(timing.service, HttpService)
+                    else repr(timing.service))
+            instrumentation.emit(instrumentation.GROUP_SERVICE, name, timing.duration,
+                                 start_time=timing.start_time, ready_time=timing.ready_time)
+
+    def _check_for_cycles(self):
+        remaining_dependencies = {
+            service: len(dependencies) for service, dependencies in self._dependencies.items()}
+        free_services = [service for service, count in remaining_dependencies.items() if not count]
+        sorted_count = 0
+        while free_services:
+            service = free_services.pop()
+            sorted_count += 1
+            for dependent in self._dependents[service]:
+                remaining_dependencies[dependent] -= 1
+                if not remaining_dependencies[dependent]:
+                    free_services.append(dependent)
+        if sorted_count != len(self._services):
+            raise ValueError('Dependencies of the services form a cycle.')
+
+
+class _GroupStart:  # pylint: disable=too-many-instance-attributes
+    """A single start of a `ServiceGroup`.
+
+    Processes of `HttpService` objects that wait for their ports are spawned by this object and
+    all of their ports are awaited with a single `_PortWaiter`.
+    Other objects are started in the executor's threads.
+    Each service is started as soon as all of its dependencies are ready.
+
+    Attributes:
+        timings (dict[`HttpService`, `ServiceTiming`]): Timings of the services that were
+            started.
+    """
+
+    def __init__(self, services, dependencies, dependents, executor):
+        self.timings = {}
+        self._services = services
+        self._dependents = dependents
+        self._executor = executor
+        self._remaining_dependencies = {
+            service: set(service_dependencies)
+            for service, service_dependencies in dependencies.items()}
+        self._launch_times = {}
+        self._port_services = {}
+        self._start_futures = {}
+        self._started_services = queue.Queue()
+        self._waiter = _PortWaiter()
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._waiter.watch_wakeups(self._wakeup_receiver)
+        self._wakeup_receiver.setblocking(False)
+        self._start_time = time.perf_counter()
+
+    def run(self, timeout):
+        """Starts the services and waits for them to be ready.
+
+        Args:
+            timeout (float): How long (in seconds) to wait before raising an error.
+        """
+        # pylint: disable=protected-access
+        deadline = self._start_time + timeout
+        try:
+            for service in self._services:
+                if not self._remaining_dependencies[service]:
+                    self._launch(service)
+            while len(self.timings) < len(self._services):
+                try:
+                    opened_targets = self._waiter.wait_any(deadline)
+                except TimeoutError:
+                    raise TimeoutError('Not all processes started in time: {}'.format(
+                        [service for service in self._services if service not in self.timings]))
+                for target in opened_targets:
+                    service = self._port_services[target]
+                    service._mark_ready(self._waiter.open_times[target])
+                    self._mark_ready(service, self._waiter.open_times[target])
+                self._collect_started_services()
+        except Exception:
+            logging.exception("Services of the group didn't start")
+            self._stop_launched_services(deadline)
+            raise
+        finally:
+            self._waiter.close()
+            self._wakeup_receiver.close()
+            self._wakeup_sender.close()
+
+    def _launch(self, service):
+        self._launch_times[service] = time.perf_counter()
+        # subclasses overriding start need it called, e.g. to wait for more than the port
+        if type(service).start is HttpService.start and isinstance(service.readiness, PortProbe):
+            # pylint: disable=protected-access
+            service._spawn()
+            target = ('localhost', service.port)
+            self._port_services[target] = service
+            self._waiter.add(target, service.readiness.backoff, service._service_proc)
+        else:
+            future = self._executor.submit(service.start)
+            self._start_futures[service] = future
+            future.add_done_callback(
+                lambda future: self._on_service_started(service, future))
+
+    def _on_service_started(self, service, future):
+        self._started_services.put((service, future, time.perf_counter()))
+        try:
+            self._wakeup_sender.send(b'\0')
+        except OSError:
+            # the group start is already over
+            pass
+
+    def _collect_started_services(self):
+        try:
+            while self._wakeup_receiver.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while not self._started_services.empty():
+            service, future, ready_time = self._started_services.get()
+            future.result()
+            self._mark_ready(service, ready_time)
+
+    def _mark_ready(self, service, ready_time):
+        self.timings[service] = ServiceTiming(
+            service=service,
+            start_time=self._launch_times[service] - self._start_time,
+            ready_time=ready_time - self._start_time)
+        for dependent in self._dependents[service]:
+            self._remaining_dependencies[dependent].discard(service)
+            if not self._remaining_dependencies[dependent]:
+                self._launch(dependent)
+
+    def _stop_launched_services(self, deadline):
+        for service in self._port_services.values():
+            _stop_service(service)
+        # services still starting in the executor can be stopped only after their start is over
+        for future in self._start_futures.values():
+            future.cancel()
+        concurrent.futures.wait(self._start_futures.values(),
+                                timeout=max(deadline - time.perf_counter(), 0))
+        for service, future in self._start_futures.items():
+            if not future.cancelled():
+                # a failed start stops the service on its own
+                future.add_done_callback(
+                    lambda future, service=service: future.exception() or _stop_service(service))
+
+
+def _stop_service(service):
+    """Stops a service of a group that didn't start, so that a failing stop
+    doesn't prevent stopping the others.
+    """
+    try:
+        service.stop()
+    except Exception:  # pylint: disable=broad-except
+        logging.exception('Service %s of the group could not be stopped', service)
+
+
+class ServiceTiming(collections.namedtuple('ServiceTiming', 'service, start_time, ready_time')):
+    """Timing of a service's start in a `ServiceGroup`.
+
+    Attributes:
+        service (`HttpService`): The service.
+        start_time (float): Seconds from the start of the group to the start of the service.
+        ready_time (float): Seconds from the start of the group to the moment
+            the service was ready.
+    """
+
+    @property
+    def duration(self):
+        """
+        Returns:
+            float: How long (in seconds) it took to start the service.
+        """
+        return self.ready_time - self.start_time
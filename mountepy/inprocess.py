@@ -0,0 +1,661 @@
+"""
+A pure-Python imposter engine running inside the test process.
+It speaks the subset of Mountebank's REST API used by `mountepy.mountebank.MountebankWrapper`,
+and supports HTTP imposters with simple predicates and "is" responses.
+It starts in milliseconds and doesn't need Node or any other external process.
+"""
+
+import contextlib
+import datetime
+import http.server
+import json
+import queue
+import re
+import selectors
+import socket
+import socketserver
+import threading
+import urllib.parse
+
+import port_for
+
+from .http_client import DEFAULT_POOL_SIZE
+from .mountebank import MountebankWrapper, RequestCollector
+
+ENGINE_VERSION = 'mountepy-inprocess'
+
+_IMPOSTER_KEYS = {'port', 'protocol', 'name', 'stubs', 'recordRequests', 'defaultResponse'}
+_STUB_KEYS = {'predicates', 'responses'}
+_RESPONSE_KEYS = {'statusCode', 'headers', 'body'}
+_PREDICATE_FIELDS = {'method', 'path', 'query', 'headers', 'body', 'requestFrom'}
+_OBJECT_FIELDS = {'query', 'headers'}
+_FIELD_OPERATORS = {
+    'equals': lambda expected, actual: actual == expected,
+    'deepEquals': lambda expected, actual: actual == expected,
+    'contains': lambda expected, actual: expected in actual,
+    'startsWith': lambda expected, actual: actual.startswith(expected),
+    'endsWith': lambda expected, actual: actual.endswith(expected),
+    'matches': lambda expected, actual: re.search(expected, actual) is not None,
+}
+_LOGICAL_OPERATORS = {'and', 'or', 'not'}
+_PREDICATE_OPTIONS = {'caseSensitive'}
+
+
+class InProcessMountebank(MountebankWrapper):
+    """An in-process stand-in for `mountepy.Mountebank`.
+    It can be used instead of it in tests that only need HTTP imposters
+    with "is" responses and equals, deepEquals, contains, startsWith, endsWith, matches
+    or exists predicates (combined with and, or and not).
+
+    Args:
+        port (int): Port on which the engine listens for imposter configuration commands.
+            If not provided, a random free port is used.
+        pool_size (int): How many keep-alive connections to the engine can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to the engine.
+    """
+
+    def __init__(self, port=None, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        super().__init__('localhost', port or port_for.select_random(),
+                         pool_size=pool_size, timeout=timeout)
+        # requests are given to the collector right away, so waiting for them doesn't need polling
+        self.collector = RequestCollector()
+        self._engine = None
+
+    def add_imposter(self, imposter_cfg):
+        """Adds a HTTP service stub (imposter).
+        See `mountepy.mountebank.MountebankWrapper.add_imposter`.
+
+        Raises:
+            `UnsupportedImposterError`: If the configuration can't be handled by this engine.
+        """
+        check_imposter_config(imposter_cfg)
+        return super().add_imposter(imposter_cfg)
+
+    def replace_all_imposters(self, imposter_cfgs, keep_unchanged=False):
+        """Replaces all the imposters with the given ones.
+        See `mountepy.mountebank.MountebankWrapper.replace_all_imposters`.
+
+        Raises:
+            `UnsupportedImposterError`: If a configuration can't be handled by this engine.
+        """
+        for imposter_cfg in imposter_cfgs:
+            check_imposter_config(imposter_cfg)
+        return super().replace_all_imposters(imposter_cfgs, keep_unchanged)
+
+    def start(self):
+        """Starts the engine's threads."""
+        self._engine = _Engine(self.port, self.collector.push)
+
+    def stop(self):
+        """Closes all the imposters and stops the engine."""
+        self.client.close()
+        self._engine.close()
+        self._engine = None
+
+
+class UnsupportedImposterError(ValueError):
+    """Means that an imposter configuration uses Mountebank features
+    that the in-process engine doesn't support.
+    """
+
+
+def check_imposter_config(imposter_cfg):
+    """Checks whether an imposter configuration can be handled by the in-process engine.
+
+    Args:
+        imposter_cfg (dict): Mountebank configuration of an imposter.
+
+    Raises:
+        `UnsupportedImposterError`: If the configuration uses unsupported features.
+    """
+    _check_keys('imposter', imposter_cfg, _IMPOSTER_KEYS)
+    if imposter_cfg.get('protocol', 'http') != 'http':
+        raise UnsupportedImposterError(
+            'Only "http" imposters are supported, not "{}".'.format(imposter_cfg['protocol']))
+    if 'defaultResponse' in imposter_cfg:
+        _check_keys('default response', imposter_cfg['defaultResponse'], _RESPONSE_KEYS)
+    for stub in imposter_cfg.get('stubs', []):
+        _check_stub(stub)
+
+
+def _check_stub(stub):
+    _check_keys('stub', stub, _STUB_KEYS)
+    for response in stub.get('responses', []):
+        if list(response) != ['is']:
+            raise UnsupportedImposterError(
+                'Only "is" responses are supported, got {}.'.format(sorted(response)))
+        _check_keys('response', response['is'], _RESPONSE_KEYS)
+    for predicate in stub.get('predicates', []):
+        _check_predicate(predicate)
+
+
+def _check_keys(kind, config, allowed_keys):
+    if not isinstance(config, dict):
+        raise UnsupportedImposterError('Expected an object as {}, got {!r}.'.format(kind, config))
+    unsupported_keys = set(config) - allowed_keys
+    if unsupported_keys:
+        raise UnsupportedImposterError('Unsupported {} fields: {}.'.format(
+            kind, ', '.join(sorted(unsupported_keys))))
+
+
+def _check_predicate(predicate):
+    _check_keys('predicate', predicate,
+                set(_FIELD_OPERATORS) | {'exists'} | _LOGICAL_OPERATORS | _PREDICATE_OPTIONS)
+    for operator, operand in predicate.items():
+        if operator in ('and', 'or'):
+            for sub_predicate in operand:
+                _check_predicate(sub_predicate)
+        elif operator == 'not':
+            _check_predicate(operand)
+        elif operator not in _PREDICATE_OPTIONS:
+            _check_keys('"{}" predicate'.format(operator), operand, _PREDICATE_FIELDS)
+            for field, expected in operand.items():
+                if isinstance(expected, (dict, list)) and field not in _OBJECT_FIELDS:
+                    raise UnsupportedImposterError(
+                        'Only simple values are supported in predicates on "{}".'.format(field))
+
+
+def _matches(predicate, request, case_sensitive=False):
+    case_sensitive = predicate.get('caseSensitive', case_sensitive)
+    for operator, operand in predicate.items():
+        if operator == 'and':
+            matched = all(_matches(sub_predicate, request, case_sensitive)
+                          for sub_predicate in operand)
+        elif operator == 'or':
+            matched = any(_matches(sub_predicate, request, case_sensitive)
+                          for sub_predicate in operand)
+        elif operator == 'not':
+            matched = not _matches(operand, request, case_sensitive)
+        elif operator in _PREDICATE_OPTIONS:
+            continue
+        else:
+            matched = all(_field_matches(operator, expected, request.get(field), case_sensitive)
+                          for field, expected in operand.items())
+        if not matched:
+            return False
+    return True
+
+
+def _field_matches(operator, expected, actual, case_sensitive):
+    if isinstance(expected, dict):
+        actual = {_normalize(key, case_sensitive): value
+                  for key, value in (actual or {}).items()}
+        expected = {_normalize(key, case_sensitive): value for key, value in expected.items()}
+        if operator == 'deepEquals' and set(actual) != set(expected):
+            return False
+        return all(_field_matches(operator, expected_value, actual.get(key), case_sensitive)
+                   for key, expected_value in expected.items())
+    if operator == 'exists':
+        return (actual not in (None, '')) == expected
+    if isinstance(actual, list):
+        return any(_field_matches(operator, expected, value, case_sensitive) for value in actual)
+    actual = '' if actual is None else actual
+    if operator == 'matches':
+        # lowercasing the pattern would change its escapes, e.g. \D into \d
+        return re.search(_normalize(expected, True), _normalize(actual, True),
+                         0 if case_sensitive else re.IGNORECASE) is not None
+    actual = _normalize(actual, case_sensitive)
+    expected = _normalize(expected, case_sensitive)
+    return _FIELD_OPERATORS[operator](expected, actual)
+
+
+def _normalize(value, case_sensitive):
+    if isinstance(value, bool):
+        value = json.dumps(value)
+    value = str(value)
+    return value if case_sensitive else value.lower()
+
+
+class _Imposter:  # pylint: disable=too-many-instance-attributes
+    """State of an imposter: its stubs and the requests it received."""
+
+    def __init__(self, config, port, request_listener=None):
+        self.config = config
+        self.port = port
+        self.request_listener = request_listener
+        self.stubs = [_Stub(stub_config) for stub_config in config.get('stubs', [])]
+        self.requests = []
+        self.lock = threading.Lock()
+        self.record_requests = config.get('recordRequests', True)
+        self.default_response = config.get('defaultResponse', {})
+
+    def respond(self, request):
+        """
+        Args:
+            request (dict): Request in the same form as in Mountebank's API.
+
+        Returns:
+            dict: Contents of the "is" response.
+        """
+        if self.request_listener:
+            self.request_listener(self.port, request)
+        with self.lock:
+            if self.record_requests:
+                self.requests.append(request)
+            for stub in self.stubs:
+                if all(_matches(predicate, request) for predicate in stub.predicates):
+                    return dict(self.default_response, **stub.next_response())
+        return self.default_response
+
+    def clear_requests(self):
+        """Forgets the recorded requests."""
+        with self.lock:
+            self.requests = []
+
+    def change_stubs(self, command, stub_config=None, index=None):
+        """Changes a single stub, or all of them.
+
+        Args:
+            command (str): "add", "replace", "remove" or "replace_all".
+            stub_config: Configuration of the added or replacing stub.
+                A list of them for "replace_all".
+            index (int): Position of the stub. A new stub is added at the end if it's None.
+
+        Raises:
+            IndexError: If there's no stub at the index.
+        """
+        if command == 'replace_all':
+            for config in stub_config:
+                _check_stub(config)
+        elif command != 'remove':
+            _check_stub(stub_config)
+        with self.lock:
+            if command == 'add':
+                self.stubs.insert(len(self.stubs) if index is None else index, _Stub(stub_config))
+            elif command == 'replace':
+                self.stubs[index] = _Stub(stub_config)
+            elif command == 'remove':
+                del self.stubs[index]
+            else:
+                self.stubs = [_Stub(config) for config in stub_config]
+
+    def to_json(self, replayable=False):
+        """
+        Args:
+            replayable (bool): If True, then the recorded requests and links are left out.
+
+        Returns:
+            dict: Representation of the imposter, the same as in Mountebank's API.
+        """
+        imposter_json = {key: value for key, value in self.config.items() if key != 'stubs'}
+        with self.lock:
+            imposter_json.update(protocol='http', port=self.port,
+                                 numberOfRequests=len(self.requests),
+                                 stubs=[stub.config for stub in self.stubs])
+            if not replayable:
+                imposter_json['requests'] = list(self.requests)
+                imposter_json['_links'] = {'self': {'href': '/imposters/{}'.format(self.port)}}
+        return imposter_json
+
+
+class _Stub:
+    """Stub of an imposter. Cycles through its responses, like in Mountebank."""
+
+    def __init__(self, config):
+        self.config = config
+        self.predicates = config.get('predicates', [])
+        self._responses = [response['is'] for response in config.get('responses', [])] or [{}]
+        self._next_response_index = 0
+
+    def next_response(self):
+        """
+        Returns:
+            dict: Contents of the next "is" response.
+        """
+        response = self._responses[self._next_response_index]
+        self._next_response_index = (self._next_response_index + 1) % len(self._responses)
+        return response
+
+
+class _HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server whose connections are accepted by `_Engine`'s thread.
+    Each connection is handled in its own thread.
+    """
+    daemon_threads = True
+    block_on_close = False
+    allow_reuse_address = True
+
+    def __init__(self, address, handler_class, imposter=None):
+        super().__init__(address, handler_class)
+        self.imposter = imposter
+        self.engine = None
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    def server_bind(self):
+        # skipping the name lookup of HTTPServer.server_bind, which can take seconds
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address[:2]
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self._connections_lock:
+            self._connections.discard(request)
+        super().shutdown_request(request)
+
+    def close(self):
+        """Stops listening and breaks the open connections."""
+        self.server_close()
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class _ImposterHandler(http.server.BaseHTTPRequestHandler):
+    """Answers requests made to an imposter."""
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        """Records the request and sends back the response of the first matching stub."""
+        url = urllib.parse.urlsplit(self.path)
+        content_length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(content_length) if content_length else b''
+        query = {}
+        for name, value in urllib.parse.parse_qsl(url.query, keep_blank_values=True):
+            if name in query:
+                previous_values = query[name]
+                query[name] = (previous_values if isinstance(previous_values, list)
+                               else [previous_values]) + [value]
+            else:
+                query[name] = value
+        request = {
+            'requestFrom': '{}:{}'.format(*self.client_address[:2]),
+            'method': self.command,
+            'path': url.path,
+            'query': query,
+            'headers': self._get_headers(),
+            'body': body.decode('utf-8', errors='replace'),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime(
+                '%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+        }
+
+        response = self.server.imposter.respond(request)
+        response_body = response.get('body', '')
+        if not isinstance(response_body, str):
+            response_body = json.dumps(response_body)
+        response_body = response_body.encode()
+        self.send_response(response.get('statusCode', 200))
+        for name, value in (response.get('headers') or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(response_body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = do_OPTIONS = handle_request
+
+    def _get_headers(self):
+        """
+        Returns:
+            dict: Headers of the request. Values of repeated headers are lists,
+                like Mountebank gives them.
+        """
+        headers = {}
+        seen_names = set()
+        for name in self.headers.keys():
+            if name.lower() not in seen_names:
+                seen_names.add(name.lower())
+                values = self.headers.get_all(name)
+                headers[name] = values[0] if len(values) == 1 else values
+        return headers
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class _ApiHandler(http.server.BaseHTTPRequestHandler):
+    """Answers calls to the subset of Mountebank's REST API supported by the engine."""
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        """Routes the call to the engine."""
+        url = urllib.parse.urlsplit(self.path)
+        replayable = urllib.parse.parse_qs(url.query).get('replayable') == ['true']
+        path_parts = [part for part in url.path.split('/') if part]
+        try:
+            if path_parts == ['config']:
+                self._reply(200, {'version': ENGINE_VERSION, 'options': {}})
+            elif path_parts == ['imposters']:
+                self._handle_imposters(replayable)
+            elif len(path_parts) == 2 and path_parts[0] == 'imposters':
+                self._handle_imposter(int(path_parts[1]), replayable)
+            elif len(path_parts) == 3 and path_parts[0] == 'imposters' \
+                    and path_parts[2] == 'savedRequests':
+                self._handle_saved_requests(int(path_parts[1]))
+            elif len(path_parts) in (3, 4) and path_parts[0] == 'imposters' \
+                    and path_parts[2] == 'stubs':
+                self._handle_stubs(int(path_parts[1]),
+                                   int(path_parts[3]) if len(path_parts) == 4 else None)
+            else:
+                self._reply(404, _errors('no such resource', self.path))
+        except (ValueError, KeyError, TypeError) as ex:
+            self._reply(400, _errors('bad data', str(ex)))
+        except IndexError as ex:
+            self._reply(404, _errors('no such resource', str(ex)))
+        except OSError as ex:
+            self._reply(400, _errors('resource conflict', str(ex)))
+
+    def _handle_imposters(self, replayable):
+        engine = self.server.engine
+        if self.command == 'GET':
+            self._reply(200, {'imposters': engine.get_imposters(replayable)})
+        elif self.command == 'POST':
+            self._reply(201, engine.add_imposter(self._read_json()))
+        elif self.command == 'PUT':
+            self._reply(200, {'imposters': engine.replace_imposters(
+                self._read_json().get('imposters', []))})
+        elif self.command == 'DELETE':
+            self._reply(200, {'imposters': engine.replace_imposters([])})
+        else:
+            self._reply(405, _errors('method not allowed', self.command))
+
+    def _handle_imposter(self, port, replayable):
+        engine = self.server.engine
+        if self.command == 'GET':
+            imposter = engine.imposters.get(port)
+            if imposter:
+                self._reply(200, imposter.to_json(replayable))
+            else:
+                self._reply(404, _errors('no such resource', self.path))
+        elif self.command == 'DELETE':
+            self._reply(200, engine.remove_imposter(port))
+        else:
+            self._reply(405, _errors('method not allowed', self.command))
+
+    def _handle_saved_requests(self, port):
+        imposter = self.server.engine.imposters.get(port)
+        if not imposter:
+            self._reply(404, _errors('no such resource', self.path))
+        elif self.command == 'DELETE':
+            imposter.clear_requests()
+            self._reply(200, imposter.to_json())
+        else:
+            self._reply(405, _errors('method not allowed', self.command))
+
+    def _handle_stubs(self, port, index):
+        imposter = self.server.engine.imposters.get(port)
+        if not imposter:
+            self._reply(404, _errors('no such resource', self.path))
+            return
+        if index is None and self.command == 'POST':
+            body = self._read_json()
+            imposter.change_stubs('add', body['stub'], body.get('index'))
+        elif index is None and self.command == 'PUT':
+            imposter.change_stubs('replace_all', self._read_json()['stubs'])
+        elif index is not None and self.command == 'PUT':
+            imposter.change_stubs('replace', self._read_json(), index)
+        elif index is not None and self.command == 'DELETE':
+            imposter.change_stubs('remove', index=index)
+        else:
+            self._reply(405, _errors('method not allowed', self.command))
+            return
+        self._reply(200, imposter.to_json())
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = handle_request
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _read_json(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(content_length).decode() or '{}')
+
+    def _reply(self, status_code, body):
+        body = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _errors(code, message):
+    return {'errors': [{'code': code, 'message': message}]}
+
+
+class _Engine:  # pylint: disable=too-many-instance-attributes
+    """Accepts connections to the API and all the imposters with a single selector thread.
+    Listening sockets are only added to and removed from the selector by that thread,
+    other threads ask it to do that through a queue.
+
+    Args:
+        port (int): Port of the engine's API.
+        request_listener (callable): Called with an imposter's port and each request made to it,
+            before the request is answered.
+    """
+
+    def __init__(self, port, request_listener=None):
+        self.imposters = {}
+        self._request_listener = request_listener
+        self._servers = {}
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._commands = queue.Queue()
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._wakeup_receiver.setblocking(False)
+        self._selector.register(self._wakeup_receiver, selectors.EVENT_READ)
+        self._running = True
+        self._api_server = _HttpServer(('localhost', port), _ApiHandler)
+        self._api_server.engine = self
+        self._register(self._api_server)
+        self._thread = threading.Thread(target=self._run, name='mountepy-inprocess', daemon=True)
+        self._thread.start()
+
+    def get_imposters(self, replayable):
+        """
+        Returns:
+            list[dict]: Representations of all the imposters.
+        """
+        with self._lock:
+            imposters = list(self.imposters.values())
+        if replayable:
+            return [imposter.to_json(replayable=True) for imposter in imposters]
+        return [{'protocol': 'http', 'port': imposter.port,
+                 'numberOfRequests': len(imposter.requests)} for imposter in imposters]
+
+    def add_imposter(self, config):
+        """Creates an imposter and starts accepting its connections.
+
+        Returns:
+            dict: Representation of the new imposter.
+        """
+        check_imposter_config(config)
+        with self._lock:
+            if config.get('port') in self.imposters:
+                raise OSError('Port {} is already in use.'.format(config['port']))
+            server = _HttpServer(('', config.get('port') or 0), _ImposterHandler)
+            imposter = _Imposter(config, server.server_address[1], self._request_listener)
+            server.imposter = imposter
+            self.imposters[imposter.port] = imposter
+            self._servers[imposter.port] = server
+        self._call(self._register, server)
+        return imposter.to_json()
+
+    def remove_imposter(self, port):
+        """Closes an imposter.
+
+        Returns:
+            dict: Replayable representation of the imposter. Empty if there was no imposter.
+        """
+        with self._lock:
+            imposter = self.imposters.pop(port, None)
+            server = self._servers.pop(port, None)
+        if not imposter:
+            return {}
+        self._call(self._unregister, server)
+        return imposter.to_json(replayable=True)
+
+    def replace_imposters(self, configs):
+        """Closes all the imposters and creates new ones.
+
+        Returns:
+            list[dict]: Replayable representations of the closed imposters if no new ones
+                were given, otherwise representations of the new imposters.
+        """
+        for config in configs:
+            check_imposter_config(config)
+        removed_imposters = [self.remove_imposter(port) for port in list(self.imposters)]
+        if not configs:
+            return removed_imposters
+        return [self.add_imposter(config) for config in configs]
+
+    def close(self):
+        """Closes all the imposters and the API, then stops the thread."""
+        self.replace_imposters([])
+        self._call(self._unregister, self._api_server)
+        self._running = False
+        self._wakeup_sender.send(b'\0')
+        self._thread.join()
+        self._selector.close()
+        self._wakeup_receiver.close()
+        self._wakeup_sender.close()
+
+    def _call(self, function, *args):
+        done = threading.Event()
+        self._commands.put((function, args, done))
+        self._wakeup_sender.send(b'\0')
+        done.wait()
+
+    def _register(self, server):
+        server.socket.setblocking(False)
+        self._selector.register(server.socket, selectors.EVENT_READ, server)
+
+    def _unregister(self, server):
+        self._selector.unregister(server.socket)
+        server.close()
+
+    def _run(self):
+        while self._running:
+            for key, _ in self._selector.select():
+                if key.fileobj is self._wakeup_receiver:
+                    self._run_commands()
+                else:
+                    self._accept(key.data)
+
+    def _run_commands(self):
+        with contextlib.suppress(BlockingIOError):
+            while self._wakeup_receiver.recv(4096):
+                pass
+        while not self._commands.empty():
+            function, args, done = self._commands.get()
+            try:
+                function(*args)
+            finally:
+                done.set()
+
+    @staticmethod
+    def _accept(server):
+        try:
+            connection, client_address = server.socket.accept()
+        except OSError:
+            # the client is already gone
+            return
+        connection.setblocking(True)
+        server.process_request(connection, client_address)
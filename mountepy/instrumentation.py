@@ -0,0 +1,289 @@
+"""
+Events about what mountepy is doing and how long it takes, so that one can tell
+where the time of slow tests goes.
+"""
+
+import collections
+import json
+import re
+import threading
+
+SERVICE_SPAWN = 'service_spawn'
+SERVICE_READY = 'service_ready'
+SERVICE_STOP = 'service_stop'
+PORT_WAIT = 'port_wait'
+GROUP_SERVICE = 'group_service'
+HTTP_CALL = 'http_call'
+
+_listeners = []
+_listeners_lock = threading.Lock()
+_IMPOSTER_URL_PATTERN = re.compile(r'^(\w+://[^/]+)/imposters/(\d+)')
+
+
+class Event(collections.namedtuple('Event', 'kind, name, duration, details')):
+    """Something that mountepy did.
+
+    Attributes:
+        kind (str): One of:
+
+            - `SERVICE_SPAWN` - a `mountepy.HttpService` process was spawned,
+              `duration` is how long spawning it took.
+            - `SERVICE_READY` - a service became ready,
+              `duration` is the time from its spawn.
+            - `SERVICE_STOP` - a service was stopped, `duration` is how long it took.
+            - `PORT_WAIT` - a port started accepting connections, `duration` is how long
+              it was waited for and `details` have the number of connection `attempts`.
+            - `GROUP_SERVICE` - a service of a `mountepy.ServiceGroup` started,
+              `details` have its `start_time` and `ready_time` in the group's start.
+            - `HTTP_CALL` - a call to Mountebank (or another service) was made.
+              `details` have the `method`, `url`, `status_code` (None if the call failed),
+              `request_size` and `response_size` (in bytes, None if unknown).
+
+        name (str): What the event is about, e.g. a service's command and port,
+            or a "host:port" pair.
+        duration (float): How long (in seconds) the operation took.
+        details (dict): Additional information, depending on the kind.
+    """
+
+
+def add_listener(listener):
+    """Makes a function receive all the events, from any thread.
+    Listeners should be quick, because they're called while the operations are being made.
+
+    Args:
+        listener (callable): Takes an `Event`.
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Stops a listener from receiving the events.
+
+    Args:
+        listener (callable): A listener given to `add_listener`.
+    """
+    with _listeners_lock:
+        _listeners.remove(listener)
+
+
+def is_enabled():
+    """
+    Returns:
+        bool: True if there are any listeners, so the events should be made.
+            Lets the callers skip measuring things no one is interested in.
+    """
+    return bool(_listeners)
+
+
+def emit(kind, name, duration, **details):
+    """Sends an event to all the listeners.
+
+    Args:
+        kind (str): Kind of the event.
+        name (str): What the event is about.
+        duration (float): How long (in seconds) the operation took.
+        **details: Additional information.
+    """
+    if not _listeners:
+        return
+    event = Event(kind, name, duration, details)
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(event)
+
+
+class Report:
+    """Listener aggregating the events into statistics of the services and imposters.
+    It can be used as a context manager, so it listens only inside a block, e.g.::
+
+        with Report() as report:
+            run_tests()
+        for line in report.format():
+            print(line)
+
+    Services are known by their commands and ports. HTTP calls to
+    "<Mountebank URL>/imposters/<port>" are counted towards that imposter,
+    and the other calls towards the called host.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = collections.defaultdict(_ServiceStats)
+        self._targets = collections.defaultdict(_HttpStats)
+        self._ports = collections.defaultdict(_PortStats)
+
+    def __call__(self, event):
+        with self._lock:
+            if event.kind == HTTP_CALL:
+                self._targets[_call_target(event.details['url'])].add(event)
+            elif event.kind == PORT_WAIT:
+                self._ports[event.name].add(event)
+            elif event.kind in (SERVICE_SPAWN, SERVICE_READY, SERVICE_STOP):
+                self._services[event.name].add(event)
+
+    def slowest_services(self, count=10):
+        """
+        Args:
+            count (int): Maximum number of the services.
+
+        Returns:
+            list[dict]: Statistics of the services that took the most time
+                to spawn, get ready and stop, slowest first.
+        """
+        with self._lock:
+            stats = [dict(stats.to_dict(), name=name) for name, stats in self._services.items()]
+        return sorted(stats, key=lambda stats: stats['total_time'], reverse=True)[:count]
+
+    def slowest_imposters(self, count=10):
+        """
+        Args:
+            count (int): Maximum number of the imposters (or other called hosts).
+
+        Returns:
+            list[dict]: Statistics of the HTTP calls to the imposters that took the most
+                time, slowest first.
+        """
+        with self._lock:
+            stats = [dict(stats.to_dict(), name=name) for name, stats in self._targets.items()]
+        return sorted(stats, key=lambda stats: stats['total_time'], reverse=True)[:count]
+
+    def port_waits(self):
+        """
+        Returns:
+            list[dict]: Statistics of waiting for the ports, the longest waits first.
+        """
+        with self._lock:
+            stats = [dict(stats.to_dict(), name=name) for name, stats in self._ports.items()]
+        return sorted(stats, key=lambda stats: stats['total_time'], reverse=True)
+
+    def to_dict(self, count=10):
+        """
+        Args:
+            count (int): Maximum number of the services and imposters.
+
+        Returns:
+            dict: All of the statistics, ready to be saved as JSON.
+        """
+        return {'services': self.slowest_services(count),
+                'imposters': self.slowest_imposters(count),
+                'port_waits': self.port_waits()[:count]}
+
+    def save_json(self, path, count=10):
+        """Saves the statistics (see `to_dict`) in a JSON file."""
+        with open(path, 'w') as report_file:
+            json.dump(self.to_dict(count), report_file, indent=2)
+
+    def format(self, count=10):
+        """
+        Args:
+            count (int): Maximum number of the services and imposters.
+
+        Returns:
+            list[str]: Lines of a human-readable summary of the slowest services and imposters.
+        """
+        lines = ['slowest services (spawn / ready / stop, seconds):']
+        for stats in self.slowest_services(count):
+            lines.append('  {:8.3f} {:8.3f} {:8.3f}  {}'.format(
+                stats['spawn_time'], stats['ready_time'], stats['stop_time'], stats['name']))
+        lines.append('slowest imposters (calls, seconds, bytes sent / received):')
+        for stats in self.slowest_imposters(count):
+            lines.append('  {:8d} {:8.3f} {:10d} {:10d}  {}'.format(
+                stats['calls'], stats['total_time'], stats['request_bytes'],
+                stats['response_bytes'], stats['name']))
+        return lines
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        remove_listener(self)
+
+
+class _ServiceStats:
+    """Statistics of starting and stopping a service."""
+
+    _ATTRIBUTES = {SERVICE_SPAWN: 'spawn_time', SERVICE_READY: 'ready_time',
+                   SERVICE_STOP: 'stop_time'}
+
+    def __init__(self):
+        self.starts = 0
+        self.spawn_time = 0.0
+        self.ready_time = 0.0
+        self.stop_time = 0.0
+
+    def add(self, event):
+        """Counts an event in the statistics."""
+        if event.kind == SERVICE_SPAWN:
+            self.starts += 1
+        attribute = self._ATTRIBUTES[event.kind]
+        setattr(self, attribute, getattr(self, attribute) + event.duration)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The statistics.
+        """
+        return {'starts': self.starts, 'spawn_time': self.spawn_time,
+                'ready_time': self.ready_time, 'stop_time': self.stop_time,
+                'total_time': self.ready_time + self.stop_time}
+
+
+class _HttpStats:
+    """Statistics of HTTP calls to an imposter or a host."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failed_calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def add(self, event):
+        """Counts an event in the statistics."""
+        self.calls += 1
+        if event.details['status_code'] is None or event.details['status_code'] >= 400:
+            self.failed_calls += 1
+        self.total_time += event.duration
+        self.max_time = max(self.max_time, event.duration)
+        self.request_bytes += event.details['request_size'] or 0
+        self.response_bytes += event.details['response_size'] or 0
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The statistics.
+        """
+        return dict(self.__dict__)
+
+
+class _PortStats:
+    """Statistics of waiting for a port."""
+
+    def __init__(self):
+        self.waits = 0
+        self.attempts = 0
+        self.total_time = 0.0
+
+    def add(self, event):
+        """Counts an event in the statistics."""
+        self.waits += 1
+        self.attempts += event.details['attempts']
+        self.total_time += event.duration
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The statistics.
+        """
+        return dict(self.__dict__)
+
+
+def _call_target(url):
+    match = _IMPOSTER_URL_PATTERN.match(url)
+    if match:
+        return 'imposter {} on {}'.format(match.group(2), match.group(1))
+    return re.sub(r'^(\w+://[^/]+).*$', r'\1', url)
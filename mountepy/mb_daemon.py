@@ -0,0 +1,542 @@
+"""
+A Mountebank process living longer than a single test session.
+Later sessions attach to it, instead of waiting for a new Mountebank to boot.
+
+The daemon is a small supervisor process running Mountebank as its child.
+It shuts Mountebank down when no session has been using it for some time.
+It can also be controlled from the command line::
+
+    python -m mountepy.mb_daemon start
+    python -m mountepy.mb_daemon stop
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import port_for
+import requests
+
+from .http_client import DEFAULT_POOL_SIZE
+from .http_service import wait_for_ports
+from .mb_mgmt import CACHE_DIR, file_lock, get_mb_command, get_mb_version
+from .mountebank import MountebankWrapper
+
+DAEMON_DIR = os.path.join(CACHE_DIR, 'daemon')
+DEFAULT_IDLE_TIMEOUT = 600.0
+DEFAULT_FIRST_IMPOSTER_PORT = 30000
+DEFAULT_PORTS_PER_WORKER = 500
+
+_PID_FILE = 'mb.pid'
+_PORT_FILE = 'mb.port'
+_INFO_FILE = 'mb.json'
+_LOG_FILE = 'mb.log'
+_LOCK_FILE = 'daemon.lock'
+_LAST_USED_FILE = 'last_used'
+_LEASES_DIR = 'leases'
+_CHECK_INTERVAL = 0.5
+# how long (in seconds) a daemon that failed to start gets to clean up after a SIGTERM
+_SUPERVISOR_STOP_TIMEOUT = 45.0
+
+_log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class DaemonMountebank(MountebankWrapper):
+    """Uses a Mountebank daemon, starting it if none is running.
+    Starting and stopping this object doesn't start or stop the Mountebank process,
+    it only resets the imposters, like with `mountepy.ExistingMountebank`.
+
+    Args:
+        port (int): Port on which a new daemon will listen. If the daemon is already running,
+            its port is used. If not provided, a random port is chosen.
+        idle_timeout (float): After how many seconds of not being used by any session
+            a new daemon will shut down. None means that it needs to be stopped explicitly.
+        daemon_dir (str): Directory with the daemon's pidfile, port file and logs.
+        pool_size (int): How many keep-alive connections to Mountebank can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to Mountebank.
+    """
+
+    def __init__(self, port=None, idle_timeout=DEFAULT_IDLE_TIMEOUT,  # pylint: disable=too-many-arguments
+                 daemon_dir=None, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.idle_timeout = idle_timeout
+        self.daemon_dir = daemon_dir or DAEMON_DIR
+        daemon_info = read_daemon_info(self.daemon_dir)
+        if daemon_info:
+            port = daemon_info['port']
+        super().__init__('localhost', port or port_for.select_random(),
+                         pool_size=pool_size, timeout=timeout)
+        self._lease_path = None
+
+    def start(self, timeout=10.0):  # pylint: disable=arguments-differ
+        """Attaches to a running daemon or starts a new one, then removes its imposters.
+
+        Args:
+            timeout (float): How long (in seconds) to wait for a new daemon to start.
+
+        Raises:
+            `MountebankDaemonError`: If the daemon didn't start.
+        """
+        os.makedirs(self.daemon_dir, exist_ok=True)
+        mb_command = get_mb_command()
+        with _locked(self.daemon_dir):
+            daemon_info = _ensure_daemon(mb_command, self.port, self.idle_timeout,
+                                         self.daemon_dir, timeout)
+            # taken while still holding the lock, so the daemon can't shut down in the meantime
+            self._lease_path = _take_lease(self.daemon_dir)
+        self.port = daemon_info['port']
+        self._imposters_url = 'http://{}:{}/imposters'.format(self.host, self.port)
+        self.reset()
+
+    def stop(self):
+        """Removes the imposters and detaches from the daemon. The daemon keeps running."""
+        try:
+            self.reset()
+        finally:
+            _release_lease(self.daemon_dir, self._lease_path)
+            self._lease_path = None
+
+
+class SharedMountebank(DaemonMountebank):
+    """Mountebank daemon shared by many test processes, e.g. pytest-xdist workers.
+    Each worker gets its own range of imposter ports, and it only sees, replaces and removes
+    the imposters from its range (and the ones it created itself).
+    Takes the same arguments as `DaemonMountebank`, and:
+
+    Args:
+        worker_id (str): Identifier of the worker, e.g. "gw3". Taken from
+            PYTEST_XDIST_WORKER environment variable if not provided.
+            The number at its end selects the worker's port range.
+        first_imposter_port (int): Start of the port range of the first worker.
+        ports_per_worker (int): Size of each worker's port range.
+
+    Attributes:
+        imposter_ports (range): Ports reserved for this worker's imposters.
+    """
+
+    def __init__(self, port=None, worker_id=None,  # pylint: disable=too-many-arguments
+                 first_imposter_port=DEFAULT_FIRST_IMPOSTER_PORT,
+                 ports_per_worker=DEFAULT_PORTS_PER_WORKER, **kwargs):
+        worker_index = get_worker_index(worker_id)
+        range_start = first_imposter_port + worker_index * ports_per_worker
+        self.imposter_ports = range(range_start, range_start + ports_per_worker)
+        self._all_imposter_ports = range(
+            first_imposter_port,
+            first_imposter_port + max(_get_worker_count(), worker_index + 1) * ports_per_worker)
+        if port is None:
+            port = _select_port_outside(self._all_imposter_ports)
+        super().__init__(port=port, **kwargs)
+        self._next_port_index = 0
+
+    def add_imposter(self, imposter_cfg):
+        """Adds an imposter to Mountebank.
+        See `mountepy.mountebank.MountebankWrapper.add_imposter`.
+
+        Raises:
+            ValueError: If the imposter's port belongs to another worker.
+        """
+        port = imposter_cfg['port']
+        if port in self._all_imposter_ports and port not in self.imposter_ports:
+            raise ValueError('Port {} belongs to another worker, this one can use {}.'.format(
+                port, self.imposter_ports))
+        return super().add_imposter(imposter_cfg)
+
+    def replace_all_imposters(self, imposter_cfgs, keep_unchanged=False):
+        """Replaces all the imposters of this worker with the given ones.
+        Imposters of the other workers are left untouched.
+        See `mountepy.mountebank.MountebankWrapper.replace_all_imposters`.
+        """
+        own_ports = self._get_imposter_ports()
+        unchanged_ports = set()
+        if keep_unchanged:
+            unchanged_ports = {
+                imposter_cfg['port'] for imposter_cfg in imposter_cfgs
+                if imposter_cfg['port'] in own_ports
+                and self._imposter_configs.get(imposter_cfg['port']) == imposter_cfg}
+        return self._update_imposters(imposter_cfgs, own_ports, unchanged_ports)
+
+    def reset(self):
+        """Removes the imposters of this worker."""
+        for port in self._get_imposter_ports():
+            self.client.delete('{}/{}'.format(self._imposters_url, port)).raise_for_status()
+        self._imposter_configs.clear()
+
+    def _list_imposters(self):
+        return [imposter for imposter in super()._list_imposters()
+                if imposter['port'] in self.imposter_ports
+                or imposter['port'] in self._imposter_configs]
+
+    def _select_port(self):
+        for _ in self.imposter_ports:
+            port = self.imposter_ports[self._next_port_index]
+            self._next_port_index = (self._next_port_index + 1) % len(self.imposter_ports)
+            if port not in self._imposter_configs and port_for.is_available(port):
+                return port
+        raise MountebankDaemonError('No free ports left in range {}.'.format(self.imposter_ports))
+
+
+class MountebankDaemonError(Exception):
+    """Means that the Mountebank daemon couldn't be started or stopped."""
+
+
+def ensure_daemon(port=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, daemon_dir=None, timeout=10.0):
+    """Makes sure that a healthy Mountebank daemon is running.
+    A daemon that doesn't respond, or that runs a different Mountebank command or version
+    than the one that would be started now, is replaced with a new one.
+
+    Args:
+        port (int): Port for a new daemon. Random if not provided.
+        idle_timeout (float): After how many seconds of not being used a new daemon shuts down.
+        daemon_dir (str): Directory with the daemon's files.
+        timeout (float): How long (in seconds) to wait for a new daemon to start.
+
+    Returns:
+        dict: Information about the daemon: its "pid", "port", "command" and "version".
+    """
+    daemon_dir = daemon_dir or DAEMON_DIR
+    os.makedirs(daemon_dir, exist_ok=True)
+    mb_command = get_mb_command()
+    # only one session at a time may start the daemon
+    with _locked(daemon_dir):
+        return _ensure_daemon(mb_command, port, idle_timeout, daemon_dir, timeout)
+
+
+def _ensure_daemon(mb_command, port, idle_timeout, daemon_dir, timeout):
+    """`ensure_daemon` for a caller holding the daemon's lock."""
+    daemon_info = read_daemon_info(daemon_dir)
+    if daemon_info:
+        if daemon_info['command'] == mb_command and _is_responding(daemon_info,
+                                                                   get_mb_version()):
+            _log.debug('Attaching to Mountebank daemon %s', daemon_info)
+            return daemon_info
+        _log.info('Replacing stale Mountebank daemon %s', daemon_info)
+        _stop_daemon_process(daemon_dir, daemon_info['pid'], timeout)
+    return _start_daemon(mb_command, port or port_for.select_random(),
+                         idle_timeout, daemon_dir, timeout)
+
+
+def stop_daemon(daemon_dir=None, timeout=10.0):
+    """Stops the Mountebank daemon if it's running.
+
+    Args:
+        daemon_dir (str): Directory with the daemon's files.
+        timeout (float): How long (in seconds) to wait for the daemon to stop.
+
+    Returns:
+        bool: True if a daemon was stopped, False if none was running.
+    """
+    daemon_dir = daemon_dir or DAEMON_DIR
+    if not os.path.isdir(daemon_dir):
+        return False
+    with _locked(daemon_dir):
+        pid = _read_pid(daemon_dir)
+        if pid is None or not _is_process_alive(pid):
+            _remove_daemon_files(daemon_dir)
+            return False
+        _stop_daemon_process(daemon_dir, pid, timeout)
+        return True
+
+
+def get_worker_index(worker_id=None):
+    """
+    Args:
+        worker_id (str): Identifier of a test worker process, e.g. "gw3".
+            Taken from PYTEST_XDIST_WORKER environment variable if not provided.
+
+    Returns:
+        int: Number of the worker. 0 if the tests aren't run by many workers.
+    """
+    worker_id = worker_id or os.environ.get('PYTEST_XDIST_WORKER', '')
+    digits = len(worker_id) - len(worker_id.rstrip('0123456789'))
+    return int(worker_id[-digits:]) if digits else 0
+
+
+def _get_worker_count():
+    try:
+        return int(os.environ['PYTEST_XDIST_WORKER_COUNT'])
+    except (KeyError, ValueError):
+        return 1
+
+
+def _select_port_outside(ports):
+    while True:
+        port = port_for.select_random()
+        if port not in ports:
+            return port
+
+
+def read_daemon_info(daemon_dir=None):
+    """
+    Args:
+        daemon_dir (str): Directory with the daemon's files.
+
+    Returns:
+        dict: Information about the running daemon: its "pid", "port", "command" and "version".
+            None if the daemon isn't running.
+    """
+    daemon_dir = daemon_dir or DAEMON_DIR
+    pid = _read_pid(daemon_dir)
+    if pid is None or not _is_process_alive(pid):
+        return None
+    try:
+        with open(os.path.join(daemon_dir, _PORT_FILE)) as port_file:
+            port = int(port_file.read())
+        with open(os.path.join(daemon_dir, _INFO_FILE)) as info_file:
+            daemon_info = json.load(info_file)
+    except (OSError, ValueError):
+        return None
+    daemon_info.update(pid=pid, port=port)
+    return daemon_info
+
+
+def _start_daemon(mb_command, port, idle_timeout, daemon_dir, timeout):
+    command = [sys.executable, '-m', 'mountepy.mb_daemon', 'serve',
+               '--dir', daemon_dir, '--port', str(port),
+               '--idle-timeout', str(idle_timeout or 0), '--'] + mb_command
+
+    env = dict(os.environ)
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_parent] + [path for path in [env.get('PYTHONPATH')] if path])
+    # the last use is counted from the start, so that an unused daemon doesn't live forever
+    _touch(os.path.join(daemon_dir, _LAST_USED_FILE))
+    with open(os.path.join(daemon_dir, _LOG_FILE), 'ab') as log_file:
+        # the daemon outlives this call, so its handle is only cleaned up if it doesn't start
+        supervisor = subprocess.Popen(  # pylint: disable=consider-using-with
+            command, env=env, stdin=subprocess.DEVNULL, stdout=log_file, stderr=log_file,
+            start_new_session=True)
+
+    try:
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < timeout:
+            if supervisor.poll() is not None:
+                raise MountebankDaemonError(
+                    'Mountebank daemon exited with code {}. See {} for details.'.format(
+                        supervisor.returncode, os.path.join(daemon_dir, _LOG_FILE)))
+            daemon_info = read_daemon_info(daemon_dir)
+            if daemon_info and daemon_info['pid'] == supervisor.pid:
+                _log.info('Started Mountebank daemon %s', daemon_info)
+                return daemon_info
+            time.sleep(0.01)
+        raise MountebankDaemonError(
+            'Mountebank daemon did not start in {} seconds.'.format(timeout))
+    except BaseException:
+        _stop_supervisor(supervisor)
+        raise
+
+
+def _stop_supervisor(supervisor):
+    if supervisor.poll() is None:
+        supervisor.terminate()
+    try:
+        supervisor.wait(_SUPERVISOR_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        supervisor.kill()
+        supervisor.wait()
+
+
+def _stop_daemon_process(daemon_dir, pid, timeout):
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    start_time = time.perf_counter()
+    while _is_process_alive(pid):
+        if time.perf_counter() - start_time > timeout:
+            raise MountebankDaemonError(
+                'Mountebank daemon (PID {}) did not stop in {} seconds.'.format(pid, timeout))
+        time.sleep(0.01)
+    _remove_daemon_files(daemon_dir)
+
+
+def _is_responding(daemon_info, installed_version):
+    """
+    Returns:
+        bool: True if the daemon responds and runs the installed version of Mountebank
+            (if it's known), e.g. it wasn't upgraded under the same command.
+    """
+    try:
+        resp = requests.get('http://localhost:{}/config'.format(daemon_info['port']), timeout=1.0)
+        resp.raise_for_status()
+        return installed_version is None or resp.json().get('version') == installed_version
+    except (requests.RequestException, ValueError):
+        return False
+
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists, but belongs to someone else
+        return True
+    # a process that already exited, but wasn't collected by its parent, isn't alive
+    with contextlib.suppress(OSError):
+        with open('/proc/{}/stat'.format(pid)) as stat_file:
+            return stat_file.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    return True
+
+
+def _read_pid(daemon_dir):
+    try:
+        with open(os.path.join(daemon_dir, _PID_FILE)) as pid_file:
+            return int(pid_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _take_lease(daemon_dir):
+    leases_dir = os.path.join(daemon_dir, _LEASES_DIR)
+    os.makedirs(leases_dir, exist_ok=True)
+    lease_fd, lease_path = tempfile.mkstemp(prefix='{}-'.format(os.getpid()), dir=leases_dir)
+    os.close(lease_fd)
+    return lease_path
+
+
+def _release_lease(daemon_dir, lease_path):
+    _touch(os.path.join(daemon_dir, _LAST_USED_FILE))
+    if lease_path:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lease_path)
+
+
+def _is_idle(daemon_dir, idle_timeout):
+    leases_dir = os.path.join(daemon_dir, _LEASES_DIR)
+    with contextlib.suppress(FileNotFoundError):
+        for lease in os.listdir(leases_dir):
+            if _is_process_alive(int(lease.split('-')[0])):
+                return False
+            # the session died without releasing the lease
+            _release_lease(daemon_dir, os.path.join(leases_dir, lease))
+    try:
+        last_used = os.path.getmtime(os.path.join(daemon_dir, _LAST_USED_FILE))
+    except FileNotFoundError:
+        return True
+    return time.time() - last_used > idle_timeout
+
+
+def _remove_daemon_files(daemon_dir):
+    for file_name in (_PID_FILE, _PORT_FILE, _INFO_FILE):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(daemon_dir, file_name))
+
+
+def _write_file(path, content):
+    # written through a temporary file, so that readers never see a partial file
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w') as temp_file:
+        temp_file.write(content)
+    os.replace(temp_path, path)
+
+
+def _touch(path):
+    with open(path, 'a'):
+        os.utime(path)
+
+
+def _locked(daemon_dir, blocking=True):
+    return file_lock(os.path.join(daemon_dir, _LOCK_FILE), blocking)
+
+
+def _serve(daemon_dir, port, idle_timeout, mb_command):
+    """Runs Mountebank and supervises it until it's idle for too long or the daemon is stopped."""
+    stopping = []
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *args: stopping.append(True))
+
+    with subprocess.Popen(mb_command + ['--mock', '--port', str(port)]) as mb_process:
+        try:
+            wait_for_ports([('localhost', port)], timeout=30.0, processes=[mb_process])
+            resp = requests.get('http://localhost:{}/config'.format(port), timeout=5.0)
+            resp.raise_for_status()
+            _write_file(os.path.join(daemon_dir, _INFO_FILE), json.dumps(
+                {'command': mb_command, 'version': resp.json().get('version')}))
+            _write_file(os.path.join(daemon_dir, _PORT_FILE), str(port))
+            # the pidfile is written last, because it marks the daemon as ready
+            _write_file(os.path.join(daemon_dir, _PID_FILE), str(os.getpid()))
+            _log.info('Mountebank daemon serving on port %s', port)
+
+            while not stopping and mb_process.poll() is None:
+                if idle_timeout is not None and _shut_down_if_idle(daemon_dir, idle_timeout,
+                                                                   mb_process):
+                    _log.info('Mountebank daemon idle for %s seconds, shut down', idle_timeout)
+                    break
+                time.sleep(_CHECK_INTERVAL)
+        finally:
+            if _read_pid(daemon_dir) == os.getpid():
+                _remove_daemon_files(daemon_dir)
+            _stop_mountebank(mb_process)
+
+
+def _shut_down_if_idle(daemon_dir, idle_timeout, mb_process):
+    """Checks if the daemon is idle and stops Mountebank if it is.
+    It's done holding the lock, so no session attaches to the daemon in the meantime
+    and a session starting a new daemon waits for the port to be freed.
+    If someone else holds the lock, the daemon is about to be used or stopped,
+    so it's not treated as idle.
+
+    Returns:
+        bool: True if the daemon was idle.
+    """
+    try:
+        with _locked(daemon_dir, blocking=False):
+            if not _is_idle(daemon_dir, idle_timeout):
+                return False
+            _remove_daemon_files(daemon_dir)
+            _stop_mountebank(mb_process)
+            return True
+    except BlockingIOError:
+        return False
+
+
+def _stop_mountebank(mb_process):
+    if mb_process.poll() is None:
+        mb_process.send_signal(signal.SIGINT)
+        try:
+            mb_process.wait(10.0)
+        except subprocess.TimeoutExpired:
+            mb_process.kill()
+            mb_process.wait()
+
+
+def main(args=None):
+    """Command line interface of the daemon."""
+    parser = argparse.ArgumentParser(prog='python -m mountepy.mb_daemon',
+                                     description='Controls a long-lived Mountebank daemon.')
+    parser.add_argument('action', choices=['start', 'stop', 'status', 'serve'])
+    parser.add_argument('--dir', default=DAEMON_DIR, help="directory with the daemon's files")
+    parser.add_argument('--port', type=int, help='port for a new daemon')
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help='seconds of not being used after which the daemon shuts down, '
+                             '0 means never')
+    parser.epilog = 'Command starting Mountebank can be given to "serve" after "--".'
+    args = sys.argv[1:] if args is None else args
+    mb_command = args[args.index('--') + 1:] if '--' in args else None
+    args = parser.parse_args(args[:args.index('--')] if '--' in args else args)
+    idle_timeout = args.idle_timeout or None
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.action == 'serve':
+        _serve(args.dir, args.port or port_for.select_random(), idle_timeout,
+               mb_command or get_mb_command())
+    elif args.action == 'start':
+        print(json.dumps(ensure_daemon(args.port, idle_timeout, args.dir)))
+    elif args.action == 'stop':
+        if not stop_daemon(args.dir):
+            print('Mountebank daemon is not running.')
+    else:
+        daemon_info = read_daemon_info(args.dir)
+        print(json.dumps(daemon_info) if daemon_info else 'Mountebank daemon is not running.')
+        return 0 if daemon_info else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,16 +3,40 @@ Management of Mountebank installation.
 Can detect Mountebank installed in the system and also download and setup a standalone distribution
 """
 
+import contextlib
+import fcntl
 from functools import lru_cache
+import hashlib
+import json
 import logging
 import os
+import shutil
 import subprocess
 import tarfile
-import urllib
+import tempfile
+import urllib.parse
+import urllib.request
 
 
 CACHE_DIR = os.path.expanduser('~/.cache/mountepy')
 MB_INSTALL_CHECK_CMD = ['mb', 'help']
+MB_ARCHIVE_URL = 'https://s3.amazonaws.com/mountebank/v1.4/mountebank-v1.4.3-linux-x64.tar.gz'
+# SHA-256 hex digest of the archive at `MB_ARCHIVE_URL`, checked whenever it's downloaded.
+# Until it's pinned, the default download needs the digest from `MB_ARCHIVE_SHA256_ENV`
+# or an explicit opt-out of the verification.
+MB_ARCHIVE_SHA256 = None
+# environment variables that let machines without internet access install from a mirror
+# or a local copy of the archive
+MB_ARCHIVE_ENV = 'MOUNTEPY_MB_ARCHIVE'
+MB_ARCHIVE_SHA256_ENV = 'MOUNTEPY_MB_ARCHIVE_SHA256'
+# set it to "1" to install an archive without a known digest
+MB_ARCHIVE_UNVERIFIED_ENV = 'MOUNTEPY_MB_ARCHIVE_UNVERIFIED'
+# where the detected command is kept for the next processes
+COMMAND_CACHE_PATH = os.path.join(CACHE_DIR, 'mb_command.json')
+
+_INSTALL_LOCK_FILE = 'install.lock'
+_STAGING_DIR_PREFIX = '.install-'
+_READ_CHUNK_SIZE = 64 * 1024
 
 _log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
@@ -23,15 +47,55 @@ def get_mb_command():
     Ensures that either Mountebank installation or standalone distribution is available.
     Will trigger Mountebank download if necessary.
 
+    The command is saved in `COMMAND_CACHE_PATH`, along with the paths and modification times
+    of the files it runs. Later processes only need to check those with `os.stat`,
+    without running anything. The command is detected again if any of them changed.
+
     Returns:
         list[str]: Command (Popen-compatible) that starts Mountebank on this system.
     """
+    mb_command = _read_command_cache(COMMAND_CACHE_PATH)
+    if mb_command is None:
+        mb_command = _detect_mb_command()
+        _write_command_cache(COMMAND_CACHE_PATH, mb_command)
+    return mb_command
+
+
+@lru_cache(1)
+def get_mb_version():
+    """Gets the version of the Mountebank started by `get_mb_command`.
+    It's cached in `COMMAND_CACHE_PATH` along with the command, so Mountebank is only run
+    to check it again when the installation changes.
+
+    Returns:
+        str: The version, e.g. "1.4.3". None if it couldn't be checked.
+    """
+    mb_command = get_mb_command()
+    cache = _read_cache(COMMAND_CACHE_PATH)
+    if cache and cache['command'] == mb_command and cache.get('version'):
+        return cache['version']
+    version = _detect_mb_version(mb_command)
+    if version:
+        _write_command_cache(COMMAND_CACHE_PATH, mb_command, version)
+    return version
+
+
+def _detect_mb_version(mb_command):
+    try:
+        output = subprocess.check_output(mb_command + ['--version'],
+                                         stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        _log.debug("Mountebank version couldn't be checked.", exc_info=True)
+        return None
+    words = output.decode(errors='replace').split()
+    return words[-1] if words else None
+
+
+def _detect_mb_command():
     if _check_mb_install():
         return ['mb']
     else:
-        if not os.path.exists(CACHE_DIR):
-            _setup_standalone()
-        mb_dir = _get_mb_dir(CACHE_DIR)
+        mb_dir = install_standalone()
         node_path = _get_node_path(mb_dir)
         mb_exe_path = os.path.join(mb_dir, 'mountebank/bin/mb')
         mb_command = [node_path, mb_exe_path]
@@ -39,17 +103,212 @@ def get_mb_command():
         return mb_command
 
 
-def _setup_standalone():
-    """Downloads and sets up a standalone distribution Mountebank.
-    Standalone distribution also contains NodeJS.
+def install_standalone(archive=None, sha256=None, cache_dir=None, allow_unverified=None):
+    """Sets up a standalone distribution of Mountebank (which also contains NodeJS),
+    unless it's already there.
+    It can be called by many processes (e.g. parallel test workers) at once, only one of them
+    will install the distribution. The archive is streamed straight into the extraction,
+    into a staging directory that is moved into place only when everything is unpacked and
+    verified, so no one sees a partial distribution.
+
+    Args:
+        archive (str): URL (e.g. of a mirror) or a local path of the distribution archive.
+            Taken from the `MB_ARCHIVE_ENV` environment variable by default,
+            or `MB_ARCHIVE_URL` if it isn't set.
+        sha256 (str): Expected SHA-256 hex digest of the archive. Taken from
+            the `MB_ARCHIVE_SHA256_ENV` environment variable by default,
+            or `MB_ARCHIVE_SHA256` for the archive at `MB_ARCHIVE_URL`.
+        cache_dir (str): Where the distribution is set up. `CACHE_DIR` by default.
+        allow_unverified (bool): Whether an archive without a known digest can be installed.
+            By default it can only if the `MB_ARCHIVE_UNVERIFIED_ENV` environment variable
+            is set to "1".
+
+    Returns:
+        str: Directory of the distribution.
+
+    Raises:
+        MBStandaloneBrokenError: If the archive doesn't match the digest
+            or doesn't contain a Mountebank distribution.
+        ValueError: If the archive's digest isn't known and unverified archives aren't allowed.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    if _is_standalone_set_up(cache_dir):
+        return _get_mb_dir(cache_dir)
+    archive = archive or os.environ.get(MB_ARCHIVE_ENV) or MB_ARCHIVE_URL
+    sha256 = sha256 or os.environ.get(MB_ARCHIVE_SHA256_ENV) or (
+        MB_ARCHIVE_SHA256 if archive == MB_ARCHIVE_URL else None)
+    if allow_unverified is None:
+        allow_unverified = os.environ.get(MB_ARCHIVE_UNVERIFIED_ENV) == '1'
+    if not sha256 and not allow_unverified:
+        raise ValueError(
+            "Refusing to install Mountebank from {}, because its SHA-256 isn't known. "
+            'Set it in the {} environment variable, or set {} to "1" to skip '
+            'the verification.'.format(archive, MB_ARCHIVE_SHA256_ENV, MB_ARCHIVE_UNVERIFIED_ENV))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(os.path.join(cache_dir, _INSTALL_LOCK_FILE)):
+        # another process could have finished the installation while this one was waiting
+        if _is_standalone_set_up(cache_dir):
+            return _get_mb_dir(cache_dir)
+        _remove_staging_dirs(cache_dir)
+        staging_dir = tempfile.mkdtemp(prefix=_STAGING_DIR_PREFIX, dir=cache_dir)
+        try:
+            _log.info('Setting up a standalone Mountebank from %s.', archive)
+            archive_sha256 = _extract_archive(archive, staging_dir)
+            # checked before anything is moved into place, a bad archive is removed with staging
+            if sha256 and archive_sha256 != sha256.lower():
+                raise MBStandaloneBrokenError(
+                    'Mountebank distribution archive {} has SHA-256 {}, but {} was expected.'
+                    .format(archive, archive_sha256, sha256.lower()))
+            mb_dir = _get_mb_dir(staging_dir)
+            installed_mb_dir = os.path.join(cache_dir, os.path.basename(mb_dir))
+            os.rename(mb_dir, installed_mb_dir)
+            return installed_mb_dir
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _extract_archive(archive, target_dir):
+    """
+    Returns:
+        str: SHA-256 hex digest of the archive.
+    """
+    with _open_archive(archive) as archive_file:
+        hashing_file = _HashingReader(archive_file)
+        # a stream mode, so the archive is never kept in full
+        with tarfile.open(fileobj=hashing_file, mode='r|gz') as mb_tar:
+            if hasattr(tarfile, 'tar_filter'):
+                # doesn't let the members be written outside of the target directory
+                mb_tar.extractall(target_dir, filter='tar')
+            else:
+                mb_tar.extractall(target_dir)
+        # there can be padding after the end of the archive
+        hashing_file.read_rest()
+    return hashing_file.hexdigest()
+
+
+def _open_archive(archive):
+    if urllib.parse.urlsplit(archive).scheme in ('http', 'https', 'ftp', 'file'):
+        return urllib.request.urlopen(archive)
+    return open(archive, 'rb')
+
+
+class _HashingReader:
+    """Wraps a file object, calculating the SHA-256 of what is read from it."""
+
+    def __init__(self, file_object):
+        self._file_object = file_object
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        """Reads from the wrapped file, like `io.RawIOBase.read`."""
+        data = self._file_object.read(size)
+        self._hash.update(data)
+        return data
+
+    def read_rest(self):
+        """Reads the file to the end, so that the digest covers all of it."""
+        while self.read(_READ_CHUNK_SIZE):
+            pass
+
+    def hexdigest(self):
+        """
+        Returns:
+            str: SHA-256 hex digest of what was read.
+        """
+        return self._hash.hexdigest()
+
+
+@contextlib.contextmanager
+def file_lock(lock_path, blocking=True):
+    """Holds an exclusive lock on a file, shared by all the processes on the machine.
+
+    Args:
+        lock_path (str): Path of the lock file. It's created if it doesn't exist.
+        blocking (bool): If False, `BlockingIOError` is raised instead of waiting
+            for someone else to release the lock.
+    """
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _remove_staging_dirs(cache_dir):
+    """Removes what's left from installations that were interrupted."""
+    for path in os.listdir(cache_dir):
+        if path.startswith(_STAGING_DIR_PREFIX):
+            shutil.rmtree(os.path.join(cache_dir, path), ignore_errors=True)
+
+
+def _is_standalone_set_up(cache_dir):
+    # the cache directory can exist without the distribution, e.g. when it only has the daemon
+    return os.path.isdir(cache_dir) and any(
+        path.startswith('mountebank-v') for path in os.listdir(cache_dir))
+
+
+def _read_command_cache(cache_path):
+    """
+    Returns:
+        list[str]: The cached command, or None if there's none
+            or the files it runs have changed since it was saved.
     """
-    _log.info('Setting up a standalone Mountebank.')
-    mb_archive_path, _ = urllib.request.urlretrieve(
-        'https://s3.amazonaws.com/mountebank/v1.4/mountebank-v1.4.3-linux-x64.tar.gz')
-    mb_tar = tarfile.open(mb_archive_path, mode='r:gz')
-    mb_tar.extractall(CACHE_DIR)
+    cache = _read_cache(cache_path)
+    return cache['command'] if cache else None
 
-    os.remove(mb_archive_path)
+
+def _read_cache(cache_path):
+    """
+    Returns:
+        dict: The cache with the "command" (and maybe its "version"), or None if there's none
+            or the files the command runs have changed since it was saved.
+    """
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+        if cache['fingerprint'] == _get_fingerprint(cache['command']):
+            return cache
+        _log.debug('Mountebank installation changed since its command was cached.')
+    except (OSError, ValueError, KeyError, TypeError):
+        # the cache is missing or broken, it will be written again
+        pass
+    return None
+
+
+def _write_command_cache(cache_path, mb_command, version=None):
+    try:
+        cache = {'command': mb_command, 'fingerprint': _get_fingerprint(mb_command)}
+        if version:
+            cache['version'] = version
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # written through a temporary file, so that other processes never read a partial file
+        temp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        with open(temp_path, 'w') as temp_file:
+            json.dump(cache, temp_file)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        _log.debug("Mountebank command couldn't be cached.", exc_info=True)
+
+
+def _get_fingerprint(mb_command):
+    """
+    Returns:
+        dict: Where the installation check command is found, and paths, modification times
+            and sizes of the files run by the Mountebank command.
+
+    Raises:
+        OSError: If one of the files doesn't exist.
+    """
+    files = []
+    for part in mb_command:
+        path = shutil.which(part) if os.path.basename(part) == part else part
+        if path is None:
+            raise FileNotFoundError(part)
+        stat = os.stat(path)
+        files.append([path, stat.st_mtime_ns, stat.st_size])
+    return {'install_check': shutil.which(MB_INSTALL_CHECK_CMD[0]), 'files': files}
 
 
 def _check_mb_install():
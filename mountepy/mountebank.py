@@ -3,24 +3,58 @@ Abstractions representing aspects of Mountebank.
 """
 
 import collections
+import copy
+import datetime
+import http.server
+import json
+import logging
+import socketserver
+import threading
 import time
+import urllib.parse
 
-import dateutil.parser
 import port_for
 import requests
 
+from .http_client import DEFAULT_POOL_SIZE, HttpClient
 from .http_service import HttpService, wait_for_port
 from .mb_mgmt import get_mb_command
+from .request_json import (ImposterRequest, iter_requests_json, make_imposter_request,
+                           split_new_requests_json)
+from .request_query import RequestIndex, RequestQuery
+from .snapshots import load_snapshot, save_snapshot
+
+_log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
 class MountebankWrapper:
     """A wrapper around the Mountebank API. Meant to be used as a superclass.
+
+    Args:
+        host (str): Host on which Mountebank is listening for imposter configuration commands.
+        port (int): Port on which Mountebank is listening.
+        pool_size (int): How many keep-alive connections to Mountebank can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to Mountebank.
+            None means no timeout.
+
+    Attributes:
+        client (`HttpClient`): Connection pool used for calls to Mountebank.
+            It's shared by all the imposters created through this object.
+        collector (`RequestCollector`): Receives the requests made to the imposters as they
+            come, if the Mountebank can push them. None otherwise.
     """
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, pool_size=DEFAULT_POOL_SIZE, timeout=None):
         self.host = host
         self.port = port
+        self.client = HttpClient(pool_size=pool_size, timeout=timeout)
+        self.collector = None
         self._imposters_url = 'http://{}:{}/imposters'.format(host, port)
+        # configurations of the imposters created through this object, by port;
+        # the imposters keep their stubs in it up to date
+        self._imposter_configs = {}
+        # configurations of the imposters recorded by `checkpoint`, by port
+        self._baseline_configs = None
 
     def add_imposter(self, imposter_cfg):
         """Adds a HTTP service stub (imposter) to Mountebank instance.
@@ -32,12 +66,66 @@ class MountebankWrapper:
         Returns:
             `Imposter`: The created service stub.
         """
-        resp = requests.post(self._imposters_url, json=imposter_cfg)
+        resp = self.client.post(self._imposters_url, json=self._prepare_config(imposter_cfg))
         resp.raise_for_status()
-        return Imposter(self.port, imposter_cfg['port'], host=self.host)
+        if self.collector:
+            self.collector.clear(imposter_cfg['port'])
+        self._imposter_configs[imposter_cfg['port']] = copy.deepcopy(imposter_cfg)
+        return self._make_imposter(imposter_cfg['port'])
+
+    def add_imposters(self, imposter_cfgs):
+        """Adds many imposters to Mountebank instance.
+        They are created with a single request, along with the imposters already in Mountebank,
+        if all of those were created through this object and haven't received any requests yet.
+        Otherwise they are added one by one, so that the existing imposters are left untouched.
+
+        Args:
+            imposter_cfgs (list[dict]): Mountebank configurations of the imposters.
+                Each of them needs to have a port set.
+
+        Returns:
+            list[`Imposter`]: The created imposters, in the order of the configurations.
+        """
+        request_counts = {imposter['port']: imposter.get('numberOfRequests', 0)
+                          for imposter in self._list_imposters()}
+        new_ports = {imposter_cfg['port'] for imposter_cfg in imposter_cfgs}
+        if any(port in new_ports or port not in self._imposter_configs or count
+               for port, count in request_counts.items()):
+            return [self.add_imposter(imposter_cfg) for imposter_cfg in imposter_cfgs]
+        # recreating the existing imposters loses nothing, they're known and have no requests
+        self._put_imposters(
+            [self._imposter_configs[port] for port in request_counts] + list(imposter_cfgs))
+        return [self._make_imposter(imposter_cfg['port']) for imposter_cfg in imposter_cfgs]
+
+    def replace_all_imposters(self, imposter_cfgs, keep_unchanged=False):
+        """Replaces all the imposters in Mountebank instance with the given ones,
+        using a single request.
+
+        Args:
+            imposter_cfgs (list[dict]): Mountebank configurations of the imposters.
+                Each of them needs to have a port set.
+            keep_unchanged (bool): If set to True, then imposters created earlier through this
+                object with exactly the same configuration won't be recreated (so they keep
+                their recorded requests). Only the missing and changed imposters will be
+                created, one by one, and the other ones will be deleted.
+
+        Returns:
+            list[`Imposter`]: The imposters, in the order of the configurations.
+        """
+        if keep_unchanged:
+            existing_ports = self._get_imposter_ports()
+            unchanged_ports = {
+                imposter_cfg['port'] for imposter_cfg in imposter_cfgs
+                if imposter_cfg['port'] in existing_ports
+                and self._imposter_configs.get(imposter_cfg['port']) == imposter_cfg}
+            if unchanged_ports:
+                return self._update_imposters(imposter_cfgs, existing_ports, unchanged_ports)
+
+        self._put_imposters(imposter_cfgs)
+        return [self._make_imposter(imposter_cfg['port']) for imposter_cfg in imposter_cfgs]
 
     def add_imposter_simple(self, port=None, method='GET',  # pylint: disable=too-many-arguments
-                            path='/', status_code=200, response=''):
+                            path='/', status_code=200, response='', record_requests=None):
         """Adds an imposter with a single HTTP service stub to Mountebank instance.
         Takes a simplified configuration.
 
@@ -47,67 +135,112 @@ class MountebankWrapper:
             path (str): HTTP path the imposter will wait for. '/' by default.
             status_code (int): HTTP status code the imposter will return. 200 by default.
             response (str): body of the imposters response. Empty string by default.
+            record_requests (bool): Whether Mountebank should save the requests made to
+                the imposter. If none, Mountebank's default is used.
 
         Returns:
             `Imposter`: The newly created imposter.
         """
         if port is None:
-            port = port_for.select_random()
+            port = self._select_port()
 
         return self.add_multi_stub_imposter_simple(
             port,
-            [HttpStub(method, path, status_code, response)])
+            [HttpStub(method, path, status_code, response)],
+            record_requests)
 
-    def add_multi_stub_imposter_simple(self, port, stubs):
+    def add_multi_stub_imposter_simple(self, port, stubs, record_requests=None):
         """Adds a Mountebank imposter with multiple HTTP stubs on one port.
         Takes a simplified configuration in comparison to `add_imposter`.
 
         Args:
             port (int): Port the imposter will listen on.
             stubs (list[`HttpStub`]): HTTP stubs to be created on the port.
+            record_requests (bool): Whether Mountebank should save the requests made to
+                the imposter. If none, Mountebank's default is used.
 
         Returns:
             `Imposter`: The newly created imposter.
         """
-        imposter_config = {
-            'port': port,
-            'protocol': 'http',
-            'stubs': []
-        }
+        return self.add_imposter(http_imposter_config(port, stubs, record_requests))
 
-        for stub in stubs:
-            stub_json = {
-                'responses': [
-                    {
-                        'is': {
-                            'statusCode': stub.status_code,
-                            'headers': {
-                                'Content-Type': 'application/json'
-                            },
-                            'body': stub.response
-                        }
-                    }
-                ],
-                'predicates': [
-                    {
-                        'and': [
-                            {
-                                'equals': {
-                                    'path': stub.path,
-                                    'method': stub.method,
-                                }
-                            },
-                        ]
-                    }
-                ]
-            }
-            imposter_config['stubs'].append(stub_json)
-        return self.add_imposter(imposter_config)
+    def get_imposter(self, port):
+        """
+        Args:
+            port (int): Port of an imposter that already exists in Mountebank,
+                e.g. one loaded from a snapshot.
+
+        Returns:
+            `Imposter`: The imposter on the port.
+        """
+        return self._make_imposter(port)
+
+    def save_snapshot(self, path=None):
+        """Saves the configuration of the imposters, as Mountebank gives it with the
+        "replayable" option, in a file that `Mountebank` can be started with.
+        See `mountepy.snapshots.save_snapshot`.
+
+        Args:
+            path (str): Where to save the snapshot. If not given, it's saved in
+                `mountepy.snapshots.SNAPSHOT_DIR` under a name made from its content's hash.
+
+        Returns:
+            str: Path of the snapshot.
+        """
+        if self.collector and self.collector.url:
+            raise ValueError("Imposters pushing requests to a collector can't be saved, "
+                             "the collector won't be there when they're loaded.")
+        return save_snapshot(self._get_replayable_configs(), path)
+
+    def checkpoint(self):
+        """Records the current imposters as a baseline that `restore` brings back.
+        Call it after creating the imposters shared by many tests.
+        """
+        existing_ports = self._get_imposter_ports()
+        unknown_ports = existing_ports - set(self._imposter_configs)
+        # only the imposters that exist, in case some were removed behind this object's back
+        baseline_configs = {port: copy.deepcopy(imposter_cfg)
+                            for port, imposter_cfg in self._imposter_configs.items()
+                            if port in existing_ports}
+        if unknown_ports:
+            # imposters not created through this object, e.g. loaded from a snapshot
+            for imposter_cfg in self._get_replayable_configs():
+                if imposter_cfg['port'] in unknown_ports:
+                    self._imposter_configs[imposter_cfg['port']] = imposter_cfg
+                    baseline_configs[imposter_cfg['port']] = copy.deepcopy(imposter_cfg)
+        self._baseline_configs = baseline_configs
+
+    def restore(self):
+        """Brings back the imposters recorded by `checkpoint`, touching only what changed since.
+        Imposters added after the checkpoint are removed. Baseline imposters that were removed,
+        or whose stubs were changed through their `Imposter` objects, are created again.
+        Request logs of the other baseline imposters are cleared if they got any requests.
+        The rest of the imposters is left alone.
+        """
+        if self._baseline_configs is None:
+            raise ValueError('There is no checkpoint to restore.')
+        request_counts = {imposter['port']: imposter.get('numberOfRequests', 0)
+                          for imposter in self._list_imposters()}
+        for port in set(request_counts) - set(self._baseline_configs):
+            self._remove_imposter(port)
+        for port, baseline_config in self._baseline_configs.items():
+            if port not in request_counts:
+                self.add_imposter(baseline_config)
+            elif self._imposter_configs.get(port) != baseline_config:
+                self._remove_imposter(port)
+                self.add_imposter(baseline_config)
+            elif request_counts[port]:
+                self._clear_imposter_requests(port)
+        if self.collector:
+            self.collector.clear()
 
     def reset(self):
         """Removes configured imposters (HTTP stubs)."""
-        resp = requests.delete(self._imposters_url)
+        resp = self.client.delete(self._imposters_url)
         resp.raise_for_status()
+        if self.collector:
+            self.collector.clear()
+        self._imposter_configs.clear()
 
     def start(self):
         """Make sure the process is running and has a clean configuration"""
@@ -124,25 +257,154 @@ class MountebankWrapper:
     def __exit__(self, *args):
         self.stop()
 
+    def _select_port(self):  # pylint: disable=no-self-use
+        return port_for.select_random()
+
+    def _make_imposter(self, port):
+        return Imposter(self.port, port, host=self.host, client=self.client,
+                        collector=self.collector, configs=self._imposter_configs)
+
+    def _prepare_config(self, imposter_cfg):  # pylint: disable=no-self-use
+        """
+        Returns:
+            dict: Imposter configuration that's actually sent to Mountebank.
+        """
+        return imposter_cfg
+
+    def _list_imposters(self):
+        """
+        Returns:
+            list[dict]: Short descriptions of the imposters (with their ports and numbers
+                of requests), as Mountebank gives them.
+        """
+        resp = self.client.get(self._imposters_url)
+        resp.raise_for_status()
+        return resp.json()['imposters']
+
+    def _get_imposter_ports(self):
+        return {imposter['port'] for imposter in self._list_imposters()}
+
+    def _get_replayable_configs(self):
+        """
+        Returns:
+            list[dict]: Configurations of the imposters, as Mountebank gives them
+                with the "replayable" option.
+        """
+        resp = self.client.get(self._imposters_url, params={'replayable': 'true'})
+        resp.raise_for_status()
+        own_ports = self._get_imposter_ports()
+        return [imposter_cfg for imposter_cfg in resp.json()['imposters']
+                if imposter_cfg['port'] in own_ports]
+
+    def _remove_imposter(self, port):
+        self.client.delete('{}/{}'.format(self._imposters_url, port)).raise_for_status()
+        self._imposter_configs.pop(port, None)
+        if self.collector:
+            self.collector.clear(port)
+
+    def _clear_imposter_requests(self, port):
+        try:
+            self._make_imposter(port).clear_requests()
+        except requests.HTTPError as ex:
+            if ex.response is None or ex.response.status_code != 404:
+                raise
+            # Mountebank older than 2.0 can't clear the requests, the imposter needs recreating
+            imposter_config = self._imposter_configs[port]
+            self._remove_imposter(port)
+            self.add_imposter(imposter_config)
+
+    def _put_imposters(self, imposter_cfgs):
+        """Replaces all the imposters in Mountebank with the given ones, in a single request."""
+        prepared_cfgs = [self._prepare_config(imposter_cfg) for imposter_cfg in imposter_cfgs]
+        resp = self.client.put(self._imposters_url, json={'imposters': prepared_cfgs})
+        resp.raise_for_status()
+        if self.collector:
+            self.collector.clear()
+        imposter_configs = [(imposter_cfg['port'], copy.deepcopy(imposter_cfg))
+                            for imposter_cfg in imposter_cfgs]
+        self._imposter_configs.clear()
+        self._imposter_configs.update(imposter_configs)
+
+    def _update_imposters(self, imposter_cfgs, existing_ports, unchanged_ports):
+        for port in existing_ports - unchanged_ports:
+            self._remove_imposter(port)
+        imposters = []
+        for imposter_cfg in imposter_cfgs:
+            if imposter_cfg['port'] in unchanged_ports:
+                imposters.append(self._make_imposter(imposter_cfg['port']))
+            else:
+                imposters.append(self.add_imposter(imposter_cfg))
+        return imposters
+
 
 class Mountebank(MountebankWrapper):
     """Manages a Mountebank instance. Can start and stop the Mountebank process.
 
     Args:
         port (int): Port on which Mountebank is listening for imposter configuration commands.
+        pool_size (int): How many keep-alive connections to Mountebank can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to Mountebank.
+        push_requests (bool): If set to True, then every stub of the imposters gets
+            a "decorate" behavior sending the requests it receives to a `RequestCollector`,
+            so that `Imposter.wait_for_requests` doesn't need to poll Mountebank.
+            A catch-all stub is added at the end of each imposter for the requests not matched
+            by the other stubs. Mountebank is started with --allowInjection for this.
+        config_file (str): Snapshot of imposters (see `MountebankWrapper.save_snapshot`)
+            that Mountebank loads when it starts, with its --configfile option.
+            Can't be used together with `push_requests`.
     """
-    def __init__(self, port=None):
-        process = HttpService(get_mb_command() + ['--mock', '--port', '{port}'], port)
-        super().__init__('localhost', process.port)
+    def __init__(self, port=None,  # pylint: disable=too-many-arguments
+                 pool_size=DEFAULT_POOL_SIZE, timeout=None, push_requests=False,
+                 config_file=None):
+        if push_requests and config_file:
+            raise ValueError("Imposters from a config file can't push requests.")
+        mb_command = get_mb_command() + ['--mock', '--port', '{port}']
+        if push_requests:
+            mb_command.append('--allowInjection')
+        if config_file:
+            mb_command.extend(['--configfile', config_file])
+        process = HttpService(mb_command, port)
+        super().__init__('localhost', process.port, pool_size=pool_size, timeout=timeout)
         self.process = process
+        self.config_file = config_file
+        if push_requests:
+            self.collector = RequestCollector()
 
-    def start(self):
-        """Starts the Mountebank process"""
+    def start(self, timeout=10.0):  # pylint: disable=arguments-differ
+        """Starts the Mountebank process.
+        If it's given a config file, this waits until all of the file's imposters are created.
+
+        Args:
+            timeout (float): How long to wait for the imposters from the config file.
+        """
+        if self.collector:
+            self.collector.start()
         self.process.start()
+        if self.config_file:
+            self._wait_for_snapshot(timeout)
 
     def stop(self):
         """Stops the Mountebank process"""
         self.process.stop()
+        if self.collector:
+            self.collector.stop()
+
+    def _prepare_config(self, imposter_cfg):
+        if self.collector:
+            return _with_request_push(imposter_cfg, self.collector.url)
+        return imposter_cfg
+
+    def _wait_for_snapshot(self, timeout):
+        imposter_cfgs = load_snapshot(self.config_file)
+        snapshot_ports = {imposter_cfg['port'] for imposter_cfg in imposter_cfgs}
+        start_time = time.perf_counter()
+        while not snapshot_ports <= self._get_imposter_ports():
+            if time.perf_counter() - start_time >= timeout:
+                raise TimeoutError('Mountebank has not loaded the imposters from {}.'.format(
+                    self.config_file))
+            time.sleep(0.01)
+        self._imposter_configs.update(
+            (imposter_cfg['port'], imposter_cfg) for imposter_cfg in imposter_cfgs)
 
 
 class ExistingMountebank(MountebankWrapper):
@@ -151,6 +413,8 @@ class ExistingMountebank(MountebankWrapper):
     Args:
         host (str): Host on which Mountebank is listening for imposter configuration commands.
         port (int): Port on which Mountebank is listening.
+        pool_size (int): How many keep-alive connections to Mountebank can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to Mountebank.
     """
 
     def start(self):
@@ -163,54 +427,138 @@ class ExistingMountebank(MountebankWrapper):
         self.reset()
 
 
-class Imposter:
+class Imposter:  # pylint: disable=too-many-instance-attributes
     """A Mountebank imposter. It can contain stubs of HTTP, HTTPS, TCP or SMTP services.
 
     Args:
         mountebank_port (int): Mountebank's localhost port.
         port (int): Port for the imposter..
+        host (str): Host on which Mountebank is listening.
+        client (`HttpClient`): Connection pool used for calls to Mountebank.
+            A new one is created if it's not provided.
+        collector (`RequestCollector`): Receives the requests made to the imposter as they come.
+            If not provided, Mountebank is polled for the requests.
+        configs (dict): Imposter configurations by port, in which the imposter's stubs
+            are kept up to date when they're changed through it.
 
     Attributes:
         url (str): Management URL for the Imposter.
         port (int): Port on localhost taken by this Imposter.
     """
 
-    def __init__(self, mountebank_port, port, host='localhost'):
+    def __init__(self, mountebank_port, port,  # pylint: disable=too-many-arguments
+                 host='localhost', client=None, collector=None, configs=None):
         self.url = 'http://{}:{}/imposters/{}'.format(host, mountebank_port, port)
         self.port = port
-
-    def requests(self):
+        self._client = client or HttpClient()
+        self._collector = collector
+        self._configs = {} if configs is None else configs
+        # requests already converted from Mountebank's JSON, they're only appended to the log
+        self._parsed_requests = []
+        self._last_split_position = None
+        self._parsing_lock = threading.Lock()
+        self._request_index = RequestIndex()
+
+    def requests(self, since=0):
         """
+        Args:
+            since (int): Index in the imposter's request log from which to return the requests.
+                Lets the log be consumed as a stream: pass the number of requests seen so far.
+
         Returns:
             list[`ImposterRequest`]: The requests made on the impostor.
         """
-        imposter_json = requests.get(self.url).json()
-        imposter_requests = []
-        for request in imposter_json.get('requests', []):
-            imposter_requests.append(ImposterRequest(
-                body=request['body'],
-                headers=request['headers'],
-                method=request['method'],
-                path=request['path'],
-                query=request['query'],
-                request_from=request['requestFrom'],
-                timestamp=dateutil.parser.parse(request['timestamp']),
-            ))
-        return imposter_requests
-
-    def wait_for_requests(self, count=1, timeout=5.0):
+        return self._fetch_requests()[since:]
+
+    def query(self):
+        """
+        Returns:
+            `RequestQuery`: A query over all the requests made on the imposter.
+                Add criteria to it with its methods.
+        """
+        return RequestQuery(self)
+
+    def request_index(self):
+        """
+        Returns:
+            `RequestIndex`: Indexes of the imposter's request log, updated with the newest requests.
+        """
+        self._request_index.update(self._fetch_requests())
+        return self._request_index
+
+    def _fetch_requests(self):
+        """
+        Returns:
+            list[`ImposterRequest`]: The cached request log, updated with the new requests.
+                It's only appended to, and replaced if the log on Mountebank was cleared.
+        """
+        imposter_json = self._client.get(self.url).content.decode('utf-8')
+        with self._parsing_lock:
+            # the requests parsed before aren't decoded again
+            split = split_new_requests_json(imposter_json, self._last_split_position)
+            if not split.continued and self._parsed_requests:
+                # the log was cleared or the imposter recreated, it needs to be parsed again
+                self._parsed_requests = []
+            self._parsed_requests.extend(
+                ImposterRequest.from_json(raw_request) for raw_request in split.requests)
+            self._last_split_position = split.position
+            return self._parsed_requests
+
+    def iter_requests(self,  # pylint: disable=too-many-arguments
+                      method=None, path=None, start_time=None, end_time=None,
+                      chunk_size=65536):
+        """Goes through the requests made on the imposter, reading Mountebank's response
+        as a stream. Only a single request is held in memory at a time,
+        not the whole request log.
+
+        Args:
+            method (str): Only requests with this HTTP method are returned.
+            path (str): Only requests for this path are returned.
+            start_time (`datetime.datetime`): Only requests made at or after this time
+                are returned. Needs to have a timezone.
+            end_time (`datetime.datetime`): Only requests made before this time are returned.
+                Needs to have a timezone.
+            chunk_size (int): How many bytes of the response are read at once.
+
+        Yields:
+            `ImposterRequest`: The requests made on the imposter that pass the filters.
+        """
+        resp = self._client.get(self.url, stream=True)
+        try:
+            resp.raise_for_status()
+            for raw_request in iter_requests_json(
+                    resp.iter_content(chunk_size), method, path, start_time, end_time):
+                yield ImposterRequest.from_json(raw_request)
+        finally:
+            resp.close()
+
+    def wait_for_requests(self, count=1, timeout=5.0, predicate=None):
         """Wait until a number of requests arrive to the imposter.
+        If the imposter has a `RequestCollector`, this blocks until the collector
+        gets the requests. Otherwise Mountebank is polled for them.
 
         Args:
             count (int): How many requests to wait for.
             timeout (float): How long to wait for requests.
+            predicate (callable): Takes an `ImposterRequest` and tells if it should be counted.
+                All requests are counted if it's not provided.
+                A `RequestQuery` of this imposter is answered with the request indexes.
 
         Returns:
-            list[`ImposterRequest`]: The requests made on the impostor.
+            list[`ImposterRequest`]: The requests made on the impostor
+                (only the ones satisfying the predicate, if it's given).
         """
+        if self._collector:
+            return self._collector.wait(self.port, count, timeout, predicate)
         start_time = time.perf_counter()
         while True:
-            received_requests = self.requests()
+            if isinstance(predicate, RequestQuery):
+                received_requests = predicate.select(self.request_index())
+            else:
+                received_requests = self.requests()
+                if predicate:
+                    received_requests = [request for request in received_requests
+                                         if predicate(request)]
             if len(received_requests) >= count:
                 return received_requests
             else:
@@ -218,34 +566,408 @@ class Imposter:
                 if time.perf_counter() - start_time >= timeout:
                     raise TimeoutError('Waited too long for requests on stub.')
 
+    def add_stub(self, stub, index=None):
+        """Adds a stub to the imposter, without recreating it.
+        Needs a Mountebank with the stub endpoints (2.0 or newer).
+
+        Args:
+            stub: `HttpStub` or Mountebank configuration (dict) of a stub.
+            index (int): Position of the stub among the imposter's stubs, which are matched
+                in order. If not given, the stub is added at the end.
+        """
+        stub_json = _stub_json(stub)
+        if index is None and self._pushes_requests():
+            # the last stub is the one pushing the requests that don't match the others
+            index = self._get_stub_count()
+        body = {'stub': self._prepare_stub(stub_json)}
+        if index is not None:
+            body['index'] = index
+        self._client.post(self.url + '/stubs', json=body).raise_for_status()
+        stubs = self._configs.get(self.port, {}).get('stubs')
+        if stubs is not None:
+            stubs.insert(len(stubs) if index is None else index, stub_json)
+
+    def replace_stub(self, index, stub):
+        """Replaces one of the imposter's stubs, without recreating the imposter.
+        Needs a Mountebank with the stub endpoints (2.0 or newer).
+
+        Args:
+            index (int): Position of the replaced stub.
+            stub: `HttpStub` or Mountebank configuration (dict) of the new stub.
+        """
+        stub_json = _stub_json(stub)
+        self._client.put('{}/stubs/{}'.format(self.url, index),
+                         json=self._prepare_stub(stub_json)).raise_for_status()
+        stubs = self._configs.get(self.port, {}).get('stubs')
+        if stubs is not None:
+            stubs[index] = stub_json
+
+    def remove_stub(self, index):
+        """Removes one of the imposter's stubs, without recreating the imposter.
+        Needs a Mountebank with the stub endpoints (2.0 or newer).
+
+        Args:
+            index (int): Position of the removed stub.
+        """
+        self._client.delete('{}/stubs/{}'.format(self.url, index)).raise_for_status()
+        stubs = self._configs.get(self.port, {}).get('stubs')
+        if stubs is not None:
+            del stubs[index]
+
+    def _pushes_requests(self):
+        return bool(self._collector and self._collector.url)
+
+    def _prepare_stub(self, stub_json):
+        if self._pushes_requests():
+            return _with_request_push_stub(stub_json, self._collector.url, self.port)
+        return stub_json
+
+    def _get_stub_count(self):
+        config = self._configs.get(self.port)
+        if config is not None:
+            return len(config.get('stubs', []))
+        resp = self._client.get(self.url, params={'replayable': 'true'})
+        resp.raise_for_status()
+        # not counting the stub pushing the unmatched requests
+        return len(resp.json().get('stubs', [])) - 1
+
+    def clear_requests(self):
+        """Makes Mountebank forget the requests saved by the imposter.
+        Needs a Mountebank with the "savedRequests" endpoint (2.0 or newer).
+        """
+        self._client.delete(self.url + '/savedRequests').raise_for_status()
+        with self._parsing_lock:
+            self._parsed_requests = []
+            self._last_split_position = None
+        if self._collector:
+            self._collector.clear(self.port)
+
+    def start_trimming(self, interval=1.0):
+        """Starts draining the requests saved by the imposter in the background,
+        so that Mountebank's memory use stays flat during long load tests.
+
+        Args:
+            interval (float): Seconds between the drains.
+
+        Returns:
+            `RequestTrimmer`: The started trimmer, counting the drained requests.
+                It needs to be stopped when it's no longer needed.
+        """
+        trimmer = RequestTrimmer(self, interval)
+        trimmer.start()
+        return trimmer
+
     def destroy(self):
         """Deletes this `Imposter` from Mountebank.
         This object cannot be used afterwards.
         """
-        requests.delete(self.url)
+        self._client.delete(self.url)
+        self._configs.pop(self.port, None)
+        if self._collector:
+            self._collector.clear(self.port)
 
 
-ImposterRequest = collections.namedtuple(
-    'ImposterRequest',
-    'body, headers, method, path, query, request_from, timestamp')
-ImposterRequest.__doc__ = """Data of a request made on an imposter.
+class RequestTrimmer:
+    """Periodically drains the requests saved by an imposter, keeping only
+    the number of requests made to each path.
+    Requests that arrive between reading the saved requests and clearing them aren't counted,
+    because Mountebank can't do both at once.
+    Can be used as a context manager.
 
-Attributes:
-    body (str): Request's body. Can be any valid JSON (this includes raw values)
-    headers (dict): HTTP headers.
-    method (str): HTTP method.
-    path (str): Request's path (e.g. "/bla/1" or "/").
-    query (dict): Query arguments (after "?" in a URL).
-    request_from (str): Request's source address.
-    timestamp (`datetime.datetime`): Time at which the request was made.
-"""
+    Args:
+        imposter (`Imposter`): The imposter whose requests are drained.
+        interval (float): Seconds between the drains.
+    """
 
-HttpStub = collections.namedtuple('HttpStub', ['method', 'path', 'status_code', 'response'])
-HttpStub.__doc__ = """A configuration for a simple Mountebank impostor, not including the port.
+    def __init__(self, imposter, interval=1.0):
+        self._imposter = imposter
+        self._interval = interval
+        self._counts = collections.Counter()
+        self._counts_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
 
-Attributes:
-    method (str): HTTP method to which the stub will answer.
-    path (str): Request's path (e.g. "/bla/1" or "/")
-    status_code (int): Status code that will be returned by the stub.
-    response (str): Stub will send it in response to a request matching other parameters.
-"""
+    @property
+    def counts(self):
+        """
+        Returns:
+            `collections.Counter`: Number of the drained requests, by path.
+        """
+        with self._counts_lock:
+            return collections.Counter(self._counts)
+
+    def trim(self):
+        """Drains the saved requests right away.
+
+        Returns:
+            int: How many requests were drained.
+        """
+        drained_counts = collections.Counter(
+            request.path for request in self._imposter.iter_requests())
+        if drained_counts:
+            self._imposter.clear_requests()
+            with self._counts_lock:
+                self._counts.update(drained_counts)
+        return sum(drained_counts.values())
+
+    def start(self):
+        """Starts draining the requests in a background thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, after draining the requests one last time.
+        Does nothing if the thread isn't running, e.g. it was already stopped.
+        """
+        if not self._thread:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.trim()
+
+    def __enter__(self):
+        if not self._thread:
+            self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.trim()
+            except (requests.exceptions.RequestException, ValueError):
+                _log.warning('Draining the requests of imposter %s failed.',
+                             self._imposter.port, exc_info=True)
+
+
+class RequestCollector:
+    """Keeps requests pushed to it as they arrive to the imposters,
+    and wakes up the threads waiting for them.
+    Mountebank can push the requests through the collector's HTTP endpoint (see `start`).
+
+    Attributes:
+        url (str): Address of the HTTP endpoint receiving the requests.
+            None if the endpoint isn't started.
+    """
+
+    def __init__(self):
+        self.url = None
+        self._requests = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        # one condition for each port, so a request wakes up only the threads waiting for it
+        self._conditions = {}
+        self._server = None
+
+    def _get_condition(self, port):
+        return self._conditions.setdefault(port, threading.Condition(self._lock))
+
+    def push(self, port, request_json):
+        """Adds a request made to an imposter.
+
+        Args:
+            port (int): Port of the imposter.
+            request_json (dict): The request, in the form used by Mountebank's API.
+        """
+        # Mountebank doesn't give all of the fields to decorate functions
+        request = make_imposter_request(dict(
+            {'body': '', 'headers': {}, 'query': {}, 'requestFrom': '',
+             'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat()},
+            **request_json))
+        with self._lock:
+            self._requests[port].append(request)
+            self._get_condition(port).notify_all()
+
+    def clear(self, port=None):
+        """Forgets the requests.
+
+        Args:
+            port (int): Port of the imposter whose requests are forgotten.
+                If not provided, the requests of all the imposters are forgotten.
+        """
+        with self._lock:
+            if port is None:
+                self._requests.clear()
+            else:
+                self._requests.pop(port, None)
+
+    def wait(self, port, count=1, timeout=5.0, predicate=None):
+        """Blocks until a number of requests arrive to an imposter.
+        See `Imposter.wait_for_requests`.
+        """
+        deadline = time.monotonic() + timeout
+        port_requests, checked, matching = None, 0, []
+        with self._lock:
+            condition = self._get_condition(port)
+            while True:
+                # only the requests that came since the last check are matched,
+                # unless the requests were cleared in the meantime
+                if self._requests.get(port) is not port_requests:
+                    port_requests, checked, matching = self._requests.get(port), 0, []
+                for request in (port_requests or [])[checked:]:
+                    if predicate is None or predicate(request):
+                        matching.append(request)
+                checked = len(port_requests or [])
+                if len(matching) >= count:
+                    return matching
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('Waited too long for requests on stub.')
+                condition.wait(remaining)
+
+    def start(self):
+        """Starts the HTTP endpoint receiving the requests on a random port.
+        Requests made to an imposter are POSTed as JSON to `url` + '/' + the imposter's port.
+        """
+        collector = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Receives the pushed requests."""
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """Passes the request to the collector."""
+                content_length = int(self.headers.get('Content-Length') or 0)
+                collector.push(int(self.path.strip('/')),
+                               json.loads(self.rfile.read(content_length).decode()))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        self._server = _ThreadingHttpServer(('localhost', 0), Handler)
+        self.url = 'http://localhost:{}'.format(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                         daemon=True).start()
+
+    def stop(self):
+        """Stops the HTTP endpoint."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self.url = None
+
+
+class _ThreadingHttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server handling each request in a thread."""
+    daemon_threads = True
+
+
+def http_imposter_config(port, stubs, record_requests=None):
+    """Creates a Mountebank configuration for an imposter with multiple simple HTTP stubs.
+    It can be passed to `MountebankWrapper.add_imposter` or `MountebankWrapper.add_imposters`.
+
+    Args:
+        port (int): Port the imposter will listen on.
+        stubs (list[`HttpStub`]): HTTP stubs to be created on the port.
+        record_requests (bool): Whether Mountebank should save the requests made to
+            the imposter. If none, Mountebank's default is used.
+
+    Returns:
+        dict: Imposter configuration.
+    """
+    imposter_config = {
+        'port': port,
+        'protocol': 'http',
+        'stubs': []
+    }
+    if record_requests is not None:
+        imposter_config['recordRequests'] = record_requests
+
+    for stub in stubs:
+        imposter_config['stubs'].append(stub.to_json())
+    return imposter_config
+
+
+# Mountebank's decorate behavior sending a copy of each request to a RequestCollector.
+# It doesn't change the response.
+_PUSH_REQUEST_JS = """function (request, response) {{
+    var body = JSON.stringify(request);
+    var pushRequest = require('http').request({{
+        host: '{host}', port: {port}, method: 'POST', path: '/{imposter_port}',
+        headers: {{'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body)}}
+    }});
+    pushRequest.on('error', function () {{}});
+    pushRequest.end(body);
+}}"""
+
+
+def _with_request_push(imposter_cfg, collector_url):
+    """
+    Returns:
+        dict: A copy of the imposter configuration whose stubs push requests to the collector.
+    """
+    stubs = imposter_cfg.get('stubs', []) + [
+        {'responses': [{'is': imposter_cfg.get('defaultResponse', {})}]}]
+    return dict(imposter_cfg, stubs=[
+        _with_request_push_stub(stub, collector_url, imposter_cfg['port']) for stub in stubs])
+
+
+def _with_request_push_stub(stub_json, collector_url, imposter_port):
+    """
+    Returns:
+        dict: A copy of the stub configuration whose responses push requests to the collector.
+    """
+    collector_address = urllib.parse.urlsplit(collector_url)
+    decorate_js = _PUSH_REQUEST_JS.format(host=collector_address.hostname,
+                                          port=collector_address.port,
+                                          imposter_port=imposter_port)
+    stub_json = copy.deepcopy(stub_json)
+    for response in stub_json.setdefault('responses', [{'is': {}}]):
+        response.setdefault('_behaviors', {})['decorate'] = decorate_js
+    return stub_json
+
+
+def _stub_json(stub):
+    """
+    Returns:
+        dict: Mountebank configuration of the stub, which can be an `HttpStub`.
+    """
+    return stub.to_json() if isinstance(stub, HttpStub) else copy.deepcopy(stub)
+
+
+class HttpStub(collections.namedtuple('HttpStub', ['method', 'path', 'status_code', 'response'])):
+    """A configuration for a simple Mountebank impostor, not including the port.
+
+    Attributes:
+        method (str): HTTP method to which the stub will answer.
+        path (str): Request's path (e.g. "/bla/1" or "/")
+        status_code (int): Status code that will be returned by the stub.
+        response (str): Stub will send it in response to a request matching other parameters.
+    """
+    __slots__ = ()
+
+    def to_json(self):
+        """
+        Returns:
+            dict: Mountebank configuration of the stub.
+        """
+        return {
+            'responses': [
+                {
+                    'is': {
+                        'statusCode': self.status_code,
+                        'headers': {
+                            'Content-Type': 'application/json'
+                        },
+                        'body': self.response
+                    }
+                }
+            ],
+            'predicates': [
+                {
+                    'and': [
+                        {
+                            'equals': {
+                                'path': self.path,
+                                'method': self.method,
+                            }
+                        },
+                    ]
+                }
+            ]
+        }
@@ -0,0 +1,51 @@
+"""
+Pytest plugin reporting the slowest services and imposters of a test session.
+It's not loaded by default. Enable it with ``-p mountepy.pytest_plugin``
+(or ``pytest_plugins = ['mountepy.pytest_plugin']`` in a ``conftest.py``),
+then pass ``--mountepy-report`` to get a terminal summary,
+and/or ``--mountepy-report-json=PATH`` to save the statistics as JSON.
+"""
+
+from . import instrumentation
+
+_REPORT_KEY = '_mountepy_report'
+
+
+def pytest_addoption(parser):
+    """Adds the options of the report."""
+    group = parser.getgroup('mountepy')
+    group.addoption('--mountepy-report', action='store_true',
+                    help='Show the slowest services and imposters after the tests.')
+    group.addoption('--mountepy-report-json', metavar='PATH',
+                    help='Save the statistics of the services and imposters in a JSON file.')
+    group.addoption('--mountepy-report-count', type=int, default=10,
+                    help='How many services and imposters to report.')
+
+
+def pytest_configure(config):
+    """Starts collecting the events, if the report was requested."""
+    if config.getoption('mountepy_report') or config.getoption('mountepy_report_json'):
+        report = instrumentation.Report()
+        instrumentation.add_listener(report)
+        setattr(config, _REPORT_KEY, report)
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Shows the report at the end of the session."""
+    report = getattr(terminalreporter.config, _REPORT_KEY, None)
+    if report and terminalreporter.config.getoption('mountepy_report'):
+        terminalreporter.write_sep('=', 'mountepy report')
+        for line in report.format(terminalreporter.config.getoption('mountepy_report_count')):
+            terminalreporter.write_line(line)
+
+
+def pytest_unconfigure(config):
+    """Stops collecting the events and saves the JSON report."""
+    report = getattr(config, _REPORT_KEY, None)
+    if report is None:
+        return
+    instrumentation.remove_listener(report)
+    json_path = config.getoption('mountepy_report_json')
+    if json_path:
+        report.save_json(json_path, config.getoption('mountepy_report_count'))
+    delattr(config, _REPORT_KEY)
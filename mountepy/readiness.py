@@ -0,0 +1,544 @@
+"""
+Strategies of checking whether a service is ready to be used.
+"""
+
+import collections
+import errno
+import fcntl
+import os
+import re
+import selectors
+import socket
+import subprocess
+import threading
+import time
+
+import requests
+
+from . import instrumentation
+
+
+class Backoff(collections.namedtuple('Backoff', 'initial, factor, maximum')):
+    """A schedule of growing delays between attempts.
+
+    Attributes:
+        initial (float): First delay, in seconds.
+        factor (float): Each next delay is the previous one multiplied by this.
+        maximum (float): Delays won't be longer than this, in seconds.
+    """
+
+    def delays(self):
+        """
+        Returns:
+            generator[float]: Infinite sequence of delays (in seconds).
+        """
+        delay = self.initial
+        while True:
+            yield delay
+            delay = min(delay * self.factor, self.maximum)
+
+
+DEFAULT_BACKOFF = Backoff(initial=0.001, factor=2.0, maximum=0.05)
+
+
+def wait_for_port(port, host='localhost', timeout=5.0):
+    """Wait until a port starts accepting TCP connections.
+
+    Args:
+        port (int): Port number.
+        host (str): Host address on which the port should exist.
+        timeout (float): In seconds. How long to wait before raising errors.
+
+    Raises:
+        TimeoutError: The port isn't accepting connection after time specified in `timeout`.
+    """
+    wait_for_ports([(host, port)], timeout=timeout)
+
+
+def wait_for_ports(targets, timeout=5.0, processes=(), backoff=DEFAULT_BACKOFF):
+    """Wait until all of the given ports start accepting TCP connections.
+    All the ports are checked at once, with non-blocking connection attempts.
+
+    Args:
+        targets (list[tuple]): (host, port) pairs that should start accepting connections.
+        timeout (float): In seconds. How long to wait before raising errors.
+        processes (list[`subprocess.Popen`]): Processes that should open the ports.
+            If any of them exits before all the ports are open the wait fails immediately.
+        backoff (`Backoff`): Schedule of delays between connection attempts to a single port.
+
+    Returns:
+        dict[tuple, float]: `time.perf_counter()` values from the moments the targets opened.
+
+    Raises:
+        TimeoutError: Some of the ports aren't accepting connections after time specified
+            in `timeout`.
+        ServiceExitedError: One of the `processes` exited.
+    """
+    return _wait_for_targets({target: backoff for target in targets}, timeout, processes)
+
+
+def _wait_for_targets(backoffs, timeout, processes):
+    """Like `wait_for_ports` but each target can have its own `Backoff`."""
+    waiter = _PortWaiter()
+    try:
+        for target, backoff in backoffs.items():
+            waiter.add(target, backoff)
+        for process in processes:
+            waiter.watch_process(process)
+        deadline = time.perf_counter() + timeout
+        while waiter.pending:
+            waiter.wait_any(deadline)
+    finally:
+        waiter.close()
+    return waiter.open_times
+
+
+class _PortWaiter:  # pylint: disable=too-many-instance-attributes
+    """Implementation of `wait_for_ports`.
+    Connection attempts, process exits and wake-up signals are all watched with a single selector.
+
+    Attributes:
+        open_times (dict[tuple, float]): `time.perf_counter()` values from the moments
+            the targets opened.
+    """
+
+    # Used to notice process exits if the system doesn't support process file descriptors.
+    _PROCESS_POLL_INTERVAL = 0.01
+    _WAKEUP = object()
+
+    def __init__(self):
+        self.open_times = {}
+        self._selector = selectors.DefaultSelector()
+        self._add_times = {}
+        self._attempts = collections.Counter()
+        self._delays = {}
+        self._next_attempts = {}
+        self._sockets = {}
+        self._target_processes = {}
+        self._polled_processes = []
+        self._newly_opened = []
+
+    @property
+    def pending(self):
+        """
+        Returns:
+            bool: True if some of the targets aren't open yet.
+        """
+        return bool(self._sockets)
+
+    def add(self, target, backoff, process=None):
+        """Starts waiting for a port.
+
+        Args:
+            target (tuple): (host, port) pair.
+            backoff (`Backoff`): Schedule of delays between connection attempts.
+            process (`subprocess.Popen`): Process that should open the port.
+                It's watched only until the port opens.
+        """
+        self._delays[target] = backoff.delays()
+        self._next_attempts[target] = 0.0
+        self._add_times[target] = time.perf_counter()
+        self._sockets[target] = []
+        if process is not None:
+            self._target_processes[target] = process
+            self.watch_process(process)
+
+    def watch_process(self, process):
+        """Makes the waiting fail with `ServiceExitedError` when the process exits.
+
+        Args:
+            process (`subprocess.Popen`): Watched process.
+        """
+        if process.poll() is not None:
+            _raise_process_exited(process)
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            # no pidfd support in this Python or this kernel
+            self._polled_processes.append(process)
+        else:
+            self._selector.register(_FileDescriptor(pidfd), selectors.EVENT_READ, process)
+
+    def watch_wakeups(self, fileobj):
+        """Makes `wait_any` return when the file has something to read.
+        Reading the file is up to the caller.
+
+        Args:
+            fileobj: File or socket.
+        """
+        self._selector.register(fileobj, selectors.EVENT_READ, self._WAKEUP)
+
+    def wait_any(self, deadline):  # pylint: disable=too-many-branches
+        """Blocks until some of the ports open or one of the wake-up files can be read.
+
+        Args:
+            deadline (float): `time.perf_counter()` value after which `TimeoutError` is raised.
+
+        Returns:
+            list[tuple]: Targets that opened.
+        """
+        self._newly_opened = []
+        while True:
+            now = time.perf_counter()
+            for target, attempt_time in list(self._next_attempts.items()):
+                if attempt_time <= now:
+                    self._attempt_connection(target)
+            if self._newly_opened:
+                return self._newly_opened
+            if now >= deadline:
+                self._raise_timeout()
+
+            select_timeout = min(list(self._next_attempts.values()) + [deadline]) - now
+            if self._polled_processes:
+                select_timeout = min(select_timeout, self._PROCESS_POLL_INTERVAL)
+            woken_up = False
+            for key, _ in self._selector.select(max(select_timeout, 0.0)):
+                if key.data is self._WAKEUP:
+                    woken_up = True
+                elif isinstance(key.data, subprocess.Popen):
+                    _raise_process_exited(key.data)
+                else:
+                    self._finish_connection(*key.data)
+            for process in self._polled_processes:
+                if process.poll() is not None:
+                    _raise_process_exited(process)
+            if self._newly_opened or woken_up:
+                return self._newly_opened
+
+    def close(self):
+        """Releases all the sockets and file descriptors used by the waiter.
+        Wake-up files are left open.
+        """
+        for key in list(self._selector.get_map().values()):
+            self._selector.unregister(key.fileobj)
+            if key.data is not self._WAKEUP:
+                key.fileobj.close()
+        self._selector.close()
+
+    def _unwatch_process(self, process):
+        if process in self._polled_processes:
+            self._polled_processes.remove(process)
+            return
+        for key in list(self._selector.get_map().values()):
+            if key.data is process:
+                self._selector.unregister(key.fileobj)
+                key.fileobj.close()
+
+    def _attempt_connection(self, target):
+        del self._next_attempts[target]
+        self._attempts[target] += 1
+        host, port = target
+        try:
+            addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError:
+            addresses = []
+
+        for family, sock_type, proto, _, address in addresses:
+            sock = socket.socket(family, sock_type, proto)
+            sock.setblocking(False)
+            error = sock.connect_ex(address)
+            if error == 0:
+                sock.close()
+                self._mark_open(target)
+                return
+            elif error in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self._sockets[target].append(sock)
+                self._selector.register(sock, selectors.EVENT_WRITE, (target, sock))
+            else:
+                sock.close()
+        self._schedule_attempt(target)
+
+    def _finish_connection(self, target, sock):
+        if sock not in self._sockets.get(target, ()):
+            # another connection to the target finished earlier in the same batch
+            # and this socket was already closed
+            return
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self._selector.unregister(sock)
+        sock.close()
+        self._sockets[target].remove(sock)
+        if error == 0:
+            self._mark_open(target)
+        else:
+            self._schedule_attempt(target)
+
+    def _schedule_attempt(self, target):
+        if not self._sockets[target]:
+            self._next_attempts[target] = time.perf_counter() + next(self._delays[target])
+
+    def _mark_open(self, target):
+        self.open_times[target] = time.perf_counter()
+        instrumentation.emit(instrumentation.PORT_WAIT, '{}:{}'.format(*target),
+                             self.open_times[target] - self._add_times[target],
+                             attempts=self._attempts[target])
+        self._newly_opened.append(target)
+        for sock in self._sockets.pop(target):
+            self._selector.unregister(sock)
+            sock.close()
+        self._next_attempts.pop(target, None)
+        if target in self._target_processes:
+            self._unwatch_process(self._target_processes.pop(target))
+
+    def _raise_timeout(self):
+        raise TimeoutError(
+            'Waited too long for the ports to start accepting connections: {}'.format(
+                ', '.join('{} on host {}'.format(port, host) for host, port in self._sockets)))
+
+
+def _raise_process_exited(process):
+    raise ServiceExitedError('Process {} exited with code {} before it started serving.'.format(
+        process.args, process.wait()))
+
+
+class _FileDescriptor:
+    """Wraps a raw file descriptor so it can be closed like a socket."""
+
+    def __init__(self, descriptor):
+        self._descriptor = descriptor
+
+    def fileno(self):
+        """
+        Returns:
+            int: The wrapped descriptor.
+        """
+        return self._descriptor
+
+    def close(self):
+        """Closes the descriptor."""
+        os.close(self._descriptor)
+
+
+class ServiceExitedError(Exception):
+    """Means that a service process exited while it was expected to start serving."""
+
+
+class ReadinessProbe:
+    """Base of the strategies that `HttpService` uses to check if a service is ready.
+    The probe is checked repeatedly, with delays between the attempts growing according to
+    the `backoff` schedule.
+
+    Args:
+        backoff (`Backoff`): Schedule of delays between the checks.
+
+    Attributes:
+        backoff (`Backoff`): Schedule of delays between the checks.
+    """
+
+    def __init__(self, backoff=DEFAULT_BACKOFF):
+        self.backoff = backoff
+
+    def popen_kwargs(self):
+        """
+        Returns:
+            dict: Additional arguments for `subprocess.Popen` that the probe needs the service
+                process to be started with.
+        """
+        return {}
+
+    def check(self, service):
+        """Checks the service once.
+
+        Args:
+            service (`HttpService`): The service being started.
+
+        Returns:
+            bool: True if the service is ready.
+        """
+        raise NotImplementedError()
+
+    def wait(self, service, process, timeout):
+        """Blocks until the service is ready.
+
+        Args:
+            service (`HttpService`): The service being started.
+            process (`subprocess.Popen`): The service's process.
+            timeout (float): How long to wait (in seconds) before raising an error.
+
+        Raises:
+            TimeoutError: If the service wasn't ready in time.
+            ServiceExitedError: If the service process exited in the meantime.
+        """
+        deadline = time.perf_counter() + timeout
+        last_error = None
+        for delay in self.backoff.delays():
+            if process.poll() is not None:
+                _raise_process_exited(process)
+            try:
+                if self.check(service):
+                    return
+            except Exception as error:  # pylint: disable=broad-except
+                last_error = error
+            remaining_time = deadline - time.perf_counter()
+            if remaining_time <= 0:
+                raise TimeoutError('Service {} was not ready in time according to {}.'.format(
+                    service.url, self)) from last_error
+            time.sleep(min(delay, remaining_time))
+
+    def __repr__(self):
+        return '{}(backoff={})'.format(type(self).__name__, self.backoff)
+
+
+class PortProbe(ReadinessProbe):
+    """Treats the service as ready when its port starts accepting TCP connections.
+    This is the default strategy.
+
+    Args:
+        backoff (`Backoff`): Schedule of delays between connection attempts.
+    """
+
+    def check(self, service):
+        try:
+            with socket.create_connection(('localhost', service.port)):
+                return True
+        except OSError:
+            return False
+
+    def wait(self, service, process, timeout):
+        wait_for_ports([('localhost', service.port)], timeout=timeout, processes=[process],
+                       backoff=self.backoff)
+
+
+class ImmediateProbe(ReadinessProbe):
+    """Treats the service as ready right after its process is spawned.
+    It's the default for services started with socket handoff, because connections to them
+    queue up in the kernel until the service starts accepting them.
+    """
+
+    def check(self, service):
+        return True
+
+
+class HttpProbe(ReadinessProbe):
+    """Treats the service as ready when a GET on one of its paths returns the expected status.
+
+    Args:
+        path (str): Path of the health endpoint (e.g. "/health").
+        status_code (int): Status code the endpoint needs to return when the service is ready.
+        request_timeout (float): Timeout (in seconds) of a single health check call.
+        backoff (`Backoff`): Schedule of delays between the calls.
+    """
+
+    def __init__(self, path='/', status_code=200, request_timeout=1.0,
+                 backoff=Backoff(initial=0.01, factor=1.5, maximum=0.25)):
+        super().__init__(backoff)
+        self.path = path
+        self.status_code = status_code
+        self.request_timeout = request_timeout
+
+    def check(self, service):
+        try:
+            response = requests.get(service.url + self.path, timeout=self.request_timeout)
+        except requests.exceptions.RequestException:
+            return False
+        return response.status_code == self.status_code
+
+    def __repr__(self):
+        return '{}(path={!r}, status_code={}, backoff={})'.format(
+            type(self).__name__, self.path, self.status_code, self.backoff)
+
+
+class LogLineProbe(ReadinessProbe):
+    """Treats the service as ready when it outputs a line matching a regular expression.
+    The service's output is still passed on to the output of this process.
+
+    Args:
+        pattern (str): Regular expression searched for in each line of the output.
+        stream (str): Which output of the service to watch, "stdout" or "stderr".
+        backoff (`Backoff`): Schedule of the maximum times to wait for new output between
+            the checks of the service process.
+    """
+
+    def __init__(self, pattern, stream='stdout',
+                 backoff=Backoff(initial=0.01, factor=1.5, maximum=0.25)):
+        super().__init__(backoff)
+        if stream not in ('stdout', 'stderr'):
+            raise ValueError('Stream needs to be "stdout" or "stderr", not {!r}'.format(stream))
+        self.pattern = re.compile(pattern.encode() if isinstance(pattern, str) else pattern)
+        self.stream = stream
+
+    def popen_kwargs(self):
+        return {self.stream: subprocess.PIPE}
+
+    def check(self, service):
+        raise NotImplementedError('{} can only wait for a service process.'.format(self))
+
+    def wait(self, service, process, timeout):
+        pipe = getattr(process, self.stream)
+        output_fd = 1 if self.stream == 'stdout' else 2
+        _set_blocking(pipe.fileno(), False)
+        deadline = time.perf_counter() + timeout
+        line_buffer = b''
+        with selectors.DefaultSelector() as selector:
+            selector.register(pipe, selectors.EVENT_READ)
+            for delay in self.backoff.delays():
+                if process.poll() is not None:
+                    _raise_process_exited(process)
+                remaining_time = deadline - time.perf_counter()
+                if remaining_time <= 0:
+                    raise TimeoutError("Service {} didn't output a line matching {!r} "
+                                       "in time.".format(service.url, self.pattern.pattern))
+                if not selector.get_map():
+                    # the service closed its output, only its exit can be noticed now
+                    time.sleep(min(delay, remaining_time))
+                    continue
+                if not selector.select(min(delay, remaining_time)):
+                    continue
+
+                try:
+                    chunk = os.read(pipe.fileno(), 65536)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    selector.unregister(pipe)
+                    continue
+                _write_all(output_fd, chunk)
+                *lines, line_buffer = (line_buffer + chunk).split(b'\n')
+                if any(self.pattern.search(line) for line in lines):
+                    break
+
+        _set_blocking(pipe.fileno(), True)
+        threading.Thread(target=_forward_output, args=(pipe, output_fd), daemon=True).start()
+
+    def __repr__(self):
+        return '{}(pattern={!r}, stream={!r}, backoff={})'.format(
+            type(self).__name__, self.pattern.pattern, self.stream, self.backoff)
+
+
+class CallableProbe(ReadinessProbe):
+    """Treats the service as ready when a user function returns a true value.
+    Exceptions raised by the function mean that the service isn't ready yet.
+
+    Args:
+        function (callable): Takes the `HttpService` as the only argument.
+        backoff (`Backoff`): Schedule of delays between the calls.
+    """
+
+    def __init__(self, function, backoff=Backoff(initial=0.01, factor=1.5, maximum=0.25)):
+        super().__init__(backoff)
+        self.function = function
+
+    def check(self, service):
+        return bool(self.function(service))
+
+    def __repr__(self):
+        return '{}(function={!r}, backoff={})'.format(
+            type(self).__name__, self.function, self.backoff)
+
+
+def _write_all(output_fd, data):
+    while data:
+        data = data[os.write(output_fd, data):]
+
+
+def _set_blocking(fd, blocking):
+    """Like `os.set_blocking`, which needs Python 3.5."""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL,
+                flags & ~os.O_NONBLOCK if blocking else flags | os.O_NONBLOCK)
+
+
+def _forward_output(pipe, output_fd):
+    """Passes the rest of the service's output on, so the service doesn't block on a full pipe."""
+    with pipe:
+        for chunk in iter(lambda: pipe.read1(65536), b''):
+            _write_all(output_fd, chunk)
@@ -0,0 +1,480 @@
+"""
+Parsing of the imposters' JSON returned by Mountebank, without decoding all of it at once,
+and `ImposterRequest`, which keeps a request as compact JSON until it's used.
+"""
+
+import codecs
+import collections
+import datetime
+import json
+import re
+
+import dateutil.parser
+
+_TIMESTAMP_REGEX = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?(Z|[+-]00:?00)$')
+
+
+def parse_timestamp(timestamp):
+    """Parses an ISO-8601 timestamp. The UTC form used by Mountebank (e.g.
+    "2016-01-02T10:20:30.456Z") is parsed much faster than by `dateutil.parser.parse`,
+    which is only used for other forms.
+
+    Returns:
+        `datetime.datetime`: Time with a timezone.
+    """
+    match = _TIMESTAMP_REGEX.match(timestamp)
+    if not match:
+        return dateutil.parser.parse(timestamp)
+    year, month, day, hour, minute, second, fraction, _ = match.groups()
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        int(fraction.ljust(6, '0')) if fraction else 0, datetime.timezone.utc)
+
+
+_WHITESPACE_REGEX = re.compile(r'[ \t\n\r]*')
+_JSON_DECODER = json.JSONDecoder()
+_compact_json = json.JSONEncoder(separators=(',', ':')).encode  # pylint: disable=invalid-name
+
+
+def split_requests_json(imposter_json):
+    """Finds the requests in an imposter's JSON without keeping them decoded.
+    Only one request at a time is held in memory as Python objects,
+    the others are kept as compact JSON.
+
+    Args:
+        imposter_json (str): Imposter's JSON returned by Mountebank.
+
+    Returns:
+        list[str]: JSON texts of the elements of the imposter's "requests" array.
+    """
+    return split_new_requests_json(imposter_json).requests
+
+
+class RequestsPosition(collections.namedtuple('RequestsPosition', 'offset, last_request')):
+    """Where the requests split from an imposter's JSON end.
+
+    Attributes:
+        offset (int): Index after the last request, counted from the start
+            of the "requests" array.
+        last_request (str): Text of the last request, as it is in the imposter's JSON.
+    """
+
+
+class RequestsSplit(collections.namedtuple('RequestsSplit', 'requests, continued, position')):
+    """Result of `split_new_requests_json`.
+
+    Attributes:
+        requests (list[str]): Compact JSON texts of the requests.
+        continued (bool): True if only the requests after the given position were split.
+        position (`RequestsPosition`): Where the last request ends.
+            None if there are no requests.
+    """
+
+
+def split_new_requests_json(imposter_json, position=None):
+    """Like `split_requests_json`, but can continue after the requests split from an earlier
+    version of the imposter's JSON. They are skipped without even scanning them,
+    if the last of them is still in the same place of the JSON.
+
+    Args:
+        imposter_json (str): Imposter's JSON returned by Mountebank.
+        position (`RequestsPosition`): Position of the last request split before.
+
+    Returns:
+        `RequestsSplit`: The requests after the position, or all of the requests
+            if the position isn't valid anymore (e.g. the log was cleared).
+    """
+    index = _expect(imposter_json, _WHITESPACE_REGEX.match(imposter_json).end(), '{')
+    while imposter_json[index] != '}':
+        key, index = _JSON_DECODER.raw_decode(imposter_json, index)
+        index = _expect(imposter_json, _WHITESPACE_REGEX.match(imposter_json, index).end(), ':')
+        if key == 'requests':
+            return _split_json_array(imposter_json, index, position)
+        _, index = _JSON_DECODER.raw_decode(imposter_json, index)
+        index = _skip_comma(imposter_json, index)
+    return RequestsSplit([], False, None)
+
+
+def _split_json_array(text, array_index, position):
+    elements = []
+    index = _expect(text, array_index, '[')
+    continued = False
+    if position is not None:
+        end = array_index + position.offset
+        if text[end - len(position.last_request):end] == position.last_request:
+            index = _skip_comma(text, end)
+            continued = True
+        else:
+            position = None
+    while text[index] != ']':
+        start = index
+        element, index = _JSON_DECODER.raw_decode(text, index)
+        # Mountebank indents its JSON, so the element is stored without the whitespace
+        elements.append(_compact_json(element))
+        position = RequestsPosition(index - array_index, text[start:index])
+        index = _skip_comma(text, index)
+    return RequestsSplit(elements, continued, position)
+
+
+def _expect(text, index, character):
+    """Checks that there's the character at the index, and skips it and the whitespace after it.
+
+    Returns:
+        int: Index of the next token.
+    """
+    if text[index] != character:
+        raise ValueError('Expected "{}" at position {} of JSON.'.format(character, index))
+    return _WHITESPACE_REGEX.match(text, index + 1).end()
+
+
+def _skip_comma(text, index):
+    index = _WHITESPACE_REGEX.match(text, index).end()
+    if text[index] == ',':
+        index = _WHITESPACE_REGEX.match(text, index + 1).end()
+    return index
+
+
+# a JSON string, without decoding it
+_STRING_REGEX = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+_REQUEST_FILTER_FIELDS = frozenset(('method', 'path', 'timestamp'))
+
+
+class _IncompleteJsonError(Exception):
+    """Means that the JSON read so far ends in the middle of a value."""
+
+
+class _JsonStreamReader:
+    """Reads consecutive JSON tokens from a stream of chunks, keeping only the unread part.
+
+    Args:
+        chunks (iterable[bytes]): Parts of UTF-8 encoded JSON.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._index = 0
+        self._exhausted = False
+
+    def read(self, parse):
+        """Parses the next part of the JSON, reading more of the stream if it's needed.
+
+        Args:
+            parse (callable): Takes the read text and the index of the next unparsed character,
+                returns the parsing result and the index after the parsed part.
+
+        Returns:
+            Result of `parse`.
+        """
+        while True:
+            try:
+                result, end = parse(self._text, self._index)
+                if end >= len(self._text) and not self._exhausted:
+                    # a number or a literal can continue in the next chunk
+                    raise _IncompleteJsonError()
+                self._index = end
+                return result
+            except (_IncompleteJsonError, IndexError, ValueError) as ex:
+                if not self._read_more():
+                    if isinstance(ex, ValueError):
+                        raise
+                    raise ValueError('JSON ended unexpectedly.')
+
+    def text_between(self, start, end):
+        """
+        Returns:
+            str: Part of the text read so far. The indexes come from the last `parse`.
+        """
+        return self._text[start:end]
+
+    def _read_more(self):
+        """Reads at least as much text as there is unparsed, so that a value
+        that's parsed again after reading more doesn't make parsing quadratic.
+
+        Returns:
+            bool: False if the stream has ended.
+        """
+        if self._exhausted:
+            return False
+        self._text = self._text[self._index:]
+        self._index = 0
+        added_text = []
+        added_length = 0
+        while added_length < max(len(self._text), 1):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                added_text.append(self._utf8_decoder.decode(b'', final=True))
+                self._exhausted = True
+                break
+            decoded_chunk = self._utf8_decoder.decode(chunk)
+            added_text.append(decoded_chunk)
+            added_length += len(decoded_chunk)
+        self._text += ''.join(added_text)
+        return True
+
+
+def iter_requests_json(chunks, method=None, path=None, start_time=None, end_time=None):
+    """Goes through the requests in a stream of an imposter's JSON.
+    Only the method, path and timestamp of each request are decoded to check the filters.
+    Requests that don't pass them are skipped without decoding the rest of them.
+
+    Args:
+        chunks (iterable[bytes]): Parts of the imposter's JSON.
+        method (str): Only requests with this HTTP method are returned.
+        path (str): Only requests for this path are returned.
+        start_time (`datetime.datetime`): Only requests made at or after this time are returned.
+        end_time (`datetime.datetime`): Only requests made before this time are returned.
+
+    Yields:
+        str: Compact JSON of each request passing the filters.
+    """
+    reader = _JsonStreamReader(chunks)
+    reader.read(lambda text, index: (None, _expect(
+        text, _WHITESPACE_REGEX.match(text, index).end(), '{')))
+    while True:
+        key = reader.read(_read_object_key)
+        if key is None:
+            return
+        if key == 'requests':
+            break
+        reader.read(lambda text, index: (None, _JSON_DECODER.raw_decode(text, index)[1]))
+
+    reader.read(lambda text, index: (None, _expect(text, index, '[')))
+    while True:
+        scanned_request = reader.read(_scan_request)
+        if scanned_request is None:
+            return
+        fields, start, end = scanned_request
+        if method is not None and fields.get('method', '').upper() != method.upper():
+            continue
+        if path is not None and fields.get('path') != path:
+            continue
+        if start_time is not None or end_time is not None:
+            timestamp = parse_timestamp(fields['timestamp'])
+            if start_time is not None and timestamp < start_time:
+                continue
+            if end_time is not None and timestamp >= end_time:
+                continue
+        yield _compact_json(json.loads(reader.text_between(start, end)))
+
+
+def _read_object_key(text, index):
+    """
+    Returns:
+        tuple[str, int]: The key (None at the end of the object) and the index of its value.
+    """
+    index = _skip_comma(text, index)
+    if text[index] == '}':
+        return None, index + 1
+    key, index = _JSON_DECODER.raw_decode(text, index)
+    return key, _expect(text, _WHITESPACE_REGEX.match(text, index).end(), ':')
+
+
+def _scan_request(text, index, field_names=_REQUEST_FILTER_FIELDS):
+    """Finds the end of a request in JSON, decoding only the given fields
+    (by default, the ones needed for filtering).
+
+    Returns:
+        tuple: The decoded fields, and the start and end indexes of the request
+            (None at the end of the array), then the index after the request.
+    """
+    index = _skip_comma(text, index)
+    if text[index] == ']':
+        return None, index + 1
+    start = index
+    index = _expect(text, index, '{')
+    fields = {}
+    while True:
+        key, index = _read_object_key(text, index)
+        if key is None:
+            return (fields, start, index), index
+        if text[index] == '"':
+            match = _STRING_REGEX.match(text, index)
+            if not match:
+                raise _IncompleteJsonError()
+            if key in field_names:
+                fields[key] = json.loads(match.group())
+            index = match.end()
+        else:
+            value, index = _JSON_DECODER.raw_decode(text, index)
+            if key in field_names:
+                fields[key] = value
+
+
+def peek_request_fields(request, field_names):
+    """Gets some fields of a request without making it decode the rest of its JSON
+    (see `ImposterRequest.from_json`), e.g. to index the request.
+
+    Args:
+        request (`ImposterRequest`): The request.
+        field_names (set[str]): Names of the fields, as in Mountebank's JSON.
+
+    Returns:
+        dict: Decoded values of the fields by their names.
+    """
+    raw_json = request._raw_json  # pylint: disable=protected-access
+    if raw_json is None:
+        return {name: getattr(request, _ATTRIBUTE_NAMES.get(name, name)) for name in field_names}
+    (fields, _, _), _ = _scan_request(raw_json, 0, field_names)
+    if 'timestamp' in fields:
+        fields['timestamp'] = parse_timestamp(fields['timestamp'])
+    return fields
+
+
+_ATTRIBUTE_NAMES = {'requestFrom': 'request_from'}
+
+
+# marks the attributes of `ImposterRequest` that weren't decoded from its JSON yet
+_UNDECODED = object()
+_JSON_NAMES = {'request_from': 'requestFrom'}
+
+
+def _find_field_spans(text):
+    """Finds the values of a JSON object's fields, decoding only the values that aren't strings.
+
+    Returns:
+        dict[str, tuple[int, int]]: Start and end indexes of the values by the fields' names.
+    """
+    spans = {}
+    index = _expect(text, _WHITESPACE_REGEX.match(text).end(), '{')
+    while True:
+        key, index = _read_object_key(text, index)
+        if key is None:
+            return spans
+        start = index
+        if text[index] == '"':
+            index = _STRING_REGEX.match(text, index).end()
+        else:
+            index = _JSON_DECODER.raw_decode(text, index)[1]
+        spans[key] = (start, index)
+
+
+def make_imposter_request(request_json):
+    """
+    Args:
+        request_json (dict): Decoded JSON of a request, as it's returned by Mountebank.
+
+    Returns:
+        `ImposterRequest`: The request, with all of its fields decoded.
+    """
+    return ImposterRequest(
+        body=request_json['body'],
+        headers=request_json['headers'],
+        method=request_json['method'],
+        path=request_json['path'],
+        query=request_json['query'],
+        request_from=request_json['requestFrom'],
+        timestamp=parse_timestamp(request_json['timestamp']),
+    )
+
+
+class ImposterRequest:  # pylint: disable=too-many-instance-attributes
+    """Data of a request made on an imposter.
+    When it's created from Mountebank's JSON (see `from_json`) only that JSON is kept,
+    and each attribute is decoded from it on the first access to that attribute.
+    The timestamp is also parsed then.
+
+    It used to be a named tuple. It isn't a `tuple` anymore (``isinstance(request, tuple)``
+    is False), but it keeps the named tuple's protocol: iteration, indexing, ``len``,
+    ``_fields``, ``_asdict`` and ``_replace``, and it's equal to a tuple of the same values.
+
+    Attributes:
+        body (str): Request's body. Can be any valid JSON (this includes raw values)
+        headers (dict): HTTP headers.
+        method (str): HTTP method.
+        path (str): Request's path (e.g. "/bla/1" or "/").
+        query (dict): Query arguments (after "?" in a URL).
+        request_from (str): Request's source address.
+        timestamp (`datetime.datetime`): Time at which the request was made.
+    """
+    __slots__ = ('_raw_json', '_field_spans', '_body', '_headers', '_method', '_path', '_query',
+                 '_request_from', '_timestamp')
+    _fields = ('body', 'headers', 'method', 'path', 'query', 'request_from', 'timestamp')
+
+    def __init__(self, body, headers, method, path, query,  # pylint: disable=too-many-arguments
+                 request_from, timestamp):
+        self._raw_json = None
+        self._field_spans = None
+        self._body = body
+        self._headers = headers
+        self._method = method
+        self._path = path
+        self._query = query
+        self._request_from = request_from
+        self._timestamp = timestamp
+
+    @classmethod
+    def from_json(cls, raw_json):
+        """
+        Args:
+            raw_json (str): JSON of a single request, as it's returned by Mountebank.
+
+        Returns:
+            `ImposterRequest`: Request that will decode the JSON when it's needed.
+        """
+        # pylint: disable=protected-access
+        request = cls.__new__(cls)
+        request._raw_json = raw_json
+        request._field_spans = None
+        for field in cls._fields:
+            setattr(request, '_' + field, _UNDECODED)
+        return request
+
+    def _get(self, field):
+        """
+        Returns:
+            The value of a field, decoded from the JSON if it wasn't yet.
+        """
+        value = getattr(self, '_' + field)
+        if value is _UNDECODED:
+            if self._field_spans is None:
+                self._field_spans = _find_field_spans(self._raw_json)
+            start, end = self._field_spans[_JSON_NAMES.get(field, field)]
+            value = json.loads(self._raw_json[start:end])
+            if field == 'timestamp':
+                value = parse_timestamp(value)
+            setattr(self, '_' + field, value)
+            if all(getattr(self, '_' + name) is not _UNDECODED for name in self._fields):
+                self._raw_json = self._field_spans = None
+        return value
+
+    body = property(lambda self: self._get('body'))
+    headers = property(lambda self: self._get('headers'))
+    method = property(lambda self: self._get('method'))
+    path = property(lambda self: self._get('path'))
+    query = property(lambda self: self._get('query'))
+    request_from = property(lambda self: self._get('request_from'))
+    timestamp = property(lambda self: self._get('timestamp'))
+
+    def _asdict(self):
+        return collections.OrderedDict(zip(self._fields, self))
+
+    def _replace(self, **changes):
+        return ImposterRequest(**dict(self._asdict(), **changes))
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (ImposterRequest, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        return ImposterRequest, tuple(self)
+
+    def __repr__(self):
+        return 'ImposterRequest({})'.format(', '.join(
+            '{}={!r}'.format(field, value) for field, value in zip(self._fields, self)))
@@ -0,0 +1,286 @@
+"""
+Indexed queries over the requests made on imposters.
+"""
+
+import bisect
+import collections
+import heapq
+import threading
+
+from .request_json import peek_request_fields
+
+
+class RequestIndex:  # pylint: disable=too-many-instance-attributes
+    """Indexes of an imposter's request log by method, path and headers.
+    The log is only appended to, so each index only takes the requests added since it was
+    last used. An index is built only when a query needs it, and the requests' fields are
+    read for it without decoding the rest of the requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = None
+        self._request_count = 0
+        # number of the requests in each index, by the field it's made from
+        self._indexed_counts = None
+        self._by_method = None
+        self._by_path = None
+        # distinct paths, sorted, so the ones with a given prefix are next to each other
+        self._paths = None
+        self._by_header = None
+        self._by_header_name = None
+        self._clear([])
+
+    def update(self, requests):
+        """Takes the requests that were added to the log since the last update.
+        They are indexed when a query needs them.
+
+        Args:
+            requests (list[`ImposterRequest`]): The whole request log of the imposter.
+                If it's a different list than the one given to the last update
+                (e.g. the log was cleared), the indexes are built from scratch.
+        """
+        with self._lock:
+            if requests is not self._requests:
+                self._clear(requests)
+            self._request_count = len(requests)
+
+    def find(self, method=None, path=None, path_prefix=None, headers=None):
+        """
+        Args:
+            method (str): HTTP method of the requests.
+            path (str): Path of the requests.
+            path_prefix (str): Beginning of the path of the requests.
+            headers (dict): Headers the requests need to have. The names are case-insensitive.
+                If a value is None, the header can have any value.
+
+        Returns:
+            list[`ImposterRequest`]: The indexed requests matching all of the given criteria,
+                in the order they came in.
+        """
+        with self._lock:
+            position_lists = []
+            if method is not None:
+                self._index('method', self._add_method)
+                position_lists.append(self._by_method.get(method.upper(), []))
+            if path is not None or path_prefix is not None:
+                self._index('path', self._add_path)
+            if path is not None:
+                position_lists.append(self._by_path.get(path, []))
+            if path_prefix is not None:
+                position_lists.append(self._find_by_path_prefix(path_prefix))
+            if headers:
+                self._index('headers', self._add_headers)
+            for name, value in (headers or {}).items():
+                if value is None:
+                    position_lists.append(self._by_header_name.get(name.lower(), []))
+                else:
+                    position_lists.append(self._by_header.get((name.lower(), value), []))
+
+            if not position_lists:
+                return self._requests[:self._request_count]
+            position_lists.sort(key=len)
+            positions = position_lists[0]
+            for other_positions in position_lists[1:]:
+                positions = [position for position in positions
+                             if _contains_sorted(other_positions, position)]
+            return [self._requests[position] for position in positions]
+
+    def _clear(self, requests):
+        self._requests = requests
+        self._request_count = 0
+        self._indexed_counts = collections.Counter()
+        self._by_method = collections.defaultdict(list)
+        self._by_path = collections.defaultdict(list)
+        self._paths = []
+        self._by_header = collections.defaultdict(list)
+        self._by_header_name = collections.defaultdict(list)
+
+    def _index(self, field, add):
+        """Adds the requests that aren't in the index of a field yet.
+
+        Args:
+            field (str): Name of the field in Mountebank's JSON.
+            add (callable): Takes the position of a request and the field's value.
+        """
+        for position in range(self._indexed_counts[field], self._request_count):
+            add(position, peek_request_fields(self._requests[position], {field})[field])
+        self._indexed_counts[field] = self._request_count
+
+    def _add_method(self, position, method):
+        self._by_method[method.upper()].append(position)
+
+    def _add_path(self, position, path):
+        if path not in self._by_path:
+            bisect.insort(self._paths, path)
+        self._by_path[path].append(position)
+
+    def _add_headers(self, position, headers):
+        for name, value in headers.items():
+            name = name.lower()
+            self._by_header_name[name].append(position)
+            for single_value in _header_values(value):
+                self._by_header[(name, single_value)].append(position)
+
+    def _find_by_path_prefix(self, path_prefix):
+        path_index = bisect.bisect_left(self._paths, path_prefix)
+        position_lists = []
+        while path_index < len(self._paths) and self._paths[path_index].startswith(path_prefix):
+            position_lists.append(self._by_path[self._paths[path_index]])
+            path_index += 1
+        return list(heapq.merge(*position_lists))
+
+
+class RequestQuery:
+    """A query over the requests made on an imposter, e.g.
+    ``imposter.query().method('POST').path('/orders').header('X-Request-Id')``.
+    The methods adding criteria return a new query, so one query can be a base for others.
+
+    Method, path, path prefix and header criteria are answered with the imposter's
+    `RequestIndex`, so a query doesn't go through the whole request log.
+    A query is also a predicate on single requests, so it can be given to
+    `Imposter.wait_for_requests`.
+
+    Args:
+        imposter (`Imposter`): The imposter whose requests are queried.
+    """
+
+    def __init__(self, imposter):
+        self._imposter = imposter
+        self._method = None
+        self._path = None
+        self._path_prefix = None
+        self._headers = {}
+        self._predicates = ()
+
+    def method(self, method):
+        """
+        Returns:
+            `RequestQuery`: A query that also requires the given HTTP method.
+        """
+        return self._with(_method=method)
+
+    def path(self, path):
+        """
+        Returns:
+            `RequestQuery`: A query that also requires the given path.
+        """
+        return self._with(_path=path)
+
+    def path_prefix(self, path_prefix):
+        """
+        Returns:
+            `RequestQuery`: A query that also requires the path to start with the given prefix.
+        """
+        return self._with(_path_prefix=path_prefix)
+
+    def header(self, name, value=None):
+        """
+        Args:
+            name (str): Name of the header, case-insensitive.
+            value (str): Value of the header. If it's not given, any value will do.
+
+        Returns:
+            `RequestQuery`: A query that also requires the given header.
+        """
+        return self._with(_headers=dict(self._headers, **{name: value}))
+
+    def where(self, predicate):
+        """
+        Args:
+            predicate (callable): Takes an `ImposterRequest` and tells if it matches.
+                It's only called on the requests that meet the indexed criteria.
+
+        Returns:
+            `RequestQuery`: A query that also requires the predicate to be true.
+        """
+        return self._with(_predicates=self._predicates + (predicate,))
+
+    def all(self):
+        """
+        Returns:
+            list[`ImposterRequest`]: The requests made on the imposter matching the query,
+                in the order they came in.
+        """
+        return self.select(self._imposter.request_index())
+
+    def first(self):
+        """
+        Returns:
+            `ImposterRequest`: The first request matching the query, or None if there isn't one.
+        """
+        matching_requests = self.all()
+        return matching_requests[0] if matching_requests else None
+
+    def count(self):
+        """
+        Returns:
+            int: How many requests match the query.
+        """
+        return len(self.all())
+
+    def exists(self):
+        """
+        Returns:
+            bool: If any request matches the query.
+        """
+        return bool(self.all())
+
+    def wait(self, count=1, timeout=5.0):
+        """Waits until a number of requests matching the query arrive to the imposter.
+
+        Args:
+            count (int): How many requests to wait for.
+            timeout (float): How long to wait for requests.
+
+        Returns:
+            list[`ImposterRequest`]: The requests matching the query.
+        """
+        return self._imposter.wait_for_requests(count, timeout, predicate=self)
+
+    def select(self, index):
+        """
+        Args:
+            index (`RequestIndex`): Indexes of a request log.
+
+        Returns:
+            list[`ImposterRequest`]: The indexed requests matching the query.
+        """
+        matching_requests = index.find(self._method, self._path, self._path_prefix,
+                                       self._headers)
+        for predicate in self._predicates:
+            matching_requests = [request for request in matching_requests if predicate(request)]
+        return matching_requests
+
+    def __call__(self, request):
+        if self._method is not None and request.method.upper() != self._method.upper():
+            return False
+        if self._path is not None and request.path != self._path:
+            return False
+        if self._path_prefix is not None and not request.path.startswith(self._path_prefix):
+            return False
+        if self._headers:
+            request_headers = {name.lower(): value for name, value in request.headers.items()}
+            for name, value in self._headers.items():
+                if name.lower() not in request_headers:
+                    return False
+                if value is not None and value not in _header_values(
+                        request_headers[name.lower()]):
+                    return False
+        return all(predicate(request) for predicate in self._predicates)
+
+    def _with(self, **changes):
+        query = RequestQuery(self._imposter)
+        query.__dict__.update(self.__dict__)
+        query.__dict__.update(changes)
+        return query
+
+
+def _header_values(value):
+    """Mountebank gives the values of repeated headers as lists."""
+    return value if isinstance(value, list) else [value]
+
+
+def _contains_sorted(positions, position):
+    index = bisect.bisect_left(positions, position)
+    return index < len(positions) and positions[index] == position
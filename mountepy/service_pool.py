@@ -0,0 +1,243 @@
+"""
+A pool of warm HTTP service processes that can be reused by many tests.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import logging
+import threading
+
+from .http_client import HttpClient
+from .http_service import HttpService
+
+
+class ServicePool:  # pylint: disable=too-many-instance-attributes
+    """Keeps started `HttpService` instances, so that tests don't have to wait
+    for a service process to spawn and warm up every time they need it.
+    Services are pooled by their command and environment.
+    A service taken from the pool is used by one test at a time.
+
+    Args:
+        reset (callable): Called with a service returned to the pool.
+            It should bring the service back to its initial state.
+            If it raises an error the service is retired.
+        reset_path (str): Path of the service's endpoint that will be called with POST to reset
+            the service when it's returned to the pool. An alternative to `reset`.
+        health_check (callable): Called with a service before it's handed out from the pool.
+            If it returns False or raises an error, the service is retired
+            and another one is handed out. By default only checks whether the service process
+            is still running.
+        max_reuses (int): After how many uses a service is retired.
+            None means that services are reused until they fail.
+        start_timeout (float): How long to wait (in seconds) for a service to start.
+
+    Example:
+        >>> pool = ServicePool(reset_path='/reset', max_reuses=50)
+        >>> pool.prestart(service_command, count=4)
+        >>> with pool.service(service_command) as service:
+        ...     requests.get(service.url)
+    """
+
+    def __init__(self, reset=None, reset_path=None,  # pylint: disable=too-many-arguments
+                 health_check=None, max_reuses=None, start_timeout=5.0):
+        if reset and reset_path:
+            raise ValueError('Only one of reset and reset_path can be given.')
+        self._reset = reset
+        self._reset_path = reset_path
+        self._health_check = health_check
+        self._max_reuses = max_reuses
+        self._start_timeout = start_timeout
+        self._client = HttpClient(timeout=start_timeout)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self._lock = threading.Lock()
+        self._idle_services = collections.defaultdict(collections.deque)
+        self._starting_services = collections.defaultdict(collections.deque)
+        self._service_keys = {}
+        self._uses = {}
+        self._stats = PoolStats(started=0, reused=0, retired=0)
+
+    def acquire(self, process_command, env=None, copy_parent_env=True, **service_kwargs):
+        """Takes a running service from the pool or starts a new one if none is idle.
+
+        Args:
+            process_command: Command that will start the service.
+                See `mountepy.HttpService`.
+            env (dict): Environment variables of the service process.
+            copy_parent_env (bool): Whether the service process gets the parent's environment.
+            **service_kwargs: Other arguments of `mountepy.HttpService` used when a new service
+                needs to be created. They don't distinguish the pooled services.
+
+        Returns:
+            `mountepy.HttpService`: A started service. It needs to be given back with `release`.
+        """
+        key = _make_key(process_command, env, copy_parent_env)
+        while True:
+            service, starting_service = self._take_service(key)
+            if starting_service:
+                try:
+                    service = starting_service.result()
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Prestarting a service failed, trying another one')
+                    continue
+            elif service is None:
+                break
+            if self._is_healthy(service):
+                if not starting_service:
+                    with self._lock:
+                        self._count(reused=1)
+                return service
+            self._retire(service)
+        return self._start_service(key, process_command, env, copy_parent_env, service_kwargs)
+
+    def release(self, service):
+        """Gives a service back to the pool. It's reset or retired.
+
+        Args:
+            service (`mountepy.HttpService`): A service taken with `acquire`.
+        """
+        with self._lock:
+            if service not in self._uses:
+                # the service was already retired, e.g. the pool was closed
+                return
+            self._uses[service] += 1
+            worn_out = self._max_reuses is not None and self._uses[service] >= self._max_reuses
+        if worn_out:
+            self._retire(service)
+            return
+        try:
+            self._reset_service(service)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Resetting service %s failed, retiring it', service.url)
+            self._retire(service)
+            return
+        with self._lock:
+            self._idle_services[self._service_keys[service]].append(service)
+
+    @contextlib.contextmanager
+    def service(self, process_command, env=None, copy_parent_env=True, **service_kwargs):
+        """Context manager taking a service from the pool and giving it back afterwards.
+        Takes the same arguments as `acquire`.
+        """
+        service = self.acquire(process_command, env, copy_parent_env, **service_kwargs)
+        try:
+            yield service
+        finally:
+            self.release(service)
+
+    def prestart(self, process_command, count=1, env=None, copy_parent_env=True,
+                 **service_kwargs):
+        """Starts services in the background, so that they're ready when they're acquired.
+
+        Args:
+            count (int): How many services to start.
+            Other arguments are the same as in `acquire`.
+        """
+        key = _make_key(process_command, env, copy_parent_env)
+        for _ in range(count):
+            starting_service = self._executor.submit(
+                self._start_service, key, process_command, env, copy_parent_env, service_kwargs)
+            with self._lock:
+                self._starting_services[key].append(starting_service)
+
+    def stats(self):
+        """
+        Returns:
+            `PoolStats`: How many services were started, reused and retired by the pool.
+        """
+        with self._lock:
+            return self._stats
+
+    def close(self):
+        """Stops all the services created by the pool, including the ones that are in use."""
+        with self._lock:
+            starting_services = [starting_service
+                                 for queued in self._starting_services.values()
+                                 for starting_service in queued]
+            self._starting_services.clear()
+        for starting_service in starting_services:
+            try:
+                starting_service.result()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        self._executor.shutdown()
+        with self._lock:
+            services = list(self._service_keys)
+            self._idle_services.clear()
+        for service in services:
+            self._retire(service)
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _start_service(self, key, process_command, env, copy_parent_env, service_kwargs):
+        service = HttpService(process_command, env=env, copy_parent_env=copy_parent_env,
+                              **service_kwargs)
+        service.start(self._start_timeout)
+        with self._lock:
+            self._service_keys[service] = key
+            self._uses[service] = 0
+            self._count(started=1)
+        return service
+
+    def _take_service(self, key):
+        with self._lock:
+            if self._idle_services[key]:
+                return self._idle_services[key].popleft(), None
+            if self._starting_services[key]:
+                return None, self._starting_services[key].popleft()
+            return None, None
+
+    def _reset_service(self, service):
+        if self._reset:
+            self._reset(service)
+        elif self._reset_path:
+            self._client.post(service.url + self._reset_path).raise_for_status()
+
+    def _is_healthy(self, service):
+        if service._service_proc.poll() is not None:  # pylint: disable=protected-access
+            return False
+        if not self._health_check:
+            return True
+        try:
+            return self._health_check(service)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Health check of service %s failed', service.url)
+            return False
+
+    def _retire(self, service):
+        with self._lock:
+            if service not in self._service_keys:
+                return
+            del self._service_keys[service]
+            del self._uses[service]
+            self._count(retired=1)
+        try:
+            service.stop()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Service %s didn't stop cleanly", service.url)
+
+    def _count(self, **increments):
+        self._stats = self._stats._replace(**{
+            name: getattr(self._stats, name) + increment
+            for name, increment in increments.items()})
+
+
+def _make_key(process_command, env, copy_parent_env):
+    if not isinstance(process_command, str):
+        process_command = tuple(process_command)
+    return process_command, frozenset((env or {}).items()), copy_parent_env
+
+
+PoolStats = collections.namedtuple('PoolStats', 'started, reused, retired')
+PoolStats.__doc__ = """Counters of a `ServicePool`.
+
+Attributes:
+    started (int): How many services were started.
+    reused (int): How many times an already running service was handed out.
+    retired (int): How many services were stopped.
+"""
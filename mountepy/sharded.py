@@ -0,0 +1,240 @@
+"""
+Imposters spread over many Mountebank processes, so that they aren't limited to a single core.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+
+from .http_client import DEFAULT_POOL_SIZE
+from .mountebank import Mountebank, MountebankWrapper
+
+PLACEMENTS = ('port', 'load')
+
+_log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class ShardedMountebank(MountebankWrapper):
+    """Runs many Mountebank processes (shards) and places each imposter on one of them.
+    Node runs Mountebank on a single thread, so a single process can only use one core
+    and all of its imposters slow down together under load.
+    It's used just like `mountepy.Mountebank`. The `mountepy.mountebank.Imposter` objects
+    talk straight to the shards of their imposters.
+    Calls made to all the shards (e.g. starting them or resetting them) are made concurrently.
+
+    Args:
+        shard_count (int): Number of Mountebank processes. The number of CPUs by default.
+        placement (str): How the shard of a new imposter is chosen.
+            "port" takes the shard with the index equal to the imposter's port modulo
+            the number of shards. "load" takes the shard with the fewest imposters.
+        pool_size (int): How many keep-alive connections to each shard can be open at once.
+        timeout (float): Default timeout (in seconds) of a single call to a shard.
+
+    Attributes:
+        shards (list[`mountepy.Mountebank`]): The Mountebank processes.
+        port (int): Port of the first shard.
+    """
+
+    def __init__(self, shard_count=None, placement='port', pool_size=DEFAULT_POOL_SIZE,
+                 timeout=None):
+        if placement not in PLACEMENTS:
+            raise ValueError('Placement needs to be one of {}, not "{}".'.format(
+                PLACEMENTS, placement))
+        self.shards = [Mountebank(pool_size=pool_size, timeout=timeout)
+                       for _ in range(shard_count or os.cpu_count() or 1)]
+        super().__init__('localhost', self.shards[0].port, pool_size=pool_size, timeout=timeout)
+        self.placement = placement
+        self._executor = self._make_executor()
+        # indexes of the shards of the imposters, by port
+        self._placements = {}
+        self._baseline_placements = None
+        self._placements_lock = threading.Lock()
+
+    def add_imposter(self, imposter_cfg):
+        """Adds an imposter to one of the shards.
+        See `mountepy.mountebank.MountebankWrapper.add_imposter`.
+        """
+        with self._placements_lock:
+            newly_placed = imposter_cfg['port'] not in self._placements
+        shard_index = self._place(imposter_cfg['port'])
+        try:
+            return self.shards[shard_index].add_imposter(imposter_cfg)
+        except Exception:
+            if newly_placed:
+                with self._placements_lock:
+                    self._placements.pop(imposter_cfg['port'], None)
+            raise
+
+    def add_imposters(self, imposter_cfgs):
+        """Adds many imposters, making the calls to each of the shards concurrently.
+        See `mountepy.mountebank.MountebankWrapper.add_imposters`.
+        """
+        shard_cfgs = self._group_by_shard(imposter_cfgs)
+        shard_imposters = self._run_on_shards(
+            lambda shard, cfgs: shard.add_imposters(cfgs) if cfgs else [], shard_cfgs)
+        return self._in_order(imposter_cfgs, shard_imposters)
+
+    def replace_all_imposters(self, imposter_cfgs, keep_unchanged=False):
+        """Replaces the imposters on all the shards concurrently.
+        See `mountepy.mountebank.MountebankWrapper.replace_all_imposters`.
+        """
+        with self._placements_lock:
+            previous_placements = self._placements
+            self._placements = {}
+            if keep_unchanged:
+                # the imposters that don't change are left on their shards
+                self._placements.update(
+                    (imposter_cfg['port'], previous_placements[imposter_cfg['port']])
+                    for imposter_cfg in imposter_cfgs
+                    if imposter_cfg['port'] in previous_placements)
+        shard_cfgs = self._group_by_shard(imposter_cfgs)
+        shard_imposters = self._run_on_shards(
+            lambda shard, cfgs: shard.replace_all_imposters(cfgs, keep_unchanged), shard_cfgs)
+        return self._in_order(imposter_cfgs, shard_imposters)
+
+    def reset(self):
+        """Removes the imposters from all the shards."""
+        self._run_on_shards(lambda shard: shard.reset())
+        with self._placements_lock:
+            self._placements = {}
+
+    def checkpoint(self):
+        """Records the imposters of all the shards as a baseline.
+        See `mountepy.mountebank.MountebankWrapper.checkpoint`.
+        """
+        self._run_on_shards(lambda shard: shard.checkpoint())
+        with self._placements_lock:
+            self._baseline_placements = dict(self._placements)
+
+    def restore(self):
+        """Brings back the imposters of all the shards recorded by `checkpoint`.
+        See `mountepy.mountebank.MountebankWrapper.restore`.
+        """
+        if self._baseline_placements is None:
+            raise ValueError('There is no checkpoint to restore.')
+        self._run_on_shards(lambda shard: shard.restore())
+        with self._placements_lock:
+            self._placements = dict(self._baseline_placements)
+
+    def get_requests(self, imposters=None):
+        """Gets the requests made to many imposters, concurrently.
+
+        Args:
+            imposters (list[`mountepy.mountebank.Imposter`]): The imposters.
+                All the imposters created through this object by default.
+
+        Returns:
+            dict[int, list[`mountepy.mountebank.ImposterRequest`]]: The requests made to
+                the imposters, by their ports.
+        """
+        if imposters is None:
+            with self._placements_lock:
+                ports = list(self._placements)
+            imposters = [self._make_imposter(port) for port in ports]
+        return dict(zip([imposter.port for imposter in imposters],
+                        self._get_executor().map(lambda imposter: imposter.requests(),
+                                                 imposters)))
+
+    def start(self):
+        """Starts all the shards. If any of them doesn't start, the ones that did are stopped."""
+        if self._executor is None:
+            self._executor = self._make_executor()
+        futures = [self._executor.submit(shard.start) for shard in self.shards]
+        concurrent.futures.wait(futures)
+        errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            started_shards = [shard for shard, future in zip(self.shards, futures)
+                              if not future.exception()]
+            list(self._executor.map(self._stop_started_shard, started_shards))
+            raise errors[0]
+
+    def stop(self):
+        """Stops all the shards and the threads making the calls to them.
+        Does nothing if they're already stopped.
+        """
+        if self._executor is None:
+            return
+        try:
+            self._run_on_shards(lambda shard: shard.stop())
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _make_executor(self):
+        return concurrent.futures.ThreadPoolExecutor(max_workers=len(self.shards))
+
+    def _get_executor(self):
+        if self._executor is None:
+            raise RuntimeError('{} is stopped, it needs to be started first.'.format(
+                type(self).__name__))
+        return self._executor
+
+    @staticmethod
+    def _stop_started_shard(shard):
+        try:
+            shard.stop()
+        except Exception:  # pylint: disable=broad-except
+            _log.warning('Stopping shard on port %s failed.', shard.port, exc_info=True)
+
+    def _make_imposter(self, port):
+        # pylint: disable=protected-access
+        return self.shards[self._shard_index(port)]._make_imposter(port)
+
+    def _list_imposters(self):
+        # pylint: disable=protected-access
+        shard_imposters = self._run_on_shards(lambda shard: shard._list_imposters())
+        return [imposter for imposters in shard_imposters for imposter in imposters]
+
+    def _get_replayable_configs(self):
+        # pylint: disable=protected-access
+        shard_cfgs = self._run_on_shards(lambda shard: shard._get_replayable_configs())
+        return [imposter_cfg for cfgs in shard_cfgs for imposter_cfg in cfgs]
+
+    def _run_on_shards(self, function, shard_args=None):
+        """Calls the function for each shard concurrently.
+
+        Args:
+            function (callable): Takes a shard (and its argument, if `shard_args` are given).
+            shard_args (list): Arguments for the calls, one for each shard.
+
+        Returns:
+            list: Results of the calls, in the order of the shards.
+        """
+        executor = self._get_executor()
+        if shard_args is None:
+            return list(executor.map(function, self.shards))
+        return list(executor.map(function, self.shards, shard_args))
+
+    def _shard_index(self, port):
+        with self._placements_lock:
+            return self._placements.get(port, port % len(self.shards))
+
+    def _place(self, port):
+        """
+        Returns:
+            int: Index of the shard on which the imposter with the port should be created.
+        """
+        with self._placements_lock:
+            if port in self._placements:
+                return self._placements[port]
+            if self.placement == 'port':
+                shard_index = port % len(self.shards)
+            else:
+                shard_loads = collections.Counter(self._placements.values())
+                shard_index = min(range(len(self.shards)), key=lambda index: shard_loads[index])
+            self._placements[port] = shard_index
+            return shard_index
+
+    def _group_by_shard(self, imposter_cfgs):
+        shard_cfgs = [[] for _ in self.shards]
+        for imposter_cfg in imposter_cfgs:
+            shard_cfgs[self._place(imposter_cfg['port'])].append(imposter_cfg)
+        return shard_cfgs
+
+    @staticmethod
+    def _in_order(imposter_cfgs, shard_imposters):
+        imposters = {imposter.port: imposter
+                     for imposters in shard_imposters for imposter in imposters}
+        return [imposters[imposter_cfg['port']] for imposter_cfg in imposter_cfgs]
@@ -0,0 +1,65 @@
+"""
+Snapshots of imposter configurations, which Mountebank can load when it starts.
+"""
+
+import hashlib
+import json
+import os
+
+from .mb_mgmt import CACHE_DIR
+
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'snapshots')
+
+
+def save_snapshot(imposter_cfgs, path=None, snapshot_dir=None):
+    """Saves imposter configurations in a file that can be given to `mountepy.Mountebank`
+    as `config_file`.
+    A file that already has the same content isn't written again.
+
+    Args:
+        imposter_cfgs (list[dict]): Mountebank configurations of the imposters.
+        path (str): Where to save the snapshot. If not given, it's saved in `snapshot_dir`,
+            under a name made from the SHA-256 hash of its content. So the same configurations
+            always give the same file, and the file can be reused in the following test runs.
+        snapshot_dir (str): Directory for the snapshots without a given path.
+            `SNAPSHOT_DIR` by default.
+
+    Returns:
+        str: Path of the snapshot.
+    """
+    content = json.dumps({'imposters': imposter_cfgs}, sort_keys=True, indent=2)
+    if path is None:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        path = os.path.join(snapshot_dir or SNAPSHOT_DIR, '{}.json'.format(digest))
+        if os.path.exists(path):
+            return path
+    elif _read_file(path) == content:
+        return path
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # written through a temporary file, so that Mountebank never loads a partial file
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w') as temp_file:
+        temp_file.write(content)
+    os.replace(temp_path, path)
+    return path
+
+
+def load_snapshot(path):
+    """
+    Args:
+        path (str): Path of a snapshot.
+
+    Returns:
+        list[dict]: Mountebank configurations of the imposters in the snapshot.
+    """
+    with open(path) as snapshot_file:
+        return json.load(snapshot_file).get('imposters', [])
+
+
+def _read_file(path):
+    try:
+        with open(path) as snapshot_file:
+            return snapshot_file.read()
+    except FileNotFoundError:
+        return None
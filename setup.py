@@ -3,7 +3,7 @@ import os.path
 from setuptools import setup
 
 project_name = 'mountepy'
-version = '0.4.1'
+version = '0.26.24'
 
 setup_dir = os.path.dirname(os.path.abspath(__file__))
 with open(os.path.join(setup_dir, 'requirements.txt')) as req_file:
@@ -29,6 +29,7 @@ setup(
     keywords='test http mountebank microservice',
     classifiers=[
         'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.5',
         'Operating System :: POSIX :: Linux',
         'Development Status :: 4 - Beta',
         'License :: Freely Distributable',
@@ -0,0 +1,4 @@
+import sys
+
+# mountepy.aio needs Python 3.5
+collect_ignore = [] if sys.version_info >= (3, 5) else ['test_aio.py']
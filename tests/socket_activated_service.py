@@ -0,0 +1,45 @@
+"""
+A service that serves on a socket passed to it according to systemd's socket activation protocol.
+"""
+
+import os
+import signal
+import socket
+import sys
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+SD_LISTEN_FDS_START = 3
+
+
+def example_app(environ, start_response):
+    status = '200 OK'
+    headers = [('Content-type', 'text/plain')]
+
+    start_response(status, headers)
+    return ['Serving on port {}.'.format(os.environ['TEST_APP_PORT']).encode()]
+
+
+class SocketActivatedWSGIServer(WSGIServer):
+
+    def server_bind(self):
+        self.socket.close()
+        self.socket = socket.socket(fileno=SD_LISTEN_FDS_START)
+        self.server_address = self.socket.getsockname()
+        self.server_name = 'localhost'
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+
+    def server_activate(self):
+        # the socket is already listening
+        pass
+
+
+if __name__ == '__main__':
+    if os.environ.get('LISTEN_PID') != str(os.getpid()) or os.environ.get('LISTEN_FDS') != '1':
+        sys.exit('Not started with socket activation.')
+
+    # wsgiref swallows KeyboardInterrupt raised while a request is handled
+    signal.signal(signal.SIGINT, lambda *args: os._exit(0))
+    httpd = SocketActivatedWSGIServer(('', 0), WSGIRequestHandler)
+    httpd.set_app(example_app)
+    httpd.serve_forever()
@@ -0,0 +1,166 @@
+import asyncio
+import os.path
+import sys
+
+import port_for
+import pytest
+import requests
+
+from mountepy import HttpStub, ServiceExitedError
+from mountepy.aio import (AsyncHttpClient, AsyncHttpService, AsyncMountebank, AsyncServiceGroup,
+                          wait_for_port)
+from mountepy.readiness import HttpProbe, LogLineProbe
+
+EXAMPLE_SERVICE_PATH = os.path.join(os.path.dirname(__file__), 'example_service.py')
+SERVICE_COMMAND = [sys.executable, EXAMPLE_SERVICE_PATH, '{port}']
+WARMING_UP_SERVICE_PATH = os.path.join(os.path.dirname(__file__), 'warming_up_service.py')
+WARMING_UP_SERVICE_COMMAND = [sys.executable, WARMING_UP_SERVICE_PATH, '{port}']
+EXITING_SERVICE_COMMAND = [sys.executable, '-c', 'import sys; sys.exit(3)']
+
+
+def _run(coroutine):
+    """Like `asyncio.run`, which needs Python 3.7."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_async_service_start_and_cleanup():
+    async def run():
+        async with AsyncHttpService(SERVICE_COMMAND) as service:
+            assert requests.get(service.url).status_code == 200
+            assert service.time_to_ready > 0
+        return service
+
+    service = _run(run())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(service.url)
+
+
+@pytest.mark.parametrize('probe', [HttpProbe('/health'), LogLineProbe('Warmed up')])
+def test_async_service_probes(probe):
+    async def run():
+        async with AsyncHttpService(WARMING_UP_SERVICE_COMMAND, readiness=probe) as service:
+            assert requests.get(service.url).status_code == 200
+            assert service.time_to_ready >= 0.3
+
+    _run(run())
+
+
+def test_async_service_exit_fails_fast():
+    service = AsyncHttpService(EXITING_SERVICE_COMMAND)
+    with pytest.raises(ServiceExitedError):
+        _run(service.start(timeout=30))
+
+
+def test_async_service_start_timeout():
+    never_starting_service = os.path.join(os.path.dirname(__file__), 'never_starting_service.py')
+    service = AsyncHttpService([sys.executable, never_starting_service])
+    with pytest.raises(TimeoutError):
+        _run(service.start(timeout=0.5))
+
+
+def test_async_service_sync_context_manager():
+    with pytest.raises(TypeError):
+        with AsyncHttpService(SERVICE_COMMAND):
+            pass
+
+
+def test_async_wait_for_port_timeout():
+    with pytest.raises(TimeoutError):
+        _run(wait_for_port(port_for.select_random(), timeout=0.1))
+
+
+def test_async_service_group():
+    async def run():
+        database = AsyncHttpService(SERVICE_COMMAND)
+        api = AsyncHttpService(SERVICE_COMMAND, depends_on=[database])
+        services = [database, api] + [AsyncHttpService(SERVICE_COMMAND) for _ in range(3)]
+        async with AsyncServiceGroup(*services) as group:
+            for service in services:
+                assert requests.get(service.url).status_code == 200
+            assert group.timings[api].start_time >= group.timings[database].ready_time
+            assert group.critical_path()[-1].service in (api,) + tuple(services[2:])
+        return services
+
+    for service in _run(run()):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            requests.get(service.url)
+
+
+def test_async_service_group_with_exiting_service():
+    async def run():
+        working_service = AsyncHttpService(SERVICE_COMMAND)
+        group = AsyncServiceGroup(working_service, AsyncHttpService(EXITING_SERVICE_COMMAND))
+        with pytest.raises(ServiceExitedError):
+            await group.start(timeout=30)
+        return working_service
+
+    service = _run(run())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(service.url)
+
+
+def test_async_service_group_with_single_exiting_service():
+    group = AsyncServiceGroup(AsyncHttpService(EXITING_SERVICE_COMMAND))
+    with pytest.raises(ServiceExitedError):
+        _run(group.start(timeout=30))
+
+
+def test_async_mountebank_imposters():
+    async def run():
+        async with AsyncMountebank() as mb:
+            imposters = await asyncio.gather(*[
+                mb.add_imposter_simple(path='/{}'.format(i), response=str(i)) for i in range(5)])
+            for i, imposter in enumerate(imposters):
+                stub_url = 'http://localhost:{}/{}'.format(imposter.port, i)
+                assert requests.get(stub_url).text == str(i)
+                assert len(await imposter.wait_for_requests()) == 1
+
+            port = port_for.select_random()
+            imposter = await mb.add_multi_stub_imposter_simple(
+                port, [HttpStub('GET', '/a', 200, 'a'), HttpStub('POST', '/b', 201, 'b')])
+            assert requests.post('http://localhost:{}/b'.format(port)).status_code == 201
+            await imposter.destroy()
+
+            await mb.reset()
+            assert mb.client.stats().reused > 0
+
+    _run(run())
+
+
+def test_async_client_repeats_only_idempotent_calls():
+    received_methods = []
+
+    async def handle_connection(reader, writer):
+        # answers only the first request on a connection, then drops the connection
+        for request_number in (1, 2):
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            received_methods.append(request_line.split()[0].decode())
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            if request_number == 1:
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle_connection, '127.0.0.1', 0)
+        url = 'http://127.0.0.1:{}/'.format(server.sockets[0].getsockname()[1])
+        client = AsyncHttpClient()
+        try:
+            await client.get(url)
+            assert (await client.put(url)).status_code == 200
+            with pytest.raises(ConnectionError):
+                await client.post(url)
+        finally:
+            client.close()
+            server.close()
+
+    _run(run())
+    assert received_methods == ['GET', 'PUT', 'PUT', 'POST']
@@ -0,0 +1,70 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+
+import pytest
+
+from mountepy.http_client import ConnectionStats, HttpClient
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"some": "json"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def keep_alive_server_url():
+    server = HTTPServer(('localhost', 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield 'http://localhost:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_client_reuses_connections(keep_alive_server_url):
+    client = HttpClient()
+    for _ in range(5):
+        assert client.get(keep_alive_server_url).json() == {'some': 'json'}
+
+    assert client.stats() == ConnectionStats(opened=1, reused=4)
+
+
+def test_client_close(keep_alive_server_url):
+    client = HttpClient()
+    client.get(keep_alive_server_url)
+    client.close()
+
+    assert client.get(keep_alive_server_url).status_code == 200
+    # the counters aren't reset by closing the connections
+    assert client.stats() == ConnectionStats(opened=2, reused=0)
+
+
+def test_client_stats_kept_for_evicted_pools(keep_alive_server_url):
+    client = HttpClient()
+    client.get(keep_alive_server_url)
+    client.get(keep_alive_server_url)
+    # what happens to the least recently used pool when there are too many hosts
+    client._adapter.poolmanager.clear()
+
+    assert client.stats() == ConnectionStats(opened=1, reused=1)
+
+
+def test_client_default_timeout(monkeypatch):
+    client = HttpClient(timeout=1.5)
+    calls = []
+    monkeypatch.setattr(client._session, 'request', lambda *args, **kwargs: calls.append(kwargs))
+
+    client.get('http://localhost:1234')
+    client.get('http://localhost:1234', timeout=0.1)
+
+    assert [call['timeout'] for call in calls] == [1.5, 0.1]
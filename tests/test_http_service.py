@@ -2,12 +2,14 @@ import os.path
 import subprocess
 import sys
 import threading
+import time
 
 import port_for
 import pytest
 import requests
 
-from mountepy import HttpService, ServiceGroup
+from mountepy import HttpService, ServiceExitedError, ServiceGroup, wait_for_ports
+from mountepy.readiness import Backoff
 
 EXAMPLE_SERVICE_PATH = os.path.join(os.path.dirname(__file__), 'example_service.py')
 SERVICE_COMMAND = [sys.executable, EXAMPLE_SERVICE_PATH, '{port}']
@@ -47,6 +49,63 @@ def test_service_start_timeout_and_cleanup():
     test_service._service_proc.wait(timeout=1.0)
 
 
+SOCKET_ACTIVATED_SERVICE_COMMAND = [
+    sys.executable, os.path.join(os.path.dirname(__file__), 'socket_activated_service.py')]
+
+
+def test_service_socket_handoff():
+    service = HttpService(SOCKET_ACTIVATED_SERVICE_COMMAND, env={'TEST_APP_PORT': '{port}'},
+                          socket_handoff=True)
+    assert service.url == 'http://localhost:{}'.format(service.port)
+    # the socket is only created on start
+    assert service._listening_socket is None
+
+    with service:
+        assert service._listening_socket.getsockname() == ('127.0.0.1', service.port)
+        assert requests.get(service.url).text == 'Serving on port {}.'.format(service.port)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(service.url)
+
+    # the socket is created again on restart
+    with service:
+        assert requests.get(service.url).status_code == 200
+
+
+def test_service_socket_handoff_on_given_port():
+    service_port = port_for.select_random()
+    service = HttpService(SOCKET_ACTIVATED_SERVICE_COMMAND, port=service_port,
+                          env={'TEST_APP_PORT': '{port}'}, socket_handoff=True)
+    with service:
+        assert requests.get(service.url).text == 'Serving on port {}.'.format(service_port)
+
+
+def test_service_exiting_on_start_fails_fast():
+    test_service = HttpService([sys.executable, '-c', 'import sys; sys.exit(3)'])
+
+    start_time = time.perf_counter()
+    with pytest.raises(ServiceExitedError):
+        test_service.start(timeout=10.0)
+    assert time.perf_counter() - start_time < 5.0
+
+
+def test_wait_for_multiple_ports():
+    with HttpService(SERVICE_COMMAND) as service_1, HttpService(SERVICE_COMMAND) as service_2:
+        wait_for_ports([('localhost', service_1.port), ('localhost', service_2.port)])
+
+
+def test_wait_for_ports_timeout():
+    closed_port = port_for.select_random()
+    with pytest.raises(TimeoutError) as error_info:
+        wait_for_ports([('localhost', closed_port)], timeout=0.05)
+    assert str(closed_port) in str(error_info.value)
+
+
+def test_backoff_delays():
+    delays = Backoff(initial=0.01, factor=2.0, maximum=0.05).delays()
+    assert [next(delays) for _ in range(5)] == [0.01, 0.02, 0.04, 0.05, 0.05]
+
+
 def test_service_configuration_through_env_vars():
     service = HttpService(SERVICE_COMMAND[:-1],
                           env={'TEST_APP_PORT': '{port}'})
@@ -92,6 +151,16 @@ def test_service_group_start():
         assert requests.get(test_service_2.url).status_code == 200
 
 
+def test_service_group_start_with_exiting_service():
+    test_service = HttpService(SERVICE_COMMAND)
+    exiting_service = HttpService([sys.executable, '-c', 'import sys; sys.exit(3)'])
+
+    with pytest.raises(ServiceExitedError):
+        ServiceGroup(test_service, exiting_service).start()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(test_service.url)
+
+
 class FakeHttpService:
 
     """
@@ -131,4 +200,97 @@ def test_service_group_stop_timeout():
         services = ServiceGroup(service_1, service_2)
         services.start()
         with pytest.raises(TimeoutError):
-            services.stop(timeout=0.00000001)
\ No newline at end of file
+            services.stop(timeout=0.00000001)
+
+
+class RecordingService:
+
+    """
+    Has start and stop methods like `mountepy.HttpService` and records when they were called.
+    """
+
+    def __init__(self, name, events, start_duration=0.0, depends_on=()):
+        self.name = name
+        self.depends_on = depends_on
+        self._events = events
+        self._start_duration = start_duration
+
+    def start(self):
+        self._events.append(('start', self.name))
+        time.sleep(self._start_duration)
+
+    def stop(self):
+        self._events.append(('stop', self.name))
+
+    def __repr__(self):
+        return self.name
+
+
+def test_service_group_respects_dependencies():
+    events = []
+    database = RecordingService('database', events, start_duration=0.1)
+    api = RecordingService('api', events, depends_on=[database])
+    frontend = RecordingService('frontend', events, depends_on=[api])
+    cache = RecordingService('cache', events)
+    group = ServiceGroup(frontend, api, cache, database)
+
+    group.start()
+    assert events.index(('start', 'api')) > events.index(('start', 'cache'))
+    assert group.timings[api].start_time >= group.timings[database].ready_time
+    assert group.timings[frontend].start_time >= group.timings[api].ready_time
+    assert [timing.service for timing in group.critical_path()] == [database, api, frontend]
+
+    events.clear()
+    group.stop()
+    assert events.index(('stop', 'frontend')) < events.index(('stop', 'api')) \
+        < events.index(('stop', 'database'))
+
+
+def test_service_group_starts_all_independent_services_in_parallel():
+    service_count = 12
+    barrier = threading.Barrier(service_count, timeout=2.0)
+
+    class BarrierService(FakeHttpService):
+        def start(self):
+            barrier.wait()
+
+    ServiceGroup(*[BarrierService() for _ in range(service_count)]).start()
+
+
+def test_service_group_calls_overridden_start():
+    started_services = []
+
+    class CustomStartService(HttpService):
+        def start(self, timeout=10.0):
+            super().start(timeout)
+            started_services.append(self)
+
+    service = CustomStartService(SERVICE_COMMAND)
+    with ServiceGroup(service, HttpService(SERVICE_COMMAND)):
+        assert started_services == [service]
+        assert requests.get(service.url).status_code == 200
+
+
+def test_service_group_http_service_dependencies():
+    test_service_1 = HttpService(SERVICE_COMMAND)
+    test_service_2 = HttpService(SERVICE_COMMAND, depends_on=[test_service_1])
+
+    with ServiceGroup(test_service_2, test_service_1) as group:
+        assert requests.get(test_service_2.url).status_code == 200
+        assert group.timings[test_service_2].start_time >= group.timings[test_service_1].ready_time
+        assert test_service_2.time_to_ready is not None
+
+
+def test_service_group_dependency_outside_group():
+    test_service_1 = HttpService(SERVICE_COMMAND)
+    test_service_2 = HttpService(SERVICE_COMMAND, depends_on=[test_service_1])
+    with pytest.raises(ValueError):
+        ServiceGroup(test_service_2)
+
+
+def test_service_group_dependency_cycle():
+    test_service_1 = HttpService(SERVICE_COMMAND)
+    test_service_2 = HttpService(SERVICE_COMMAND, depends_on=[test_service_1])
+    test_service_1.depends_on.append(test_service_2)
+    with pytest.raises(ValueError):
+        ServiceGroup(test_service_1, test_service_2)
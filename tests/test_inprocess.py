@@ -0,0 +1,212 @@
+import http.client
+import time
+
+import port_for
+import pytest
+import requests
+
+from mountepy import HttpStub
+from mountepy.inprocess import InProcessMountebank, UnsupportedImposterError
+from mountepy.mountebank import http_imposter_config
+
+
+@pytest.fixture
+def mb():
+    with InProcessMountebank() as mb:
+        yield mb
+
+
+def test_inprocess_start_is_fast():
+    start_time = time.perf_counter()
+    with InProcessMountebank() as mb:
+        assert requests.get('http://localhost:{}/config'.format(mb.port)).status_code == 200
+    assert time.perf_counter() - start_time < 0.5
+
+
+def test_inprocess_simple_imposter(mb):
+    imposter = mb.add_imposter_simple(path='/something', response='mock response')
+    stub_url = 'http://localhost:{}/something'.format(imposter.port)
+    assert requests.get(stub_url).text == 'mock response'
+    assert requests.post(stub_url).status_code == 200
+    assert requests.post(stub_url).text == ''
+
+    recorded_requests = imposter.wait_for_requests(3)
+    assert [request.method for request in recorded_requests] == ['GET', 'POST', 'POST']
+    assert recorded_requests[0].path == '/something'
+    assert recorded_requests[0].timestamp.tzinfo is not None
+
+
+def test_inprocess_multi_stub_imposter(mb):
+    port = port_for.select_random()
+    mb.add_multi_stub_imposter_simple(port, [
+        HttpStub('GET', '/a', 200, 'a'),
+        HttpStub('PUT', '/b', 201, {'some': 'json'}),
+    ])
+    assert requests.get('http://localhost:{}/a'.format(port)).text == 'a'
+    response = requests.put('http://localhost:{}/b'.format(port))
+    assert response.status_code == 201
+    assert response.json() == {'some': 'json'}
+    assert response.headers['Content-Type'] == 'application/json'
+
+
+@pytest.mark.parametrize('predicate, matching_url, not_matching_url', [
+    ({'equals': {'path': '/BLA'}}, '/bla', '/bla/1'),
+    ({'equals': {'path': '/BLA'}, 'caseSensitive': True}, '/BLA', '/bla'),
+    ({'equals': {'query': {'q': 'x'}}}, '/?q=x&r=1', '/?q=y'),
+    ({'deepEquals': {'query': {'q': 'x'}}}, '/?q=x', '/?q=x&r=1'),
+    ({'contains': {'path': 'la'}}, '/bla', '/foo'),
+    ({'startsWith': {'path': '/bl'}}, '/bla', '/abla'),
+    ({'endsWith': {'path': 'la'}}, '/bla', '/blu'),
+    ({'matches': {'path': '^/b.a$'}}, '/bxa', '/bxxa'),
+    ({'matches': {'path': r'^/\D+$'}}, '/abc', '/123'),
+    ({'matches': {'path': r'\S+@\S+'}}, '/a@b', '/a@'),
+    ({'matches': {'path': '^/B[L]A$'}}, '/bla', '/blu'),
+    ({'exists': {'query': {'q': True}}}, '/?q=1', '/?r=1'),
+    ({'not': {'equals': {'path': '/bla'}}}, '/foo', '/bla'),
+    ({'or': [{'equals': {'path': '/a'}}, {'equals': {'path': '/b'}}]}, '/b', '/c'),
+])
+def test_inprocess_predicates(mb, predicate, matching_url, not_matching_url):
+    port = port_for.select_random()
+    mb.add_imposter({
+        'port': port,
+        'protocol': 'http',
+        'stubs': [{'predicates': [predicate], 'responses': [{'is': {'statusCode': 201}}]}],
+    })
+    assert requests.get('http://localhost:{}{}'.format(port, matching_url)).status_code == 201
+    assert requests.get('http://localhost:{}{}'.format(port, not_matching_url)).status_code == 200
+
+
+def test_inprocess_cycles_responses_and_default_response(mb):
+    port = port_for.select_random()
+    mb.add_imposter({
+        'port': port,
+        'protocol': 'http',
+        'defaultResponse': {'statusCode': 404, 'body': 'not found'},
+        'stubs': [{
+            'predicates': [{'equals': {'method': 'POST'}}],
+            'responses': [{'is': {'body': 'first'}}, {'is': {'body': 'second'}}],
+        }],
+    })
+    url = 'http://localhost:{}'.format(port)
+    assert [requests.post(url).text for _ in range(3)] == ['first', 'second', 'first']
+    response = requests.get(url)
+    assert (response.status_code, response.text) == (404, 'not found')
+
+
+def test_inprocess_request_body_and_headers(mb):
+    imposter = mb.add_imposter_simple(method='POST')
+    requests.post('http://localhost:{}/?a=1&a=2'.format(imposter.port),
+                  json={'x': 1}, headers={'X-Test': 'bla'})
+    request = imposter.wait_for_requests()[0]
+    assert request.body == '{"x": 1}'
+    assert request.headers['X-Test'] == 'bla'
+    assert request.query == {'a': ['1', '2']}
+
+
+def test_inprocess_repeated_headers(mb):
+    imposter = mb.add_imposter_simple()
+    connection = http.client.HTTPConnection('localhost', imposter.port)
+    connection.putrequest('GET', '/')
+    connection.putheader('X-Test', 'a')
+    connection.putheader('x-test', 'b')
+    connection.endheaders()
+    connection.getresponse().read()
+    connection.close()
+    assert imposter.wait_for_requests()[0].headers['X-Test'] == ['a', 'b']
+
+
+def test_inprocess_destroy_and_reset(mb):
+    first_imposter, second_imposter = mb.add_imposters([
+        http_imposter_config(port_for.select_random(), [HttpStub('GET', '/', 200, 'bla')])
+        for _ in range(2)])
+    first_imposter.destroy()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get('http://localhost:{}'.format(first_imposter.port))
+    assert requests.get('http://localhost:{}'.format(second_imposter.port)).text == 'bla'
+
+    mb.reset()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get('http://localhost:{}'.format(second_imposter.port))
+
+
+def test_inprocess_replace_all_imposters_keeps_unchanged(mb):
+    configs = [http_imposter_config(port_for.select_random(), [HttpStub('GET', '/', 200, 'bla')])
+               for _ in range(2)]
+    first_imposter, _ = mb.replace_all_imposters(configs)
+    requests.get('http://localhost:{}'.format(first_imposter.port))
+    first_imposter, _ = mb.replace_all_imposters(configs, keep_unchanged=True)
+    assert len(first_imposter.requests()) == 1
+
+
+@pytest.mark.parametrize('imposter_config', [
+    {'port': 1234, 'protocol': 'tcp'},
+    {'port': 1234, 'protocol': 'http', 'stubs': [{'responses': [{'proxy': {'to': 'x'}}]}]},
+    {'port': 1234, 'protocol': 'http', 'stubs': [{'responses': [{'inject': 'function'}]}]},
+    {'port': 1234, 'protocol': 'http', 'stubs': [{'predicates': [{'xpath': {}}]}]},
+    {'port': 1234, 'protocol': 'http',
+     'stubs': [{'predicates': [{'equals': {'body': {'json': 'object'}}}]}]},
+    {'port': 1234, 'protocol': 'http',
+     'stubs': [{'responses': [{'is': {'body': 'x', '_mode': 'binary'}}]}]},
+])
+def test_inprocess_unsupported_config(mb, imposter_config):
+    with pytest.raises(UnsupportedImposterError):
+        mb.add_imposter(imposter_config)
+    # the check is also made by the engine for other clients
+    response = requests.post('http://localhost:{}/imposters'.format(mb.port),
+                             json=imposter_config)
+    assert response.status_code == 400
+    assert response.json()['errors'][0]['code'] == 'bad data'
+
+
+def test_inprocess_port_conflict(mb):
+    imposter = mb.add_imposter_simple()
+    with pytest.raises(requests.HTTPError):
+        mb.add_imposter_simple(port=imposter.port)
+
+
+def test_inprocess_pushes_requests(mb):
+    imposter = mb.add_imposter_simple(method='POST')
+    for path in ('/a', '/b', '/a'):
+        requests.post('http://localhost:{}{}'.format(imposter.port, path))
+    received_requests = imposter.wait_for_requests(2, predicate=lambda request: request.path == '/a')
+    assert len(received_requests) == 2
+    # requests not matching any stub are also pushed
+    requests.get('http://localhost:{}/c'.format(imposter.port))
+    assert len(mb.collector.wait(imposter.port, count=4, timeout=1)) == 4
+
+    # the collector is cleared with the imposters
+    mb.reset()
+    with pytest.raises(TimeoutError):
+        imposter.wait_for_requests(timeout=0.01)
+
+
+def test_inprocess_clear_requests(mb):
+    imposter = mb.add_imposter_simple()
+    other_imposter = mb.add_imposter_simple(record_requests=False)
+    for port in (imposter.port, other_imposter.port):
+        requests.get('http://localhost:{}/a'.format(port))
+    imposter.wait_for_requests()
+    assert len(imposter.requests()) == 1
+    assert other_imposter.requests() == []
+
+    imposter.clear_requests()
+    assert imposter.requests() == []
+    with pytest.raises(TimeoutError):
+        imposter.wait_for_requests(timeout=0.01)
+
+
+def test_inprocess_change_stubs(mb):
+    imposter = mb.add_imposter_simple(path='/a', response='a')
+    stub_url = 'http://localhost:{}'.format(imposter.port)
+    imposter.add_stub(HttpStub('GET', '/b', 200, 'b'))
+    imposter.add_stub(HttpStub('GET', '/a', 200, 'first a'), index=0)
+    assert requests.get(stub_url + '/a').text == 'first a'
+    imposter.replace_stub(2, HttpStub('GET', '/b', 200, 'new b'))
+    assert requests.get(stub_url + '/b').text == 'new b'
+    imposter.remove_stub(0)
+    assert requests.get(stub_url + '/a').text == 'a'
+
+    with pytest.raises(requests.HTTPError):
+        imposter.remove_stub(5)
+    with pytest.raises(requests.HTTPError):
+        imposter.add_stub({'responses': [{'proxy': {'to': 'http://localhost'}}]})
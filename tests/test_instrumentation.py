@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from mountepy import HttpService, ServiceGroup, instrumentation
+from mountepy.inprocess import InProcessMountebank
+
+EXAMPLE_SERVICE_PATH = os.path.join(os.path.dirname(__file__), 'example_service.py')
+SERVICE_COMMAND = [sys.executable, EXAMPLE_SERVICE_PATH, '{port}']
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def events():
+    received_events = []
+    instrumentation.add_listener(received_events.append)
+    yield received_events
+    instrumentation.remove_listener(received_events.append)
+
+
+def _kinds(events):
+    return [event.kind for event in events]
+
+
+def test_service_events(events):
+    with HttpService(SERVICE_COMMAND) as service:
+        pass
+
+    assert _kinds(events) == [instrumentation.SERVICE_SPAWN, instrumentation.PORT_WAIT,
+                              instrumentation.SERVICE_READY, instrumentation.SERVICE_STOP]
+    assert events[1].name == 'localhost:{}'.format(service.port)
+    assert events[1].details['attempts'] >= 1
+    assert events[2].duration == service.time_to_ready
+    assert len({events[0].name, events[2].name, events[3].name}) == 1
+    assert str(service.port) in events[0].name
+
+
+def test_service_group_events(events):
+    services = [HttpService(SERVICE_COMMAND) for _ in range(2)]
+    with ServiceGroup(*services) as group:
+        pass
+
+    group_events = [event for event in events if event.kind == instrumentation.GROUP_SERVICE]
+    assert len(group_events) == 2
+    assert {event.duration for event in group_events} == \
+        {timing.duration for timing in group.timings.values()}
+    assert _kinds(events).count(instrumentation.PORT_WAIT) == 2
+
+
+def test_mountebank_calls_report():
+    with InProcessMountebank() as mb:
+        with instrumentation.Report() as report:
+            imposter = mb.add_imposter_simple()
+            imposter.requests()
+            imposter.requests()
+        # not listening anymore
+        imposter.requests()
+
+    mb_url = 'http://localhost:{}'.format(mb.port)
+    imposters = report.slowest_imposters()
+    assert [stats['name'] for stats in imposters].count(
+        'imposter {} on {}'.format(imposter.port, mb_url)) == 1
+    imposter_stats = next(stats for stats in imposters if str(imposter.port) in stats['name'])
+    assert imposter_stats['calls'] == 2
+    assert imposter_stats['response_bytes'] > 0
+    mb_stats = next(stats for stats in imposters if stats['name'] == mb_url)
+    assert mb_stats['request_bytes'] > 0
+
+
+def test_report_aggregation(tmpdir):
+    report = instrumentation.Report()
+    for duration in (0.5, 0.25):
+        report(instrumentation.Event(instrumentation.SERVICE_READY, 'slow', duration, {}))
+    report(instrumentation.Event(instrumentation.SERVICE_READY, 'fast', 0.1, {}))
+    report(instrumentation.Event(instrumentation.SERVICE_STOP, 'fast', 0.1, {}))
+    report(instrumentation.Event(
+        instrumentation.HTTP_CALL, 'GET http://localhost:1/x', 0.1,
+        {'method': 'GET', 'url': 'http://localhost:1/x', 'status_code': None,
+         'request_size': None, 'response_size': None}))
+
+    assert [stats['name'] for stats in report.slowest_services()] == ['slow', 'fast']
+    assert report.slowest_services(1)[0]['ready_time'] == 0.75
+    assert report.slowest_imposters()[0]['failed_calls'] == 1
+    assert len(report.format()) == 5
+
+    json_path = str(tmpdir.join('report.json'))
+    report.save_json(json_path)
+    with open(json_path) as report_file:
+        assert json.load(report_file)['services'][0]['name'] == 'slow'
+
+
+def test_pytest_plugin(tmpdir):
+    tmpdir.join('test_something.py').write(
+        'from mountepy import HttpService\n'
+        'import sys\n\n'
+        'def test_service():\n'
+        '    with HttpService([sys.executable, {!r}, "{{port}}"]):\n'
+        '        pass\n'.format(EXAMPLE_SERVICE_PATH))
+    json_path = str(tmpdir.join('report.json'))
+
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'pytest', '-p', 'mountepy.pytest_plugin', '--mountepy-report',
+         '--mountepy-report-json', json_path, str(tmpdir)],
+        cwd=str(tmpdir), env=dict(os.environ, PYTHONPATH=PROJECT_DIR))
+
+    assert b'mountepy report' in output
+    with open(json_path) as report_file:
+        assert len(json.load(report_file)['services']) == 1
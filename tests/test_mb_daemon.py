@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+from mountepy import mb_daemon
+from mountepy.mb_daemon import DaemonMountebank, SharedMountebank
+
+
+@pytest.fixture
+def daemon_dir(tmpdir):
+    daemon_dir = str(tmpdir.join('daemon'))
+    yield daemon_dir
+    mb_daemon.stop_daemon(daemon_dir)
+
+
+def wait_for_daemon_exit(pid, timeout=10.0):
+    start_time = time.perf_counter()
+    while mb_daemon._is_process_alive(pid):
+        assert time.perf_counter() - start_time < timeout, 'Mountebank daemon is still running'
+        time.sleep(0.05)
+
+
+def test_daemon_reused_between_sessions(daemon_dir):
+    with DaemonMountebank(daemon_dir=daemon_dir) as mb:
+        imposter = mb.add_imposter_simple(response='bla')
+        assert requests.get('http://localhost:{}'.format(imposter.port)).text == 'bla'
+    daemon_info = mb_daemon.read_daemon_info(daemon_dir)
+    assert daemon_info['port'] == mb.port
+
+    with DaemonMountebank(daemon_dir=daemon_dir) as other_mb:
+        assert other_mb.port == mb.port
+        # imposters of the previous session were removed
+        assert not other_mb._get_imposter_ports()
+    assert mb_daemon.read_daemon_info(daemon_dir) == daemon_info
+
+    assert mb_daemon.stop_daemon(daemon_dir)
+    wait_for_daemon_exit(daemon_info['pid'])
+    assert mb_daemon.read_daemon_info(daemon_dir) is None
+    assert not mb_daemon.stop_daemon(daemon_dir)
+
+
+def test_daemon_idle_timeout(daemon_dir):
+    with DaemonMountebank(idle_timeout=0.5, daemon_dir=daemon_dir):
+        daemon_info = mb_daemon.read_daemon_info(daemon_dir)
+        # the daemon isn't idle while it's used
+        time.sleep(1.5)
+        assert mb_daemon.read_daemon_info(daemon_dir) == daemon_info
+    wait_for_daemon_exit(daemon_info['pid'])
+    assert mb_daemon.read_daemon_info(daemon_dir) is None
+
+
+def test_daemon_replaced_if_outdated(daemon_dir, monkeypatch):
+    daemon_info = mb_daemon.ensure_daemon(daemon_dir=daemon_dir)
+    # pretending that Mountebank was upgraded under the same command
+    monkeypatch.setattr('mountepy.mb_daemon.get_mb_version', lambda: '99.0.0')
+
+    new_daemon_info = mb_daemon.ensure_daemon(daemon_dir=daemon_dir)
+    assert new_daemon_info['pid'] != daemon_info['pid']
+    assert not mb_daemon._is_process_alive(daemon_info['pid'])
+
+
+def test_daemon_stale_pidfile(daemon_dir):
+    os.makedirs(daemon_dir)
+    with open(os.path.join(daemon_dir, mb_daemon._PID_FILE), 'w') as pid_file:
+        pid_file.write('999999999')
+    assert mb_daemon.read_daemon_info(daemon_dir) is None
+    assert mb_daemon.ensure_daemon(daemon_dir=daemon_dir)['pid'] != 999999999
+
+
+def test_daemon_with_exiting_mountebank(daemon_dir, monkeypatch):
+    monkeypatch.setattr('mountepy.mb_daemon.get_mb_command',
+                        lambda: [sys.executable, '-c', 'import sys; sys.exit(3)'])
+    start_time = time.perf_counter()
+    with pytest.raises(mb_daemon.MountebankDaemonError):
+        mb_daemon.ensure_daemon(daemon_dir=daemon_dir, timeout=20.0)
+    # the daemon notices that Mountebank exited instead of waiting for its port
+    assert time.perf_counter() - start_time < 10.0
+    assert mb_daemon.read_daemon_info(daemon_dir) is None
+
+
+def test_daemon_command_line(daemon_dir, capsys):
+    assert mb_daemon.main(['status', '--dir', daemon_dir]) == 1
+    mb_daemon.main(['start', '--dir', daemon_dir])
+    assert mb_daemon.main(['status', '--dir', daemon_dir]) == 0
+    mb_daemon.main(['stop', '--dir', daemon_dir])
+    assert mb_daemon.read_daemon_info(daemon_dir) is None
+
+
+def test_shared_mountebank_worker_namespaces(daemon_dir, monkeypatch):
+    monkeypatch.setenv('PYTEST_XDIST_WORKER_COUNT', '2')
+    first_worker = SharedMountebank(worker_id='gw0', daemon_dir=daemon_dir)
+    second_worker = SharedMountebank(worker_id='gw1', daemon_dir=daemon_dir)
+    assert first_worker.imposter_ports == range(30000, 30500)
+    assert second_worker.imposter_ports == range(30500, 31000)
+
+    with first_worker, second_worker:
+        assert first_worker.port == second_worker.port
+        first_imposter = first_worker.add_imposter_simple(response='first')
+        second_imposter = second_worker.add_imposter_simple(response='second')
+        assert first_imposter.port in first_worker.imposter_ports
+        assert second_imposter.port in second_worker.imposter_ports
+        with pytest.raises(ValueError):
+            first_worker.add_imposter_simple(port=second_imposter.port)
+
+        first_worker.reset()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            requests.get('http://localhost:{}'.format(first_imposter.port))
+        assert requests.get('http://localhost:{}'.format(second_imposter.port)).text == 'second'
+
+        first_imposter = first_worker.add_imposter_simple(response='first')
+        second_worker.replace_all_imposters([])
+        assert requests.get('http://localhost:{}'.format(first_imposter.port)).text == 'first'
+        assert first_worker._get_imposter_ports() == {first_imposter.port}
+        assert not second_worker._get_imposter_ports()
+
+
+@pytest.mark.parametrize('worker_id, worker_index', [
+    ('gw0', 0),
+    ('gw17', 17),
+    ('master', 0),
+])
+def test_get_worker_index(worker_id, worker_index):
+    assert mb_daemon.get_worker_index(worker_id) == worker_index
+
+
+def test_get_worker_index_from_env(monkeypatch):
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw5')
+    assert mb_daemon.get_worker_index() == 5
+    monkeypatch.delenv('PYTEST_XDIST_WORKER')
+    assert mb_daemon.get_worker_index() == 0
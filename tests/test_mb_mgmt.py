@@ -1,5 +1,9 @@
+import concurrent.futures
+import hashlib
+import os
 import pytest
 import shutil
+import tarfile
 
 from mountepy import mb_mgmt
 
@@ -45,4 +49,152 @@ def test_get_mb_dir_error(monkeypatch):
 def test_get_node_path_error(monkeypatch):
     monkeypatch.setattr('os.listdir', lambda path: ['not', 'node'])
     with pytest.raises(mb_mgmt.MBStandaloneBrokenError):
-        mb_mgmt._get_node_path('some-fake-path')
\ No newline at end of file
+        mb_mgmt._get_node_path('some-fake-path')
+
+
+@pytest.fixture
+def fake_mb_install(tmpdir, monkeypatch):
+    bin_dir = tmpdir.mkdir('bin')
+    mb_path = bin_dir.join('mb')
+    mb_path.write('#!/bin/sh\n')
+    mb_path.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir))
+    monkeypatch.setattr('mountepy.mb_mgmt.COMMAND_CACHE_PATH', str(tmpdir.join('mb_command.json')))
+    mb_mgmt.get_mb_command.cache_clear()
+    yield mb_path
+    mb_mgmt.get_mb_command.cache_clear()
+
+
+def test_get_mb_command_cached_on_disk(fake_mb_install, monkeypatch):
+    detections = []
+    detect_mb_command = mb_mgmt._detect_mb_command
+    monkeypatch.setattr('mountepy.mb_mgmt._detect_mb_command',
+                        lambda: detections.append(1) or detect_mb_command())
+
+    assert mb_mgmt.get_mb_command() == ['mb']
+    mb_mgmt.get_mb_command.cache_clear()
+    # another process would read the command from the disk
+    assert mb_mgmt.get_mb_command() == ['mb']
+    assert len(detections) == 1
+
+    # the executable changed, so the command is detected again
+    fake_mb_install.setmtime(fake_mb_install.mtime() - 100)
+    mb_mgmt.get_mb_command.cache_clear()
+    assert mb_mgmt.get_mb_command() == ['mb']
+    assert len(detections) == 2
+
+
+def test_get_mb_version_cached_on_disk(fake_mb_install, monkeypatch):
+    fake_mb_install.write('#!/bin/sh\necho 2.0.1\n')
+    mb_mgmt.get_mb_version.cache_clear()
+    try:
+        assert mb_mgmt.get_mb_version() == '2.0.1'
+        mb_mgmt.get_mb_version.cache_clear()
+        mb_mgmt.get_mb_command.cache_clear()
+        # another process reads it from the disk, without running Mountebank
+        monkeypatch.setattr('mountepy.mb_mgmt._detect_mb_version', None)
+        assert mb_mgmt.get_mb_version() == '2.0.1'
+    finally:
+        mb_mgmt.get_mb_version.cache_clear()
+
+
+@pytest.mark.parametrize('cache_content', ['', '{"command": ["mb"]', '[]', '{"command": 1}'])
+def test_get_mb_command_broken_cache(fake_mb_install, cache_content):
+    with open(mb_mgmt.COMMAND_CACHE_PATH, 'w') as cache_file:
+        cache_file.write(cache_content)
+    assert mb_mgmt.get_mb_command() == ['mb']
+    assert mb_mgmt._read_command_cache(mb_mgmt.COMMAND_CACHE_PATH) == ['mb']
+
+
+def test_is_standalone_set_up(tmpdir):
+    assert not mb_mgmt._is_standalone_set_up(str(tmpdir.join('not-existing')))
+    tmpdir.mkdir('daemon')
+    assert not mb_mgmt._is_standalone_set_up(str(tmpdir))
+    tmpdir.mkdir('mountebank-v1.4.3-linux-x64')
+    assert mb_mgmt._is_standalone_set_up(str(tmpdir))
+
+
+@pytest.fixture
+def mb_archive(tmpdir):
+    dist_dir = tmpdir.mkdir('dist').mkdir('mountebank-v9.9.9-linux-x64')
+    dist_dir.mkdir('node-v9.9.9-linux-x64').mkdir('bin').join('node').write('node')
+    dist_dir.mkdir('mountebank').mkdir('bin').join('mb').write('mb')
+    archive_path = str(tmpdir.join('mountebank.tar.gz'))
+    with tarfile.open(archive_path, 'w:gz') as archive:
+        archive.add(str(dist_dir), arcname=dist_dir.basename)
+    with open(archive_path, 'rb') as archive_file:
+        digest = hashlib.sha256(archive_file.read()).hexdigest()
+    return archive_path, digest
+
+
+def test_install_standalone_from_local_archive(tmpdir, mb_archive):
+    archive_path, digest = mb_archive
+    cache_dir = str(tmpdir.join('cache'))
+
+    mb_dir = mb_mgmt.install_standalone(archive_path, digest, cache_dir)
+
+    assert mb_dir == os.path.join(cache_dir, 'mountebank-v9.9.9-linux-x64')
+    assert mb_mgmt._get_node_path(mb_dir).endswith('node-v9.9.9-linux-x64/bin/node')
+    assert os.path.isfile(os.path.join(mb_dir, 'mountebank/bin/mb'))
+    assert sorted(os.listdir(cache_dir)) == ['install.lock', 'mountebank-v9.9.9-linux-x64']
+    # it's not installed again
+    assert mb_mgmt.install_standalone('not-existing.tar.gz', cache_dir=cache_dir) == mb_dir
+
+
+def test_install_standalone_from_mirror_set_in_environment(tmpdir, mb_archive, monkeypatch):
+    archive_path, digest = mb_archive
+    monkeypatch.setenv(mb_mgmt.MB_ARCHIVE_ENV, 'file://' + archive_path)
+    monkeypatch.setenv(mb_mgmt.MB_ARCHIVE_SHA256_ENV, digest.upper())
+
+    mb_dir = mb_mgmt.install_standalone(cache_dir=str(tmpdir.join('cache')))
+
+    assert os.path.isdir(os.path.join(mb_dir, 'mountebank'))
+
+
+def test_install_standalone_wrong_digest(tmpdir, mb_archive):
+    archive_path, _ = mb_archive
+    cache_dir = str(tmpdir.join('cache'))
+
+    with pytest.raises(mb_mgmt.MBStandaloneBrokenError):
+        mb_mgmt.install_standalone(archive_path, 'a' * 64, cache_dir)
+    assert os.listdir(cache_dir) == ['install.lock']
+
+
+def test_install_standalone_refuses_unverified_archive(tmpdir, mb_archive, monkeypatch):
+    archive_path, _ = mb_archive
+    cache_dir = str(tmpdir.join('cache'))
+
+    with pytest.raises(ValueError):
+        mb_mgmt.install_standalone(archive_path, cache_dir=cache_dir)
+    assert not mb_mgmt._is_standalone_set_up(cache_dir)
+
+    monkeypatch.setenv(mb_mgmt.MB_ARCHIVE_UNVERIFIED_ENV, '1')
+    assert os.path.isdir(mb_mgmt.install_standalone(archive_path, cache_dir=cache_dir))
+
+
+def test_install_standalone_default_archive_verified(tmpdir, mb_archive, monkeypatch):
+    archive_path, digest = mb_archive
+    cache_dir = str(tmpdir.join('cache'))
+    monkeypatch.setattr(mb_mgmt, 'MB_ARCHIVE_URL', 'file://' + archive_path)
+    monkeypatch.setattr(mb_mgmt, 'MB_ARCHIVE_SHA256', 'a' * 64)
+
+    with pytest.raises(mb_mgmt.MBStandaloneBrokenError):
+        mb_mgmt.install_standalone(cache_dir=cache_dir, allow_unverified=True)
+    assert os.listdir(cache_dir) == ['install.lock']
+
+    monkeypatch.setattr(mb_mgmt, 'MB_ARCHIVE_SHA256', digest)
+    assert os.path.isdir(mb_mgmt.install_standalone(cache_dir=cache_dir))
+
+
+def test_install_standalone_concurrently(tmpdir, mb_archive):
+    archive_path, digest = mb_archive
+    cache_dir = str(tmpdir.join('cache'))
+    # a leftover from an interrupted installation
+    tmpdir.mkdir('cache').mkdir('.install-interrupted')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        mb_dirs = list(executor.map(
+            lambda _: mb_mgmt.install_standalone(archive_path, digest, cache_dir), range(8)))
+
+    assert len(set(mb_dirs)) == 1
+    assert sorted(os.listdir(cache_dir)) == ['install.lock', 'mountebank-v9.9.9-linux-x64']
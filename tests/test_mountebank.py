@@ -1,13 +1,20 @@
+import json
+import pickle
 import subprocess
+import threading
 from unittest.mock import MagicMock
 
+import dateutil.parser
 import port_for
 import pytest
 import requests
 
 from mountepy import ExistingMountebank, HttpStub, Mountebank
-from mountepy.mountebank import Imposter, MountebankWrapper
+from mountepy.mountebank import (Imposter, ImposterRequest, MountebankWrapper, RequestCollector,
+                                 _with_request_push, http_imposter_config)
 from mountepy.mb_mgmt import get_mb_command
+from mountepy.request_json import (_UNDECODED, iter_requests_json, make_imposter_request,
+                                   parse_timestamp, split_new_requests_json, split_requests_json)
 
 
 def test_mountebank_set_impostor_and_cleanup():
@@ -120,6 +127,97 @@ def test_wait_for_impostor_requests():
     impostor.wait_for_requests(timeout=0.5)
 
 
+def test_mountebank_reuses_connections():
+    with Mountebank() as mb:
+        imposters = [mb.add_imposter_simple() for _ in range(3)]
+        for imposter in imposters:
+            imposter.requests()
+        mb.reset()
+
+        stats = mb.client.stats()
+        assert stats.opened == 1
+        assert stats.reused == 6
+
+
+def _simple_imposter_configs(count):
+    return [
+        http_imposter_config(
+            port_for.select_random(),
+            [HttpStub(method='GET', path='/', status_code=200, response=str(index))])
+        for index in range(count)]
+
+
+def test_mountebank_add_imposters():
+    imposter_configs = _simple_imposter_configs(3)
+
+    with Mountebank() as mb:
+        imposters = mb.add_imposters(imposter_configs)
+
+        # checking the existing imposters and creating them all at once
+        assert sum(mb.client.stats()) == 2
+        assert [imposter.port for imposter in imposters] == \
+            [imposter_cfg['port'] for imposter_cfg in imposter_configs]
+        for index, imposter in enumerate(imposters):
+            assert requests.get('http://localhost:{}'.format(imposter.port)).text == str(index)
+
+
+def test_mountebank_add_imposters_leaves_existing_ones():
+    with Mountebank() as mb:
+        existing_imposter = mb.add_imposter_simple()
+        requests.get('http://localhost:{}'.format(existing_imposter.port))
+
+        new_imposters = mb.add_imposters(_simple_imposter_configs(2))
+
+        assert len(existing_imposter.requests()) == 1
+        for imposter in new_imposters:
+            assert requests.get('http://localhost:{}'.format(imposter.port)).status_code == 200
+
+
+def test_mountebank_add_imposters_next_to_existing_ones():
+    with Mountebank() as mb:
+        existing_imposter = mb.add_imposter_simple(response='existing')
+        stats_before = sum(mb.client.stats())
+
+        new_imposters = mb.add_imposters(_simple_imposter_configs(3))
+
+        # checking the existing imposters and creating them all again with the new ones
+        assert sum(mb.client.stats()) - stats_before == 2
+        assert requests.get('http://localhost:{}'.format(existing_imposter.port)).text == \
+            'existing'
+        for index, imposter in enumerate(new_imposters):
+            assert requests.get('http://localhost:{}'.format(imposter.port)).text == str(index)
+
+
+def test_mountebank_replace_all_imposters():
+    with Mountebank() as mb:
+        old_imposter = mb.add_imposter_simple()
+        new_imposters = mb.replace_all_imposters(_simple_imposter_configs(2))
+
+        imposters_url = 'http://localhost:{}/imposters'.format(mb.port)
+        assert {imposter['port'] for imposter in requests.get(imposters_url).json()['imposters']} \
+            == {imposter.port for imposter in new_imposters}
+        with pytest.raises(requests.exceptions.ConnectionError):
+            requests.get('http://localhost:{}'.format(old_imposter.port))
+
+
+def test_mountebank_replace_all_imposters_keeps_unchanged():
+    kept_config, removed_config, changed_config = _simple_imposter_configs(3)
+
+    with Mountebank() as mb:
+        kept_imposter, _, _ = mb.replace_all_imposters([kept_config, removed_config, changed_config])
+        requests.get('http://localhost:{}'.format(kept_imposter.port))
+
+        changed_config = http_imposter_config(
+            changed_config['port'],
+            [HttpStub(method='GET', path='/', status_code=200, response='changed')])
+        mb.replace_all_imposters([kept_config, changed_config], keep_unchanged=True)
+
+        assert len(kept_imposter.requests()) == 1
+        assert requests.get('http://localhost:{}'.format(changed_config['port'])).text == 'changed'
+        with pytest.raises(requests.exceptions.ConnectionError):
+            requests.get('http://localhost:{}'.format(removed_config['port']))
+
+
 def test_mountebank_reset():
     test_port = port_for.select_random()
     with Mountebank() as mb:
@@ -166,3 +264,379 @@ def test_existing_mountebank_simple_imposter():
         assert imposter.wait_for_requests()[0].body == test_body
 
     mb_process.terminate()
+
+
+def test_request_collector_wakes_up_waiter():
+    collector = RequestCollector()
+    request_json = {'method': 'GET', 'path': '/bla', 'query': {}, 'headers': {}, 'body': '',
+                    'requestFrom': '127.0.0.1:1234'}
+    threading.Timer(0.1, collector.push, [1234, request_json]).start()
+    threading.Timer(0.2, collector.push, [1234, dict(request_json, method='POST')]).start()
+
+    received_requests = collector.wait(1234, predicate=lambda request: request.method == 'POST')
+    assert [request.method for request in received_requests] == ['POST']
+    assert len(collector.wait(1234, count=2, timeout=0)) == 2
+
+    collector.clear(1234)
+    with pytest.raises(TimeoutError):
+        collector.wait(1234, timeout=0.01)
+
+
+def test_request_collector_checks_each_request_once():
+    collector = RequestCollector()
+    request_json = {'method': 'GET', 'path': '/bla'}
+    checked_requests = []
+
+    def predicate(request):
+        checked_requests.append(request)
+        return request.method == 'POST'
+
+    for delay in (0.05, 0.1, 0.15):
+        threading.Timer(delay, collector.push, [1234, request_json]).start()
+        # requests to other imposters don't get checked
+        threading.Timer(delay, collector.push, [4321, request_json]).start()
+    threading.Timer(0.2, collector.push, [1234, dict(request_json, method='POST')]).start()
+
+    assert len(collector.wait(1234, predicate=predicate)) == 1
+    assert len(checked_requests) == 4
+
+
+def test_request_collector_http_endpoint():
+    collector = RequestCollector()
+    collector.start()
+    try:
+        # decorate functions in Mountebank don't get the timestamp
+        requests.post('{}/4321'.format(collector.url), json={'method': 'PUT', 'path': '/'})
+        request = collector.wait(4321)[0]
+        assert request.method == 'PUT'
+        assert request.timestamp is not None
+    finally:
+        collector.stop()
+
+
+def test_request_push_config():
+    imposter_cfg = http_imposter_config(4545, [HttpStub('GET', '/', 200, 'bla')])
+    push_cfg = _with_request_push(imposter_cfg, 'http://localhost:5555')
+
+    assert len(imposter_cfg['stubs']) == 1
+    assert len(push_cfg['stubs']) == 2
+    # the catch-all stub at the end
+    assert 'predicates' not in push_cfg['stubs'][1]
+    for stub in push_cfg['stubs']:
+        decorate_js = stub['responses'][0]['_behaviors']['decorate']
+        assert 'port: 5555' in decorate_js
+        assert "path: '/4545'" in decorate_js
+
+
+def test_mountebank_push_requests_allows_injection():
+    mb = Mountebank(push_requests=True)
+    assert '--allowInjection' in mb.process._process_command
+    assert isinstance(mb.collector, RequestCollector)
+    assert Mountebank().collector is None
+
+
+def _fake_request_json(number):
+    return {'method': 'GET', 'path': '/{}'.format(number), 'query': {}, 'headers': {},
+            'body': '', 'requestFrom': '127.0.0.1:1234',
+            'timestamp': '2016-01-02T10:20:{:02}.456Z'.format(number)}
+
+
+def _fake_imposter_content(request_numbers):
+    return json.dumps({
+        'protocol': 'http',
+        'port': 666,
+        'numberOfRequests': len(request_numbers),
+        'requests': [_fake_request_json(number) for number in request_numbers],
+        'stubs': [],
+    }, indent=2).encode()
+
+
+def test_imposter_parses_only_new_requests(monkeypatch):
+    client = MagicMock()
+    imposter = Imposter(666, 666, client=client)
+    parsed_requests = []
+    from_json = ImposterRequest.from_json
+    monkeypatch.setattr(ImposterRequest, 'from_json',
+                        lambda raw_json: parsed_requests.append(raw_json) or from_json(raw_json))
+
+    client.get.return_value.content = _fake_imposter_content(range(3))
+    assert [request.path for request in imposter.requests()] == ['/0', '/1', '/2']
+    client.get.return_value.content = _fake_imposter_content(range(5))
+    assert [request.path for request in imposter.requests(since=3)] == ['/3', '/4']
+    assert len(parsed_requests) == 5
+
+    # the log got cleared, everything needs to be parsed again
+    client.get.return_value.content = _fake_imposter_content(range(5, 7))
+    assert [request.path for request in imposter.requests()] == ['/5', '/6']
+    assert len(parsed_requests) == 7
+
+
+def test_imposter_request_lazy_decoding():
+    request_json = _fake_request_json(1)
+    request = ImposterRequest.from_json(json.dumps(request_json))
+    eager_request = make_imposter_request(request_json)
+
+    assert request == eager_request
+    assert request.method == 'GET'
+    assert request.timestamp == eager_request.timestamp
+    body, headers, method, path, query, request_from, timestamp = request
+    assert (path, request[3], request._asdict()['path']) == ('/1', '/1', '/1')
+    assert request._replace(path='/2').path == '/2'
+    assert pickle.loads(pickle.dumps(request)) == request
+    assert repr(request).startswith("ImposterRequest(body='', headers={}, method='GET'")
+    with pytest.raises(AttributeError):
+        request.some_attribute = 1
+
+
+def test_imposter_request_decodes_single_fields():
+    request_json = dict(_fake_request_json(1), headers={'A': 'b'}, body='a "quoted" body')
+    request = ImposterRequest.from_json(json.dumps(request_json))
+
+    assert request.path == '/1'
+    assert request._headers is _UNDECODED
+    assert request.body == 'a "quoted" body'
+    assert request.headers == {'A': 'b'}
+    assert request._raw_json is not None
+    assert tuple(request) == tuple(make_imposter_request(request_json))
+    # everything is decoded, so the JSON isn't needed anymore
+    assert request._raw_json is None
+
+
+@pytest.mark.parametrize('imposter_json, request_count', [
+    ('{"port": 1, "requests": []}', 0),
+    ('{"port": 1}', 0),
+    (' { "name" : "requests", "stubs": [{"requests": [1]}], "requests" : [ {"a": "]"}, {} ] }', 2),
+])
+def test_split_requests_json(imposter_json, request_count):
+    assert len(split_requests_json(imposter_json)) == request_count
+
+
+def test_split_new_requests_json():
+    first_split = split_new_requests_json(
+        '{"port": 1, "requests": [\n {"a": 1},\n {"a": 2}\n]}')
+    assert first_split.requests == ['{"a":1}', '{"a":2}']
+    assert not first_split.continued
+
+    # the imposter's fields before the requests can change
+    split = split_new_requests_json(
+        '{"port": 1, "numberOfRequests": 3, "requests": [\n {"a": 1},\n {"a": 2},\n {"a": 3}\n]}',
+        first_split.position)
+    assert split.requests == ['{"a":3}']
+    assert split.continued
+    assert split_new_requests_json(
+        '{"numberOfRequests": 2, "requests": [\n {"a": 1},\n {"a": 2}\n]}',
+        first_split.position) == (
+            [], True, first_split.position)
+
+    # the log was cleared
+    split = split_new_requests_json('{"port": 1, "requests": [\n {"a": 4}\n]}',
+                                    first_split.position)
+    assert split.requests == ['{"a":4}']
+    assert not split.continued
+    assert split_new_requests_json('{"port": 1, "requests": []}', split.position) == \
+        ([], False, None)
+
+
+def test_imposter_requests_since_real_mountebank():
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple()
+        stub_url = 'http://localhost:{}'.format(imposter.port)
+        requests.get(stub_url + '/a')
+        assert [request.path for request in imposter.requests()] == ['/a']
+        requests.get(stub_url + '/b')
+        assert [request.path for request in imposter.requests(since=1)] == ['/b']
+
+
+@pytest.mark.parametrize('timestamp', [
+    '2016-01-02T10:20:30.456Z',
+    '2016-01-02T10:20:30Z',
+    '2016-01-02T10:20:30.123456+00:00',
+    '2016-01-02T10:20:30.456+02:00',
+    '2016-01-02 10:20:30',
+])
+def test_parse_timestamp(timestamp):
+    assert parse_timestamp(timestamp) == dateutil.parser.parse(timestamp)
+
+
+def _chunked(content, chunk_size):
+    return [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 100000])
+def test_iter_requests_json_chunks(chunk_size):
+    content = _fake_imposter_content(range(10))
+    raw_requests = list(iter_requests_json(_chunked(content, chunk_size)))
+    assert raw_requests == split_requests_json(content.decode())
+
+
+def test_iter_requests_json_non_ascii_and_escapes():
+    request_json = dict(_fake_request_json(1), body='zażółć "gęślą" \\ jaźń ]}')
+    content = json.dumps({'requests': [request_json], 'port': 1}, ensure_ascii=False).encode()
+    for chunk_size in (1, 3):
+        raw_requests = list(iter_requests_json(_chunked(content, chunk_size)))
+        assert ImposterRequest.from_json(raw_requests[0]).body == request_json['body']
+
+
+def test_iter_requests_json_filters():
+    requests_json = [dict(_fake_request_json(i), method='POST' if i % 2 else 'GET')
+                     for i in range(10)]
+    content = json.dumps({'requests': requests_json}).encode()
+
+    def paths(**filters):
+        return [json.loads(raw_request)['path']
+                for raw_request in iter_requests_json(_chunked(content, 50), **filters)]
+
+    assert paths(method='post') == ['/1', '/3', '/5', '/7', '/9']
+    assert paths(path='/4') == ['/4']
+    assert paths(start_time=parse_timestamp('2016-01-02T10:20:03.456Z'),
+                 end_time=parse_timestamp('2016-01-02T10:20:06Z')) == ['/3', '/4', '/5']
+
+
+@pytest.mark.parametrize('content', [b'{"requests": [{"path": "/"', b'{"requests": [{"path": "/"}x'])
+def test_iter_requests_json_broken(content):
+    with pytest.raises(ValueError):
+        list(iter_requests_json(_chunked(content, 5)))
+
+
+def test_imposter_iter_requests():
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple(method='POST')
+        stub_url = 'http://localhost:{}'.format(imposter.port)
+        for path in ('/a', '/b', '/a'):
+            requests.post(stub_url + path, data='x' * 1000)
+        requests.get(stub_url + '/a')
+
+        received_requests = list(imposter.iter_requests(method='POST', path='/a', chunk_size=100))
+        assert len(received_requests) == 2
+        assert received_requests[0].body == 'x' * 1000
+        assert len(list(imposter.iter_requests())) == 4
+
+
+def test_http_imposter_config_record_requests():
+    stubs = [HttpStub('GET', '/', 200, '')]
+    assert 'recordRequests' not in http_imposter_config(1, stubs)
+    assert http_imposter_config(1, stubs, record_requests=False)['recordRequests'] is False
+
+
+def test_imposter_not_recording_requests():
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple(record_requests=False)
+        requests.get('http://localhost:{}'.format(imposter.port))
+        assert imposter.requests() == []
+
+
+def test_imposter_clear_requests():
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple()
+        stub_url = 'http://localhost:{}'.format(imposter.port)
+        requests.get(stub_url + '/a')
+        assert len(imposter.requests()) == 1
+        imposter.clear_requests()
+        assert imposter.requests() == []
+        requests.get(stub_url + '/b')
+        assert [request.path for request in imposter.requests()] == ['/b']
+
+
+def test_imposter_request_trimming():
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple()
+        stub_url = 'http://localhost:{}'.format(imposter.port)
+        with imposter.start_trimming(interval=0.01) as trimmer:
+            for path in ('/a', '/b', '/a'):
+                requests.get(stub_url + path)
+        assert trimmer.counts == {'/a': 2, '/b': 1}
+        assert imposter.requests() == []
+        assert trimmer.trim() == 0
+        # stopping again doesn't fail
+        trimmer.stop()
+
+
+def test_http_stub_to_json():
+    stub = HttpStub('POST', '/a', 201, 'bla')
+    assert stub.to_json() == http_imposter_config(1, [stub])['stubs'][0]
+    assert stub.to_json()['responses'][0]['is']['statusCode'] == 201
+
+
+def test_imposter_change_stubs():
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple(path='/a', response='a')
+        stub_url = 'http://localhost:{}'.format(imposter.port)
+
+        imposter.add_stub(HttpStub('GET', '/b', 200, 'b'))
+        imposter.add_stub(HttpStub('GET', '/a', 200, 'first a'), index=0)
+        assert requests.get(stub_url + '/a').text == 'first a'
+        assert requests.get(stub_url + '/b').text == 'b'
+
+        imposter.replace_stub(2, HttpStub('GET', '/b', 200, 'new b'))
+        assert requests.get(stub_url + '/b').text == 'new b'
+        imposter.remove_stub(0)
+        assert requests.get(stub_url + '/a').text == 'a'
+
+        # the configuration kept by Mountebank object follows the changes
+        imposter_config = http_imposter_config(imposter.port, [
+            HttpStub('GET', '/a', 200, 'a'), HttpStub('GET', '/b', 200, 'new b')])
+        assert mb._imposter_configs[imposter.port] == imposter_config
+        mb.replace_all_imposters([imposter_config], keep_unchanged=True)
+        assert requests.get(stub_url + '/b').text == 'new b'
+
+
+def test_imposter_add_stub_pushing_requests():
+    client = MagicMock()
+    collector = RequestCollector()
+    collector.url = 'http://localhost:1234'
+    configs = {666: http_imposter_config(666, [HttpStub('GET', '/', 200, '')])}
+    imposter = Imposter(1, 666, client=client, collector=collector, configs=configs)
+
+    imposter.add_stub({'responses': [{'is': {'body': 'bla'}}]})
+    body = client.post.call_args[1]['json']
+    # added before the stub pushing all the other requests
+    assert body['index'] == 1
+    assert 'decorate' in body['stub']['responses'][0]['_behaviors']
+    assert configs[666]['stubs'][1] == {'responses': [{'is': {'body': 'bla'}}]}
+
+
+def test_mountebank_checkpoint_restore():
+    with Mountebank() as mb:
+        with pytest.raises(ValueError):
+            mb.restore()
+        used_imposter = mb.add_imposter_simple(response='used')
+        changed_imposter = mb.add_imposter_simple(response='changed')
+        removed_imposter = mb.add_imposter_simple(response='removed')
+        untouched_imposter = mb.add_imposter_simple(response='untouched')
+        mb.checkpoint()
+
+        requests.get('http://localhost:{}'.format(used_imposter.port))
+        changed_imposter.replace_stub(0, HttpStub('GET', '/', 200, 'other'))
+        removed_imposter.destroy()
+        added_imposter = mb.add_imposter_simple()
+
+        delete_calls = []
+        delete = mb.client.delete
+        mb.client.delete = lambda url, **kwargs: delete_calls.append(url) or delete(url, **kwargs)
+        mb.restore()
+
+        assert mb._get_imposter_ports() == {used_imposter.port, changed_imposter.port,
+                                            removed_imposter.port, untouched_imposter.port}
+        assert used_imposter.requests() == []
+        for imposter, response in ((changed_imposter, 'changed'), (removed_imposter, 'removed'),
+                                   (untouched_imposter, 'untouched')):
+            assert requests.get('http://localhost:{}'.format(imposter.port)).text == response
+        assert sorted(delete_calls) == sorted([
+            used_imposter.url + '/savedRequests', changed_imposter.url, added_imposter.url])
+
+        # the baseline stays after restoring
+        mb.add_imposter_simple()
+        mb.restore()
+        assert len(mb._get_imposter_ports()) == 4
+
+
+def test_mountebank_checkpoint_after_destroy():
+    with Mountebank() as mb:
+        kept_imposter = mb.add_imposter_simple()
+        destroyed_imposter = mb.add_imposter_simple()
+        destroyed_imposter.destroy()
+        mb.checkpoint()
+
+        mb.restore()
+
+        assert mb._get_imposter_ports() == {kept_imposter.port}
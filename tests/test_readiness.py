@@ -0,0 +1,101 @@
+import os.path
+import socket
+import sys
+
+import pytest
+import requests
+
+from mountepy import HttpService, ServiceExitedError, ServiceGroup, wait_for_ports
+from mountepy.readiness import CallableProbe, HttpProbe, LogLineProbe, PortProbe
+
+WARMING_UP_SERVICE_PATH = os.path.join(os.path.dirname(__file__), 'warming_up_service.py')
+WARMING_UP_SERVICE_COMMAND = [sys.executable, WARMING_UP_SERVICE_PATH, '{port}']
+EXITING_SERVICE_COMMAND = [sys.executable, '-c', 'import sys; sys.exit(3)']
+
+
+def test_default_port_probe():
+    service = HttpService(WARMING_UP_SERVICE_COMMAND)
+    assert isinstance(service.readiness, PortProbe)
+    assert service.time_to_ready is None
+
+    with service:
+        assert service.time_to_ready > 0
+
+
+@pytest.mark.parametrize('probe', [
+    HttpProbe('/health'),
+    LogLineProbe('Warmed up'),
+    CallableProbe(lambda service: requests.get(service.url).status_code == 200),
+])
+def test_service_ready_after_warm_up(probe):
+    service = HttpService(WARMING_UP_SERVICE_COMMAND, readiness=probe)
+    with service:
+        assert requests.get(service.url).status_code == 200
+        assert service.readiness is probe
+        assert service.time_to_ready >= 0.3
+
+
+def test_log_line_probe_on_stderr():
+    command = [sys.executable, '-c',
+               'import sys, time; print("ready", file=sys.stderr, flush=True); time.sleep(100)']
+    service = HttpService(command, readiness=LogLineProbe('^ready$', stream='stderr'))
+    with service:
+        assert service.time_to_ready is not None
+
+
+def test_log_line_probe_bad_stream():
+    with pytest.raises(ValueError):
+        LogLineProbe('bla', stream='stdin')
+
+
+def test_http_probe_timeout():
+    service = HttpService(WARMING_UP_SERVICE_COMMAND, readiness=HttpProbe(status_code=418))
+    with pytest.raises(TimeoutError):
+        service.start(timeout=0.5)
+
+
+@pytest.mark.parametrize('probe', [
+    HttpProbe(),
+    LogLineProbe('Warmed up'),
+    CallableProbe(lambda service: False),
+])
+def test_probe_fails_on_service_exit(probe):
+    service = HttpService(EXITING_SERVICE_COMMAND, readiness=probe)
+    with pytest.raises(ServiceExitedError):
+        service.start(timeout=10.0)
+
+
+def test_service_group_with_probes():
+    port_service = HttpService(WARMING_UP_SERVICE_COMMAND)
+    http_probe_service = HttpService(WARMING_UP_SERVICE_COMMAND, readiness=HttpProbe())
+
+    with ServiceGroup(port_service, http_probe_service):
+        assert requests.get(http_probe_service.url).status_code == 200
+        assert port_service.time_to_ready < http_probe_service.time_to_ready
+
+
+def test_service_group_stops_warming_up_services_on_failure():
+    warming_up_service = HttpService(WARMING_UP_SERVICE_COMMAND, readiness=HttpProbe())
+    exiting_service = HttpService(EXITING_SERVICE_COMMAND)
+
+    with pytest.raises(ServiceExitedError):
+        ServiceGroup(warming_up_service, exiting_service).start()
+    # pylint: disable=protected-access
+    assert warming_up_service._service_proc.poll() is not None
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(warming_up_service.url)
+
+
+def test_wait_for_port_with_many_addresses(monkeypatch):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    port = listener.getsockname()[1]
+    address = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))
+    # the host resolves to many addresses, all of them can connect at once
+    monkeypatch.setattr('socket.getaddrinfo', lambda *args, **kwargs: [address] * 3)
+    try:
+        for _ in range(20):
+            wait_for_ports([('some-host', port)], timeout=1.0)
+    finally:
+        listener.close()
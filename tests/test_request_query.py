@@ -0,0 +1,120 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from mountepy.inprocess import InProcessMountebank
+from mountepy.mountebank import Imposter
+from mountepy.request_json import _UNDECODED
+from mountepy.request_query import RequestIndex
+
+
+def _request_json(method, path, headers=None):
+    return {'method': method, 'path': path, 'query': {}, 'headers': headers or {},
+            'body': '', 'requestFrom': '127.0.0.1:1234',
+            'timestamp': '2016-01-02T10:20:30.456Z'}
+
+
+def _imposter_content(requests_json):
+    return json.dumps({'port': 666, 'protocol': 'http', 'requests': requests_json}).encode()
+
+
+REQUESTS_JSON = [
+    _request_json('POST', '/orders', {'X-Id': '1', 'Accept': 'text/plain'}),
+    _request_json('GET', '/orders'),
+    _request_json('POST', '/orders/5', {'x-id': ['2', '3']}),
+    _request_json('post', '/users', {'X-Id': '2'}),
+    _request_json('GET', '/ordersomething'),
+]
+
+
+@pytest.fixture
+def imposter():
+    client = MagicMock()
+    client.get.return_value.content = _imposter_content(REQUESTS_JSON)
+    return Imposter(666, 666, client=client)
+
+
+def _paths(found_requests):
+    return [request.path for request in found_requests]
+
+
+def test_query_criteria(imposter):
+    query = imposter.query()
+    assert len(query.all()) == 5
+    assert _paths(query.method('post').all()) == ['/orders', '/orders/5', '/users']
+    assert _paths(query.path('/orders').all()) == ['/orders', '/orders']
+    assert _paths(query.path_prefix('/orders').all()) == \
+        ['/orders', '/orders', '/orders/5', '/ordersomething']
+    assert _paths(query.path_prefix('/orders/').all()) == ['/orders/5']
+    assert _paths(query.header('x-id').all()) == ['/orders', '/orders/5', '/users']
+    assert _paths(query.header('X-ID', '2').all()) == ['/orders/5', '/users']
+    assert _paths(query.method('POST').path_prefix('/orders').header('X-Id', '1').all()) == \
+        ['/orders']
+    assert _paths(query.method('GET').where(lambda request: request.path.endswith('g')).all()) \
+        == ['/ordersomething']
+    assert query.method('PUT').all() == []
+
+
+def test_query_count_exists_first(imposter):
+    query = imposter.query().method('POST')
+    assert query.count() == 3
+    assert query.exists()
+    assert query.first().path == '/orders'
+    assert not query.path('/nothing').exists()
+    assert query.path('/nothing').first() is None
+
+
+def test_query_as_predicate(imposter):
+    query = imposter.query().method('POST').path_prefix('/orders').header('X-Id', '3')
+    assert [query(request) for request in imposter.requests()] == \
+        [False, False, True, False, False]
+    assert imposter.wait_for_requests(predicate=query) == query.all()
+
+
+def test_request_index_updated_incrementally(imposter):
+    index = imposter.request_index()
+    first_log = imposter._parsed_requests
+    imposter._client.get.return_value.content = _imposter_content(
+        REQUESTS_JSON + [_request_json('DELETE', '/orders')])
+    assert _paths(imposter.query().path('/orders').all()) == ['/orders', '/orders', '/orders']
+    assert imposter._parsed_requests is first_log
+
+    # log cleared on Mountebank
+    imposter._client.get.return_value.content = _imposter_content([_request_json('GET', '/a')])
+    assert imposter.request_index() is index
+    assert _paths(imposter.query().all()) == ['/a']
+    assert imposter.query().path('/orders').all() == []
+
+
+def test_request_index_doesnt_decode_requests(imposter):
+    assert _paths(imposter.query().method('POST').header('x-id', '2').all()) == \
+        ['/orders/5', '/users']
+    # only the paths of the matching requests got decoded
+    assert [request._path is _UNDECODED for request in imposter.requests()] == \
+        [True, True, False, False, True]
+    assert all(request._headers is _UNDECODED for request in imposter.requests())
+
+
+def test_request_index_unknown_values():
+    index = RequestIndex()
+    index.update([])
+    assert index.find(method='GET', path_prefix='/', headers={'a': None}) == []
+
+
+def test_query_wait_in_process():
+    with InProcessMountebank() as mb:
+        imposter = mb.add_imposter_simple(method='POST', path='/orders')
+        stub_url = 'http://localhost:{}'.format(imposter.port)
+        query = imposter.query().method('POST').header('X-Id', '2')
+
+        def make_requests():
+            for request_id in range(3):
+                requests.post(stub_url + '/orders', headers={'X-Id': str(request_id)})
+
+        threading.Thread(target=make_requests).start()
+        assert len(query.wait(timeout=2)) == 1
+        with pytest.raises(TimeoutError):
+            query.wait(count=2, timeout=0.1)
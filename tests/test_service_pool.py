@@ -0,0 +1,135 @@
+import os.path
+import sys
+
+import pytest
+import requests
+
+from mountepy import ServicePool
+
+EXAMPLE_SERVICE_PATH = os.path.join(os.path.dirname(__file__), 'example_service.py')
+SERVICE_COMMAND = [sys.executable, EXAMPLE_SERVICE_PATH, '{port}']
+
+
+def test_pool_reuses_service():
+    reset_services = []
+    with ServicePool(reset=reset_services.append) as pool:
+        with pool.service(SERVICE_COMMAND) as service:
+            assert requests.get(service.url).status_code == 200
+        with pool.service(SERVICE_COMMAND) as reused_service:
+            assert reused_service is service
+            # different environment means a different service
+            with pool.service(SERVICE_COMMAND, env={'BLA': 'bla'}) as other_service:
+                assert other_service is not service
+
+        assert reset_services == [service, other_service, service]
+        assert pool.stats() == (2, 1, 0)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(service.url)
+
+
+def test_pool_prestart():
+    with ServicePool() as pool:
+        pool.prestart(SERVICE_COMMAND, count=2)
+        first_service = pool.acquire(SERVICE_COMMAND)
+        second_service = pool.acquire(SERVICE_COMMAND)
+        assert first_service is not second_service
+        assert pool.stats().started == 2
+        for service in (first_service, second_service):
+            assert requests.get(service.url).status_code == 200
+            pool.release(service)
+
+
+def test_pool_starts_new_service_if_prestart_failed():
+    with ServicePool() as pool:
+        def fail_start(*args):
+            raise TimeoutError('The service took too long to start.')
+
+        pool._start_service = fail_start
+        pool.prestart(SERVICE_COMMAND)
+        del pool._start_service
+        with pool.service(SERVICE_COMMAND) as service:
+            assert requests.get(service.url).status_code == 200
+        assert pool.stats().started == 1
+
+
+def test_pool_checks_health_of_prestarted_service():
+    with ServicePool() as pool:
+        pool.prestart(SERVICE_COMMAND)
+        prestarted_service = next(iter(pool._starting_services.values()))[0].result()
+        prestarted_service._service_proc.kill()
+        prestarted_service._service_proc.wait()
+        with pool.service(SERVICE_COMMAND) as service:
+            assert service is not prestarted_service
+        assert pool.stats() == (2, 0, 1)
+
+
+def test_pool_release_after_close():
+    pool = ServicePool()
+    service = pool.acquire(SERVICE_COMMAND)
+    pool.close()
+    pool.release(service)
+    assert pool.stats().retired == 1
+
+
+def test_pool_retires_after_max_reuses():
+    with ServicePool(max_reuses=2) as pool:
+        services = []
+        for _ in range(3):
+            with pool.service(SERVICE_COMMAND) as service:
+                services.append(service)
+        assert services[0] is services[1]
+        assert services[2] is not services[0]
+        assert pool.stats() == (2, 1, 1)
+
+
+def test_pool_retires_unhealthy_service():
+    health_checks = []
+
+    def health_check(service):
+        health_checks.append(service)
+        return len(health_checks) > 1
+
+    with ServicePool(health_check=health_check) as pool:
+        with pool.service(SERVICE_COMMAND) as service:
+            pass
+        with pool.service(SERVICE_COMMAND) as new_service:
+            assert new_service is not service
+        with pool.service(SERVICE_COMMAND) as reused_service:
+            assert reused_service is new_service
+        assert health_checks == [service, new_service]
+
+
+def test_pool_retires_service_with_dead_process():
+    with ServicePool() as pool:
+        with pool.service(SERVICE_COMMAND) as service:
+            pass
+        service._service_proc.kill()
+        service._service_proc.wait()
+        with pool.service(SERVICE_COMMAND) as new_service:
+            assert new_service is not service
+
+
+def test_pool_reset_path():
+    with ServicePool(reset_path='/reset') as pool:
+        with pool.service(SERVICE_COMMAND) as service:
+            pass
+        with pool.service(SERVICE_COMMAND) as reused_service:
+            assert reused_service is service
+
+
+def test_pool_failed_reset_retires_service():
+    def failing_reset(service):
+        raise requests.HTTPError('Reset failed')
+
+    with ServicePool(reset=failing_reset) as pool:
+        with pool.service(SERVICE_COMMAND) as service:
+            pass
+        with pool.service(SERVICE_COMMAND) as new_service:
+            assert new_service is not service
+        assert pool.stats().retired == 2
+
+
+def test_pool_reset_options_exclusive():
+    with pytest.raises(ValueError):
+        ServicePool(reset=lambda service: None, reset_path='/reset')
@@ -0,0 +1,115 @@
+import pytest
+import requests
+
+from mountepy import HttpStub
+from mountepy.mountebank import http_imposter_config
+from mountepy.sharded import ShardedMountebank
+
+
+@pytest.fixture(scope='module')
+def sharded_mb():
+    with ShardedMountebank(shard_count=2) as mb:
+        yield mb
+
+
+@pytest.fixture
+def mb(sharded_mb):
+    yield sharded_mb
+    sharded_mb.reset()
+
+
+def _shard_of(mb, imposter):
+    return [shard.port for shard in mb.shards].index(int(imposter.url.split(':')[2].split('/')[0]))
+
+
+def test_sharded_imposters_placed_by_port(mb):
+    first_imposter = mb.add_imposter_simple(port=30100, response='first')
+    second_imposter = mb.add_imposter_simple(port=30101, response='second')
+    assert (_shard_of(mb, first_imposter), _shard_of(mb, second_imposter)) == (0, 1)
+    assert requests.get('http://localhost:30100').text == 'first'
+    assert requests.get('http://localhost:30101').text == 'second'
+
+    assert len(mb.shards[0]._get_imposter_ports()) == 1
+    assert mb._get_imposter_ports() == {30100, 30101}
+    first_imposter.add_stub(HttpStub('GET', '/a', 200, 'a'))
+    assert requests.get('http://localhost:30100/a').text == 'a'
+
+
+def test_sharded_placed_by_load():
+    mb = ShardedMountebank(shard_count=3, placement='load')
+    assert [mb._place(port) for port in (10, 13, 16, 19)] == [0, 1, 2, 0]
+    with pytest.raises(ValueError):
+        ShardedMountebank(placement='random')
+
+
+def test_sharded_start_failure_stops_started_shards():
+    mb = ShardedMountebank(shard_count=2)
+
+    def fail_start():
+        raise TimeoutError('Mountebank took too long to start.')
+
+    mb.shards[1].start = fail_start
+    with pytest.raises(TimeoutError):
+        mb.start()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get('http://localhost:{}/imposters'.format(mb.shards[0].port))
+
+    # can be started again after being stopped
+    del mb.shards[1].start
+    mb.start()
+    mb.stop()
+    assert mb._executor is None
+    mb.start()
+    try:
+        assert requests.get('http://localhost:{}/imposters'.format(mb.port)).status_code == 200
+    finally:
+        mb.stop()
+
+
+def test_sharded_add_imposters_and_requests(mb):
+    imposter_cfgs = [http_imposter_config(port, [HttpStub('GET', '/', 200, str(port))])
+                     for port in (30110, 30111, 30112)]
+    imposters = mb.add_imposters(imposter_cfgs)
+    assert [imposter.port for imposter in imposters] == [30110, 30111, 30112]
+    for imposter in imposters:
+        assert requests.get('http://localhost:{}'.format(imposter.port)).text == \
+            str(imposter.port)
+    assert {port: [request.path for request in port_requests]
+            for port, port_requests in mb.get_requests().items()} == \
+        {30110: ['/'], 30111: ['/'], 30112: ['/']}
+
+    imposters = mb.replace_all_imposters(imposter_cfgs[1:], keep_unchanged=True)
+    assert mb._get_imposter_ports() == {30111, 30112}
+    # unchanged imposters kept their requests
+    assert len(imposters[0].requests()) == 1
+
+
+def test_sharded_checkpoint_restore(mb):
+    baseline_imposter = mb.add_imposter_simple(port=30120)
+    mb.checkpoint()
+    mb.add_imposter_simple(port=30121)
+    requests.get('http://localhost:30120')
+    mb.restore()
+    assert mb._get_imposter_ports() == {30120}
+    assert baseline_imposter.requests() == []
+    assert mb.get_imposter(30120).url == baseline_imposter.url
+
+
+def test_sharded_snapshot(mb, tmpdir):
+    mb.add_imposter_simple(port=30130)
+    mb.add_imposter_simple(port=30131)
+    snapshot_path = mb.save_snapshot(str(tmpdir.join('snapshot.json')))
+    with open(snapshot_path) as snapshot_file:
+        assert '30131' in snapshot_file.read()
+
+
+def test_sharded_stop_twice():
+    mb = ShardedMountebank(shard_count=2)
+    mb.start()
+    mb.stop()
+    mb.stop()
+
+    with pytest.raises(RuntimeError):
+        mb.reset()
+    with pytest.raises(RuntimeError):
+        mb.get_requests()
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+import requests
+
+from mountepy import HttpStub, Mountebank
+from mountepy.mountebank import http_imposter_config
+from mountepy.snapshots import load_snapshot, save_snapshot
+
+
+def test_save_snapshot_content_hashed(tmpdir):
+    snapshot_dir = str(tmpdir)
+    imposter_cfgs = [http_imposter_config(8081, [HttpStub('GET', '/', 200, 'bla')])]
+    path = save_snapshot(imposter_cfgs, snapshot_dir=snapshot_dir)
+    assert os.path.dirname(path) == snapshot_dir
+    assert load_snapshot(path) == imposter_cfgs
+    modification_time = os.path.getmtime(path)
+
+    # the same configuration gives the same file, which isn't written again
+    assert save_snapshot(imposter_cfgs, snapshot_dir=snapshot_dir) == path
+    assert os.path.getmtime(path) == modification_time
+    other_cfgs = [http_imposter_config(8082, [HttpStub('GET', '/', 200, 'bla')])]
+    assert save_snapshot(other_cfgs, snapshot_dir=snapshot_dir) != path
+
+
+def test_save_snapshot_to_path(tmpdir):
+    path = str(tmpdir.join('some', 'snapshot.json'))
+    assert save_snapshot([], path=path) == path
+    assert load_snapshot(path) == []
+    save_snapshot([{'port': 8081, 'protocol': 'http'}], path=path)
+    assert load_snapshot(path) == [{'port': 8081, 'protocol': 'http'}]
+
+
+def test_mountebank_started_from_snapshot(tmpdir):
+    path = str(tmpdir.join('snapshot.json'))
+    with Mountebank() as mb:
+        imposter = mb.add_imposter_simple(path='/something', response='bla')
+        assert mb.save_snapshot(path) == path
+
+    with Mountebank(config_file=path) as mb:
+        stub_url = 'http://localhost:{}/something'.format(imposter.port)
+        assert requests.get(stub_url).text == 'bla'
+        restored_imposter = mb.get_imposter(imposter.port)
+        assert [request.path for request in restored_imposter.requests()] == ['/something']
+        assert set(mb._imposter_configs) == {imposter.port}
+
+
+def test_mountebank_snapshot_with_pushed_requests(tmpdir):
+    with pytest.raises(ValueError):
+        Mountebank(push_requests=True, config_file=str(tmpdir.join('snapshot.json')))
+    with Mountebank(push_requests=True) as mb:
+        with pytest.raises(ValueError):
+            mb.save_snapshot(str(tmpdir.join('snapshot.json')))
@@ -0,0 +1,40 @@
+"""
+A service that accepts connections right away, but is ready to work only after warming up.
+"""
+
+import signal
+import sys
+import threading
+import time
+from wsgiref.simple_server import make_server
+
+WARM_UP_TIME = 0.3
+_warmed_up = threading.Event()
+
+
+def example_app(environ, start_response):
+    if _warmed_up.is_set():
+        start_response('200 OK', [('Content-type', 'text/plain')])
+        return [b'Just some text.']
+    start_response('503 Service Unavailable', [('Content-type', 'text/plain')])
+    return [b'Warming up.']
+
+
+def warm_up():
+    time.sleep(WARM_UP_TIME)
+    _warmed_up.set()
+    print('Warmed up, ready for work.', flush=True)
+
+
+if __name__ == '__main__':
+    app_port = int(sys.argv[1])
+    httpd = make_server('', app_port, example_app)
+    threading.Thread(target=warm_up, daemon=True).start()
+    # serving in another thread, so that a stopping signal can't get lost in a request's handling
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    stop_requested = threading.Event()
+    for stopping_signal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(stopping_signal, lambda signum, frame: stop_requested.set())
+    stop_requested.wait()
+    # requests still being handled are abandoned, their thread ends with the process
+    httpd.server_close()